@@ -2,11 +2,8 @@ import argparse
 import vm_automation
 
 
-def deleteSnapshots(vm, snapshotSubstring):
-    vm.getSnapshots()
-    for snapshot in vm.snapshotList:
-        if snapshotSubstring in snapshot[0].name:
-            vm.deleteSnapshot(snapshot[0].name)
+def reportResult(vm, result):
+    print(vm.vmName + ": " + str(result))
 
 def main():
     parser = argparse.ArgumentParser()
@@ -24,9 +21,8 @@ def main():
     vmServer = vm_automation.esxiServer.createFromFile(args.hypervisorConfig, './snapshot.log')
     if vmServer != None:
         vmServer.enumerateVms()
-        for vm in vmServer.vmList:
-            if (args.keyword == None) or (searchTerm in vm.vmName):
-                deleteSnapshots(vm, snapshotSubstring)
+        vmList = [vm for vm in vmServer.vmList if (args.keyword == None) or (searchTerm in vm.vmName)]
+        vmServer.snapshotMany('delete', vmList, lambda name: snapshotSubstring in name, callback = reportResult)
     
 if __name__ == "__main__":
     main()
@@ -5,6 +5,8 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-s", "--source", help="source VM name")
     parser.add_argument("-d", "--destination", help="destination VM name")
+    parser.add_argument("-a", "--api", action="store_true",
+                        help="clone through the API instead of SSH (source VM must be powered off)")
     parser.add_argument("hypervisorConfig", help="json hypervisor config")
     args = parser.parse_args()
     
@@ -17,7 +19,7 @@ def main():
         print("VM SERVER CREATION FAILED")
         return 0
     
-    if vmServer.clone(args.source, args.destination, True) is True:
+    if vmServer.clone(args.source, args.destination, True, useApi=args.api) is True:
         print("Sucessfully cloned " + args.source + " to " + args.destination)
     else: 
         print("Failed to clone see " + logFile)
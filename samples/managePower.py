@@ -13,15 +13,18 @@ def main():
     vmServer = vm_automation.esxiServer.createFromFile(args.hypervisorConfig, './power.log')
     if vmServer != None:
         vmServer.enumerateVms()
+        vmList = []
         for vm in vmServer.vmList:
             if (args.keyword == None) or (args.keyword in vm.vmName):
-                if args.powerOn:
-                    vm.powerOn()
-                if args.powerOff:
-                    if vm.checkTools() == 'TOOLS_READY' and vm.isPoweredOn():
-                        vm.vmObject.ShutdownGuest()
-                    else:
-                        vm.powerOff()
+                vmList.append(vm)
+        results = {}
+        if args.powerOn:
+            results = vmServer.powerOnMany(vmList)
+        if args.powerOff:
+            results = vmServer.shutdownMany(vmList)
+        for vm in vmList:
+            if vm in results:
+                print(vm.vmName + ": " + str(results[vm]))
     
 if __name__ == "__main__":
     main()
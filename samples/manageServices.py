@@ -31,17 +31,24 @@ def replacePassword(actionData, password):
                     actionData['COMMANDS'][i][j] = actionData['COMMANDS'][i][j].replace("VM_PASSWORD", password)
 
 
-def runCommands(vmObject, actionData):
+def runCommands(vmObject, actionData, timeout):
+    """
+    RUNS THE COMMANDS IN ORDER, LETTING EACH ONE FINISH (OR RUN FOR timeout SECONDS) BEFORE
+    STARTING THE NEXT, SINCE LATER COMMANDS USUALLY DEPEND ON EARLIER ONES
+    """
     for command in actionData['COMMANDS']:
         for i in range(5):
             retVal = True
             try:
-                if vmObject.runCmdOnGuest(command) == False:
+                cmdPid = vmObject.runCmdOnGuest(command)
+                if cmdPid == False:
                     retVal = False
             except vim.fault.InvalidState:
                 retVal = False
                 continue
             break
+        if retVal:
+            vmObject.waitForProcess(cmdPid, timeout)
     return retVal
 
 
@@ -89,13 +96,16 @@ def executeAction(vmObject, actionData):
         vmReady = vmObject.waitForVmToBoot()
     time.sleep(10)
     try:
+        # WAIT_SECONDS IS NOW THE MOST WE WAIT FOR THE ACTION TO FINISH, NOT A FIXED SLEEP
         if actionData['TYPE'] == "COMMANDS":
-            retVal = runCommands(vmObject, actionData)
+            retVal = runCommands(vmObject, actionData, scheduleDelay)
         if actionData['TYPE'] == "EXE":
             retVal = runExe(vmObject, actionData)
         if actionData['TYPE'] == "SCRIPT":
             retVal = runScript(vmObject, actionData)
-        time.sleep(scheduleDelay)
+        if actionData['TYPE'] in ("EXE", "SCRIPT") and retVal:
+            vmObject.waitForProcess(retVal, scheduleDelay)
+            retVal = True
         if 'SUCCESS_TYPE' in actionData and 'SUCCESS_METRIC' in actionData:
             retVal = checkSuccess(vmObject, actionData)
     except Exception as e:
@@ -107,9 +117,13 @@ def executeAction(vmObject, actionData):
     return retVal
 
 
+# ONE SERVER OBJECT PER WORKER PROCESS, SO A WORKER LOGS IN ONCE NO MATTER HOW MANY VMS IT HANDLES
+workerServers = {}
+
+
 def parallelRun(serverConfig, vmName, username, password, actionData, snapshotName):
     """
-    CREATE SERVER
+    CREATE SERVER (OR REUSE THIS WORKER'S)
     """
     logPath = './logs'
     if not os.path.exists(logPath):
@@ -122,10 +136,14 @@ def parallelRun(serverConfig, vmName, username, password, actionData, snapshotNa
         logFileObj.close()
     except:
         print("FAILED TO OPEN " + logFile)
-    vmServer = vm_automation.esxiServer.createFromFile(serverConfig, logFile)
+    vmServer = workerServers.get(serverConfig)
     if vmServer is None:
-        print("VM SERVER CREATION FAILED")
-        return 0
+        vmServer = vm_automation.esxiServer.createFromFile(serverConfig, logFile, usePool=True)
+        if vmServer is None:
+            print("VM SERVER CREATION FAILED")
+            return 0
+        workerServers[serverConfig] = vmServer
+    vmServer.logFile = logFile
     
     """
     GET VM OBJECT
@@ -229,7 +247,9 @@ def main():
     if args.threads is not None:
         num_threads = args.threads
 
-    pool = multiprocessing.Pool(int(num_threads))
+    # WORKERS SEND THEIR LOG LINES BACK HERE SO ONE WRITER OWNS THE LOG FILES
+    logQueue = vm_automation.startLogQueue()
+    pool = multiprocessing.Pool(int(num_threads), vm_automation.useLogQueue, (logQueue,))
     print("USING " + str(int(num_threads)) + " THREADS")
     try:
         signal.signal(signal.SIGINT, original_sigint_handler)
@@ -276,6 +296,7 @@ def main():
     else:
         pool.close()
         pool.join()
+    vm_automation.stopLogQueue()
 
     actualResults = []
     for i in results:
@@ -1,24 +1,22 @@
 import argparse
 import vm_automation
 
-def takeSnapshot(vm, snapshotName, args):
-    wasPoweredOn = vm.isPoweredOn()
+def takeSnapshots(vmServer, vmList, snapshotName, args):
+    wasPoweredOn = [vm for vm in vmList if vm.isPoweredOn()]
     if args.powerOn:
-        vm.powerOn()
+        vmServer.powerOnMany(vmList)
     if args.powerOff:
-        vm.powerOff
-    retVal = vm.takeSnapshot(args.snapshotName)
-    if wasPoweredOn:
-        vm.powerOn()
-    else:
-        vm.powerOff()
-    return retVal
+        vmServer.powerOffMany(vmList)
+    retDict = vmServer.snapshotMany('create', vmList, snapshotName,
+                                    maxPerHost = args.maxPerHost,
+                                    maxPerDatastore = args.maxPerDatastore,
+                                    callback = reportResult)
+    vmServer.powerOnMany(wasPoweredOn)
+    vmServer.powerOffMany([vm for vm in vmList if vm not in wasPoweredOn])
+    return retDict
 
-def deleteSnapshots(vm, snapshotName):
-    vm.getSnapshots()
-    for snapshot in vm.snapshotList:
-        if snapshot[0].name == snapshotName:
-            vm.deleteSnapshot(snapshotName)
+def reportResult(vm, result):
+    print(vm.vmName + ": " + str(result))
 
 def main():
     parser = argparse.ArgumentParser()
@@ -27,30 +25,40 @@ def main():
     parser.add_argument("-a", "--action", help="action [create|revert|delete]")
     parser.add_argument("-p1", "--powerOn", help="power on vm before snapshot", action="store_true")
     parser.add_argument("-p0", "--powerOff", help="power off vm before snapshot", action="store_true")
+    parser.add_argument("-mh", "--maxPerHost", help="most snapshot tasks at once on one host", type=int, default=4)
+    parser.add_argument("-md", "--maxPerDatastore", help="most snapshot tasks at once on one datastore", type=int, default=2)
     parser.add_argument("hypervisorConfig", help="json hypervisor config")
     
     validActions = ['create', 'revert', 'delete']
 
     args = parser.parse_args()
-    if args.action.lower() not in validActions:
+    if args.action == None or args.action.lower() not in validActions:
         print('INVALID ACTION')
+        return
     if args.keyword != None:
         searchTerm = args.keyword
     if args.snapshotName != None:
         snapshotName = args.snapshotName
+    else:
+        print('NO SNAPSHOT NAME')
+        return
 
-    hypervisorDic = {}
     vmServer = vm_automation.esxiServer.createFromFile(args.hypervisorConfig, './snapshot.log')
     if vmServer != None:
         vmServer.enumerateVms()
-        for vm in vmServer.vmList:
-            if (args.keyword == None) or (searchTerm in vm.vmName):
-                if args.action.lower() == 'create':
-                    takeSnapshot(vm, args.snapshotName, args)
-                if args.action.lower() == 'delete':
-                    deleteSnapshots(vm, snapshotName)
-                if args.action.lower() == 'revert':
-                    vm.revertToSnapshotByName(snapshotName)
+        vmList = [vm for vm in vmServer.vmList if (args.keyword == None) or (searchTerm in vm.vmName)]
+        if args.action.lower() == 'create':
+            takeSnapshots(vmServer, vmList, snapshotName, args)
+        if args.action.lower() == 'delete':
+            vmServer.snapshotMany('delete', vmList, lambda name: name == snapshotName,
+                                  maxPerHost = args.maxPerHost,
+                                  maxPerDatastore = args.maxPerDatastore,
+                                  callback = reportResult)
+        if args.action.lower() == 'revert':
+            vmServer.snapshotMany('revert', vmList, snapshotName,
+                                  maxPerHost = args.maxPerHost,
+                                  maxPerDatastore = args.maxPerDatastore,
+                                  callback = reportResult)
     
 if __name__ == "__main__":
     main()
@@ -1,8 +1,8 @@
 import json
+import vm_automation
 
 def checkForProcess(vmObject, processName):
-    vmObject.updateProcList()
-    if processName in ' '.join(vmObject.procList):
+    if len(vmObject.findProcesses(processName, substring=True)) > 0:
         return True
     else:
         return False
@@ -44,14 +44,14 @@ def makeVmList(vmServer, keywordArg, fileArg):
     return vmList
 
 def waitForProcess(vmObject, procName, timeout = 600):
-    retVal = False
-    waitCount = 1
-    if timeout > 0:
-        waitCount = timeout/5
-    for i in range(waitCount):
-        vmObject.updateProcList()
-        if procName in ' '.join(vmObject.procList):
-            retVal = True
-            break
-        time.sleep(5)
-    return retVal
+    return waitForProcessOnVms([vmObject], procName, timeout)[vmObject]
+
+def waitForProcessOnVms(vmList, procName, timeout = 600):
+    """
+    WAITS FOR procName TO SHOW UP ON EVERY VM IN vmList AT ONCE; RETURNS {vm: True/False}
+    """
+    if len(vmList) == 0:
+        return {}
+    conditionDict = dict((vm_automation.processCondition(vm, procName, 'appeared', substring=True), vm) for vm in vmList)
+    resultDict = vmList[0].server.waitForProcessConditions(list(conditionDict.keys()), timeout)
+    return dict((conditionDict[i], j) for i, j in resultDict.items())
@@ -20,7 +20,9 @@ setup(name='vm_automation',
             'Topic :: Software Development :: Libraries :: Python Modules',
             'Topic :: System :: Distributed Computing',
             'Programming Language :: Python :: 2.7',
+            'Programming Language :: Python :: 3',
             'Programming Language :: Python :: 3.5',
+            'Programming Language :: Python :: 3.6',
       ],
       platforms=['Windows', 'Linux', 'Solaris', 'Mac OS-X', 'Unix'],
       keywords='vsphere vmware esx',
@@ -0,0 +1,276 @@
+import threading
+import time
+import unittest
+
+from vm_automation import esxiTasks
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class fakeServer:
+    def __init__(self):
+        self.hostname = 'fakehost'
+        self.logList = []
+
+    def logMsg(self, strMsg):
+        self.logList.append(strMsg)
+
+
+class fakeTask:
+    def __init__(self, moId, cancelError = None):
+        self._moId = moId
+        self.cancelError = cancelError
+        self.cancelCount = 0
+
+    def CancelTask(self):
+        self.cancelCount += 1
+        if self.cancelError != None:
+            raise self.cancelError
+
+
+class fakeFault:
+    def __init__(self, msg):
+        self.msg = msg
+
+
+class fakeWatcher:
+    """
+    STANDS IN FOR propertyWatcher: push() QUEUES A PROPERTY UPDATE FOR ONE TASK AND THE NEXT
+    waitForUpdates HANDS IT TO THE TRACKER.  WAITS ARE CUT SHORT SO TIMEOUTS ARE NOTICED QUICKLY.
+    """
+    instances = []
+
+    def __init__(self, serverObject, objType, pathSet, objList = None, lock = None):
+        self.store = {}
+        self.addedList = []
+        self.removedList = []
+        self.unresolved = set()
+        self.updateQueue = queue.Queue()
+        self.destroyed = False
+        fakeWatcher.instances.append(self)
+
+    def addObjects(self, objList):
+        self.addedList.extend(objList)
+        return [i for i in objList if i._moId in self.unresolved]
+
+    def removeObjects(self, objList):
+        self.removedList.extend(objList)
+
+    def destroy(self):
+        self.destroyed = True
+
+    def push(self, moId, taskProperties):
+        self.updateQueue.put((moId, taskProperties))
+
+    def waitForUpdates(self, maxWaitSeconds = 30):
+        try:
+            moId, taskProperties = self.updateQueue.get(True, min(maxWaitSeconds, 0.05))
+        except queue.Empty:
+            return []
+        self.store.setdefault(moId, {}).update(taskProperties)
+        return [(moId, 'modify', list(taskProperties.keys()))]
+
+
+class taskTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.realWatcher = esxiTasks.propertyWatcher
+        esxiTasks.propertyWatcher = fakeWatcher
+        fakeWatcher.instances = []
+        self.server = fakeServer()
+        self.tracker = esxiTasks.taskTracker(self.server)
+
+    def tearDown(self):
+        esxiTasks.propertyWatcher = self.realWatcher
+
+    def getWatcher(self):
+        return fakeWatcher.instances[-1]
+
+    def testSuccess(self):
+        task = fakeTask('task-1')
+        handle = self.tracker.track(task)
+        self.assertIs(self.tracker.track(task), handle)
+        self.getWatcher().push('task-1', {'info.state': 'running', 'info.progress': 50})
+        self.getWatcher().push('task-1', {'info.state': 'success', 'info.result': 'vm-42'})
+        self.assertTrue(handle.wait(5))
+        self.assertTrue(handle.succeeded())
+        self.assertEqual(handle.result(), 'vm-42')
+        self.assertEqual(handle.progress, 50)
+        self.assertEqual(self.tracker.pendingCount(), 0)
+        self.assertIn(task, self.getWatcher().removedList)
+
+    def testError(self):
+        handle = self.tracker.track(fakeTask('task-1'))
+        self.getWatcher().push('task-1', {'info.state': 'error', 'info.error': fakeFault('DISK FULL')})
+        self.assertTrue(handle.wait(5))
+        self.assertEqual(handle.state, 'error')
+        self.assertEqual(handle.errorMsg(), 'DISK FULL')
+
+    def testTimeout(self):
+        task = fakeTask('task-1')
+        handle = self.tracker.track(task, timeout = 0.1)
+        self.assertTrue(handle.wait(5))
+        self.assertEqual(handle.state, 'timeout')
+        self.assertEqual(task.cancelCount, 0)
+        self.assertEqual(self.tracker.pendingCount(), 0)
+
+    def testTimeoutCancels(self):
+        task = fakeTask('task-1')
+        handle = self.tracker.track(task, timeout = 0.1, cancelOnTimeout = True)
+        self.assertTrue(handle.wait(5))
+        self.assertEqual(handle.state, 'timeout')
+        self.assertEqual(task.cancelCount, 1)
+
+    def testCancel(self):
+        task = fakeTask('task-1')
+        handle = self.tracker.track(task)
+        self.assertTrue(handle.cancel())
+        self.assertEqual(task.cancelCount, 1)
+        self.assertFalse(handle.done())
+        # THE SERVER REPORTS A CANCELLED TASK AS AN ERROR
+        self.getWatcher().push('task-1', {'info.state': 'error', 'info.error': fakeFault('CANCELLED')})
+        self.assertTrue(handle.wait(5))
+        self.assertEqual(handle.state, 'cancelled')
+        self.assertFalse(handle.cancel())
+        self.assertEqual(task.cancelCount, 1)
+
+    def testCancelRefused(self):
+        task = fakeTask('task-1', cancelError = RuntimeError('NOT CANCELLABLE'))
+        handle = self.tracker.track(task)
+        self.assertFalse(handle.cancel())
+        self.assertFalse(handle.cancelRequested)
+        self.assertTrue(any(i.startswith('[WARNING]: UNABLE TO CANCEL') for i in self.server.logList))
+        self.getWatcher().push('task-1', {'info.state': 'error', 'info.error': fakeFault('FAILED')})
+        self.assertTrue(handle.wait(5))
+        self.assertEqual(handle.state, 'error')
+
+    def testTaskAlreadyGone(self):
+        watcherTask = fakeTask('task-0')
+        self.tracker.track(watcherTask)
+        self.getWatcher().unresolved.add('task-1')
+        handle = self.tracker.track(fakeTask('task-1'))
+        self.assertTrue(handle.done())
+        self.assertEqual(handle.state, 'error')
+        self.assertIn('NO LONGER EXISTS', handle.errorMsg())
+
+    def testCallbacks(self):
+        handle = self.tracker.track(fakeTask('task-1'))
+        calledList = []
+
+        def badCallback(finishedHandle):
+            raise ValueError('BROKEN CALLBACK')
+        handle.addDoneCallback(lambda finishedHandle: calledList.append(('first', finishedHandle)))
+        handle.addDoneCallback(badCallback)
+        handle.addDoneCallback(lambda finishedHandle: calledList.append(('second', finishedHandle)))
+        self.getWatcher().push('task-1', {'info.state': 'success'})
+        self.assertTrue(handle.wait(5))
+        # CALLBACKS RUN ON THE TRACKER THREAD JUST AFTER THE HANDLE IS MARKED DONE
+        deadline = time.time() + 5
+        while len(calledList) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(calledList, [('first', handle), ('second', handle)])
+        self.assertTrue(any(i.startswith('[WARNING]: TASK CALLBACK FAILED') for i in self.server.logList))
+        # A CALLBACK ADDED AFTER THE FACT RUNS RIGHT AWAY, ON THIS THREAD
+        lateList = []
+        handle.addDoneCallback(lambda finishedHandle: lateList.append(threading.current_thread()))
+        self.assertEqual(lateList, [threading.current_thread()])
+
+    def testIterCompleted(self):
+        handleList = [self.tracker.track(fakeTask('task-' + str(i))) for i in range(3)]
+        self.getWatcher().push('task-2', {'info.state': 'success'})
+        self.getWatcher().push('task-0', {'info.state': 'success'})
+        self.assertEqual(list(esxiTasks.iterCompleted(handleList, 0.5)), [handleList[2], handleList[0]])
+        self.assertFalse(handleList[1].done())
+
+
+class instantTracker:
+    """
+    A TRACKER WHOSE TASKS FINISH THE MOMENT THEY ARE TRACKED, SO iterTaskJobs NEVER BLOCKS; A
+    JOB COUNTS AS RUNNING FROM submitFn UNTIL THE TEST HAS BEEN HANDED ITS RESULT
+    """
+    def __init__(self):
+        self.server = fakeServer()
+        self.lock = threading.Condition()
+
+    def track(self, task, timeout = None):
+        handle = esxiTasks.taskHandle(self, task, timeout)
+        handle.finish('success')
+        return handle
+
+
+class iterTaskJobsTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = instantTracker()
+        self.runningList = []
+        self.startList = []
+        self.overLimit = []
+
+    def runJobs(self, jobList, maxConcurrent, limitFn = None, submitFn = None, limitDict = None):
+        def startJob(job):
+            self.runningList.append(job)
+            self.startList.append(job)
+            if len(self.runningList) > maxConcurrent:
+                self.overLimit.append(job)
+            for key, limit in limitDict or {}:
+                if len([i for i in self.runningList if key in i]) > max(1, limit):
+                    self.overLimit.append(job)
+            if submitFn != None:
+                return submitFn(job)
+            return fakeTask(job)
+        doneList = []
+        for job, handle in esxiTasks.iterTaskJobs(self.tracker, jobList, startJob, maxConcurrent, None, limitFn):
+            if job in self.runningList:
+                self.runningList.remove(job)
+            doneList.append((job, handle))
+        return doneList
+
+    def testKeyLimits(self):
+        # EACH JOB IS A (HOST, DATASTORE, NAME) TUPLE; ONE PER HOST AND TWO PER DATASTORE
+        jobList = [('hostA', 'ds1', 'vm1'),
+                   ('hostA', 'ds1', 'vm2'),
+                   ('hostB', 'ds1', 'vm3'),
+                   ('hostC', 'ds1', 'vm4'),
+                   ('hostB', 'ds2', 'vm5')]
+        limitFn = lambda job: [(job[0], 1), (job[1], 2)]
+        limitDict = [('hostA', 1), ('hostB', 1), ('hostC', 1), ('ds1', 2), ('ds2', 2)]
+        doneList = self.runJobs(jobList, 8, limitFn, limitDict = limitDict)
+        self.assertEqual(self.overLimit, [])
+        self.assertEqual(sorted(i[0] for i in doneList), sorted(jobList))
+        self.assertTrue(all(i[1].succeeded() for i in doneList))
+        # THE FIRST JOB THAT FITS STARTS FIRST: vm2 WAITS FOR hostA, vm4 FOR ds1, vm5 FOR hostB
+        self.assertEqual(self.startList[:2], [jobList[0], jobList[2]])
+        self.assertEqual(set(self.startList[2:]), set([jobList[1], jobList[3], jobList[4]]))
+
+    def testZeroLimitStillRuns(self):
+        jobList = [('hostA', 'vm1'), ('hostA', 'vm2')]
+        doneList = self.runJobs(jobList, 8, lambda job: [(job[0], 0)], limitDict = [('hostA', 0)])
+        self.assertEqual(self.overLimit, [])
+        self.assertEqual([i[0] for i in doneList], jobList)
+
+    def testMaxConcurrent(self):
+        jobList = [('vm' + str(i),) for i in range(10)]
+        doneList = self.runJobs(jobList, 3)
+        self.assertEqual(self.overLimit, [])
+        self.assertEqual([i[0] for i in doneList], jobList)
+
+    def testSubmitFailures(self):
+        jobList = [('hostA', 'vm1'), ('hostA', 'vm2'), ('hostA', 'vm3')]
+
+        def submitFn(job):
+            if job[1] == 'vm1':
+                return None
+            if job[1] == 'vm2':
+                raise RuntimeError('NO PERMISSION')
+            return fakeTask(job)
+        doneList = self.runJobs(jobList, 8, lambda job: [(job[0], 1)], submitFn)
+        # A JOB THAT NEVER STARTED DOES NOT HOLD ITS KEY, SO vm3 STILL RUNS
+        self.assertEqual(dict(doneList)[jobList[0]], None)
+        self.assertEqual(dict(doneList)[jobList[1]], None)
+        self.assertTrue(dict(doneList)[jobList[2]].succeeded())
+        self.assertTrue(any('NO PERMISSION' in i for i in self.tracker.server.logList))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+
+from collections import namedtuple
+from vm_automation.guestProcess import processTable
+
+# WHAT ListProcessesInGuest HANDS BACK, MINUS pyVmomi
+fakeProcessInfo = namedtuple('fakeProcessInfo', ['pid', 'name', 'cmdLine', 'owner',
+                                                 'startTime', 'endTime', 'exitCode'])
+
+
+def running(pid, name, cmdLine = ''):
+    return fakeProcessInfo(pid, name, cmdLine, 'SYSTEM', 100, None, None)
+
+
+def ended(pid, name, exitCode = 0, cmdLine = ''):
+    return fakeProcessInfo(pid, name, cmdLine, 'SYSTEM', 100, 200, exitCode)
+
+
+class processTableTest(unittest.TestCase):
+    def setUp(self):
+        self.table = processTable()
+        self.table.update([running(4, 'System'),
+                           running(100, 'explorer.exe', 'C:\\Windows\\explorer.exe'),
+                           running(200, 'cmd.exe', 'cmd.exe /c payload.exe -v'),
+                           running(300, 'payload.exe', 'payload.exe -v')])
+
+    def pids(self, recordList):
+        return sorted(i.pid for i in recordList)
+
+    def testFirstUpdateStartsEverything(self):
+        self.assertEqual(self.pids(self.table.started), [4, 100, 200, 300])
+        self.assertEqual(self.table.exited, [])
+        self.assertEqual(sorted(self.table.byPid), [4, 100, 200, 300])
+
+    def testStartedAndExited(self):
+        started, exited = self.table.update([running(4, 'System'),
+                                             running(100, 'explorer.exe', 'C:\\Windows\\explorer.exe'),
+                                             ended(300, 'payload.exe', 3),
+                                             running(400, 'notepad.exe')])
+        self.assertEqual(self.pids(started), [400])
+        # 200 VANISHED FROM THE LIST; 300 IS STILL LISTED BUT HAS AN endTime
+        self.assertEqual(self.pids(exited), [200, 300])
+        self.assertEqual([i.exitCode for i in exited if i.pid == 300], [3])
+        self.assertEqual(sorted(self.table.byPid), [4, 100, 400])
+        self.assertEqual(self.table.findName('payload.exe'), [])
+        self.assertEqual(self.table.findName('cmd.exe'), [])
+
+    def testNothingChanged(self):
+        started, exited = self.table.update([running(4, 'System'),
+                                             running(100, 'explorer.exe', 'C:\\Windows\\explorer.exe'),
+                                             running(200, 'cmd.exe', 'cmd.exe /c payload.exe -v'),
+                                             running(300, 'payload.exe', 'payload.exe -v')])
+        self.assertEqual(started, [])
+        self.assertEqual(exited, [])
+
+    def testPidReusedUnderNewName(self):
+        self.table.update([running(4, 'System'),
+                           running(100, 'explorer.exe'),
+                           running(200, 'cmd.exe'),
+                           running(300, 'calc.exe')])
+        self.assertEqual(self.table.findName('payload.exe'), [])
+        self.assertEqual(self.pids(self.table.findName('calc.exe')), [300])
+
+    def testPartialUpdate(self):
+        # ONLY 300 AND 500 WERE ASKED ABOUT, SO EVERYTHING ELSE MUST BE LEFT ALONE
+        started, exited = self.table.update([ended(300, 'payload.exe', 0), ended(500, 'quick.exe', 1)],
+                                            pidList = [300, 500])
+        self.assertEqual(started, [])
+        self.assertEqual(self.pids(exited), [300, 500])
+        self.assertEqual(sorted(self.table.byPid), [4, 100, 200])
+
+    def testPartialUpdateStillRunning(self):
+        started, exited = self.table.update([running(300, 'payload.exe', 'payload.exe -v'),
+                                             running(600, 'new.exe')],
+                                            pidList = [300, 600])
+        self.assertEqual(self.pids(started), [600])
+        self.assertEqual(exited, [])
+        self.assertEqual(sorted(self.table.byPid), [4, 100, 200, 300, 600])
+
+    def testPartialUpdateMissingPid(self):
+        # A PID WE ASKED ABOUT THAT THE GUEST NO LONGER LISTS HAS EXITED
+        started, exited = self.table.update([], pidList = [200, 999])
+        self.assertEqual(started, [])
+        self.assertEqual(self.pids(exited), [200])
+        self.assertNotIn(200, self.table.byPid)
+
+    def testFindNameExact(self):
+        self.assertEqual(self.pids(self.table.findName('payload.exe')), [300])
+        self.assertEqual(self.pids(self.table.findName('PAYLOAD.EXE')), [300])
+        self.assertEqual(self.table.findName('payload'), [])
+        self.assertEqual(self.table.findName('nothing.exe'), [])
+
+    def testFindNameSubstring(self):
+        # THE OLD SEARCH ALSO MATCHED THE cmd.exe WRAPPER, AND IT WAS CASE SENSITIVE
+        self.assertEqual(self.pids(self.table.findName('payload.exe', substring = True)), [200, 300])
+        self.assertEqual(self.pids(self.table.findName('payload', substring = True)), [200, 300])
+        self.assertEqual(self.pids(self.table.findName('Windows', substring = True)), [100])
+        self.assertEqual(self.table.findName('PAYLOAD', substring = True), [])
+
+    def testStringList(self):
+        self.assertEqual(self.table.stringList()[0], "4\t\tSystem\t\t\t\tSYSTEM")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import sys
+import unittest
+
+from vm_automation.snapshotIndex import snapshotIndex
+
+
+class fakeMoref:
+    def __init__(self, moId):
+        self._moId = moId
+
+
+class fakeSnapshotTree:
+    def __init__(self, name, moId, childSnapshotList = None):
+        self.name = name
+        self.snapshot = fakeMoref(moId)
+        self.childSnapshotList = childSnapshotList or []
+
+
+class fakeSnapshotInfo:
+    def __init__(self, rootSnapshotList, currentSnapshot = None):
+        self.rootSnapshotList = rootSnapshotList
+        self.currentSnapshot = currentSnapshot
+
+
+def recursiveWalk(snapshotList, snapshotLocation, resultList):
+    """
+    THE WALK esxiVm.enumerateSnapshotsRecursively USED TO DO, FOR COMPARISON
+    """
+    for snapshot in snapshotList or []:
+        if snapshotLocation:
+            snapshotPath = snapshotLocation + '/' + snapshot.name
+        else:
+            snapshotPath = snapshot.name
+        resultList.append((snapshot, snapshotPath))
+        recursiveWalk(snapshot.childSnapshotList, snapshotPath, resultList)
+    return resultList
+
+
+def makeChain(length):
+    """
+    ONE SNAPSHOT ON TOP OF ANOTHER, length DEEP; RETURNS (ROOT, TIP)
+    """
+    tipTree = fakeSnapshotTree('snap' + str(length - 1), 'snapshot-' + str(length - 1))
+    chainTree = tipTree
+    for i in range(length - 2, -1, -1):
+        chainTree = fakeSnapshotTree('snap' + str(i), 'snapshot-' + str(i), [chainTree])
+    return chainTree, tipTree
+
+
+class snapshotIndexTest(unittest.TestCase):
+    def setUp(self):
+        #   base
+        #     clean
+        #       TESTING_BASE
+        #       patched
+        #     dirty
+        #   other
+        #     TESTING_BASE (A SECOND ONE, WITH A TRAILING SPACE)
+        self.testingBase = fakeSnapshotTree('TESTING_BASE', 'snapshot-3')
+        self.patched = fakeSnapshotTree('patched', 'snapshot-4')
+        self.clean = fakeSnapshotTree('clean', 'snapshot-2', [self.testingBase, self.patched])
+        self.dirty = fakeSnapshotTree('dirty', 'snapshot-5')
+        self.base = fakeSnapshotTree('base', 'snapshot-1', [self.clean, self.dirty])
+        self.otherBase = fakeSnapshotTree('TESTING_BASE ', 'snapshot-7')
+        self.other = fakeSnapshotTree('other', 'snapshot-6', [self.otherBase])
+        self.snapshotInfo = fakeSnapshotInfo([self.base, self.other], fakeMoref('snapshot-4'))
+        self.index = snapshotIndex(self.snapshotInfo)
+
+    def testWalkOrder(self):
+        expectedList = recursiveWalk(self.snapshotInfo.rootSnapshotList, '', [])
+        self.assertEqual(self.index.snapshotList, expectedList)
+        self.assertEqual([i[1] for i in self.index.snapshotList],
+                         ['base', 'base/clean', 'base/clean/TESTING_BASE', 'base/clean/patched',
+                          'base/dirty', 'other', 'other/TESTING_BASE '])
+        self.assertEqual(len(self.index), 7)
+
+    def testByPath(self):
+        self.assertIs(self.index.byPath['base/clean/patched'], self.patched)
+        self.assertIs(self.index.byPath['other'], self.other)
+        self.assertNotIn('clean', self.index.byPath)
+        self.assertEqual(self.index.getPath(self.dirty), 'base/dirty')
+
+    def testParentOf(self):
+        self.assertIs(self.index.parentOf['snapshot-3'], self.clean)
+        self.assertIs(self.index.parentOf['snapshot-2'], self.base)
+        self.assertIs(self.index.parentOf['snapshot-1'], None)
+        self.assertIs(self.index.getParent(self.otherBase), self.other)
+        self.assertEqual(self.index.getChildren(self.clean), [self.testingBase, self.patched])
+
+    def testCurrentSnapshot(self):
+        self.assertIs(self.index.currentSnapshot, self.patched)
+        self.assertIs(snapshotIndex(fakeSnapshotInfo([self.base])).currentSnapshot, None)
+
+    def testFindByName(self):
+        self.assertIs(self.index.findByName('TESTING_BASE'), self.testingBase)
+        self.assertEqual(self.index.byName['TESTING_BASE'], [self.testingBase, self.otherBase])
+        self.assertIs(self.index.findByName(' patched '), self.patched)
+        self.assertIs(self.index.findByName('TESTING_BASE ', exact = True), self.otherBase)
+        self.assertIs(self.index.findByName('missing'), None)
+        self.assertIs(self.index.findFirst(lambda name: 'testing_base' in name.lower()), self.testingBase)
+
+    def testByMoref(self):
+        self.assertIs(self.index.byMoref['snapshot-5'], self.dirty)
+
+    def testIsFor(self):
+        self.assertTrue(self.index.isFor(self.snapshotInfo))
+        # A NEW SnapshotInfo FROM THE SERVER MEANS SOMETHING CHANGED, EVEN IF IT LOOKS THE SAME
+        self.assertFalse(self.index.isFor(fakeSnapshotInfo(self.snapshotInfo.rootSnapshotList,
+                                                           self.snapshotInfo.currentSnapshot)))
+        self.assertTrue(snapshotIndex(None).isFor(None))
+
+    def testNoSnapshots(self):
+        for snapshotInfo in [None, fakeSnapshotInfo(None), fakeSnapshotInfo([])]:
+            index = snapshotIndex(snapshotInfo)
+            self.assertEqual(len(index), 0)
+            self.assertIs(index.currentSnapshot, None)
+            self.assertIs(index.findByName('TESTING_BASE'), None)
+
+    def testDeepChain(self):
+        chainLength = sys.getrecursionlimit() + 500
+        rootTree, tipTree = makeChain(chainLength)
+        index = snapshotIndex(fakeSnapshotInfo([rootTree], tipTree.snapshot))
+        self.assertEqual(len(index), chainLength)
+        self.assertIs(index.currentSnapshot, tipTree)
+        self.assertEqual(index.snapshotList[0][1], 'snap0')
+        self.assertEqual(index.getPath(tipTree).count('/'), chainLength - 1)
+        self.assertEqual(index.getParent(tipTree).name, 'snap' + str(chainLength - 2))
+        self.assertEqual([i[0].name for i in index.snapshotList[:3]], ['snap0', 'snap1', 'snap2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
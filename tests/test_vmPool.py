@@ -0,0 +1,192 @@
+import threading
+import time
+import unittest
+
+from vm_automation.vmPool import vmPool
+
+
+class fakeVm:
+    def __init__(self, vmName):
+        self.vmName = vmName
+        self.poweredOn = False
+
+    def isPoweredOn(self):
+        return self.poweredOn
+
+    def checkTools(self):
+        if self.poweredOn:
+            return 'TOOLS_READY'
+        return 'TOOLS_NOT_READY'
+
+
+class stubServer:
+    """
+    JUST ENOUGH OF esxiServer FOR vmPool.  revertFails, bootFails AND powerOnFails ARE
+    {VM NAME: HOW MANY MORE TIMES TO FAIL} (-1 IS FOREVER); warmTime SLOWS EACH BATCH DOWN.
+    attemptTimes RECORDS WHEN EACH VM'S REVERTS STARTED AND maxInFlight THE MOST VMS EVER
+    BEING WARMED AT ONCE.
+    """
+    def __init__(self, warmTime = 0):
+        self.lock = threading.Lock()
+        self.logList = []
+        self.revertFails = {}
+        self.bootFails = {}
+        self.powerOnFails = {}
+        self.warmTime = warmTime
+        self.attemptTimes = {}
+        self.inFlight = set()
+        self.maxInFlight = 0
+
+    def logMsg(self, strMsg):
+        with self.lock:
+            self.logList.append(strMsg)
+
+    def shouldFail(self, failDict, vm):
+        with self.lock:
+            failCount = failDict.get(vm.vmName, 0)
+            if failCount == 0:
+                return False
+            if failCount > 0:
+                failDict[vm.vmName] = failCount - 1
+            return True
+
+    def snapshotMany(self, action, vmList, snapshotName):
+        with self.lock:
+            for vm in vmList:
+                self.attemptTimes.setdefault(vm.vmName, []).append(time.time())
+                vm.poweredOn = False
+            self.inFlight.update(vmList)
+            self.maxInFlight = max(self.maxInFlight, len(self.inFlight))
+        resultDict = dict((vm, not self.shouldFail(self.revertFails, vm)) for vm in vmList)
+        self.landed([vm for vm in vmList if not resultDict[vm]])
+        return resultDict
+
+    def powerOnMany(self, vmList):
+        for vm in vmList:
+            if self.shouldFail(self.powerOnFails, vm):
+                self.landed(vmList)
+                raise RuntimeError('HOST WENT AWAY')
+        for vm in vmList:
+            vm.poweredOn = True
+        return dict((vm, True) for vm in vmList)
+
+    def iterVmsReady(self, vmList, timeout, requireIp):
+        time.sleep(self.warmTime)
+        readyList = [vm for vm in vmList if not self.shouldFail(self.bootFails, vm)]
+        self.landed(vmList)
+        for vm in readyList:
+            yield vm
+
+    def landed(self, vmList):
+        # THESE ARE DONE, ONE WAY OR ANOTHER, SO THEY NO LONGER COUNT AS IN FLIGHT
+        with self.lock:
+            self.inFlight.difference_update(vmList)
+
+
+def waitUntil(predicate, timeout = 10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+class vmPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = stubServer()
+        self.poolList = []
+
+    def tearDown(self):
+        for pool in self.poolList:
+            pool.stop(5)
+
+    def makePool(self, vmCount, targetReady, **poolArgs):
+        pool = vmPool(self.server, **poolArgs)
+        self.poolList.append(pool)
+        vmList = [fakeVm('vm' + str(i)) for i in range(vmCount)]
+        self.assertTrue(pool.addTemplate('win10', vmList, 'TESTING_BASE', targetReady))
+        return pool, vmList
+
+    def testWarmsUpToTarget(self):
+        pool, vmList = self.makePool(3, 2)
+        pool.start()
+        self.assertTrue(waitUntil(lambda: pool.depth('win10') == 2))
+        time.sleep(0.1)
+        stats = pool.getStats()['win10']
+        self.assertEqual((stats['ready'], stats['cold'], stats['warming']), (2, 1, 0))
+        vm = pool.lease('win10', 5)
+        self.assertIn(vm, vmList)
+        self.assertEqual(pool.getStats()['win10']['leased'], 1)
+        self.assertTrue(pool.release(vm))
+        self.assertFalse(pool.release(vm))
+        # THE RELEASED VM IS REVERTED AGAIN, AND THE COLD ONE STAYS COLD
+        self.assertTrue(waitUntil(lambda: pool.depth('win10') == 2))
+        self.assertEqual(len(self.server.attemptTimes[vm.vmName]), 2)
+        self.assertEqual(pool.getStats()['win10']['cold'], 1)
+
+    def testRetryBackoff(self):
+        pool, vmList = self.makePool(1, 1, retryDelay = 0.2, maxWarmFailures = 5)
+        self.server.bootFails['vm0'] = 2
+        pool.start()
+        self.assertIs(pool.lease('win10', 10), vmList[0])
+        attemptTimes = self.server.attemptTimes['vm0']
+        self.assertEqual(len(attemptTimes), 3)
+        # retryDelay AFTER THE FIRST FAILURE, TWICE THAT AFTER THE SECOND, AND NOT MUCH MORE
+        self.assertTrue(0.19 <= attemptTimes[1] - attemptTimes[0] < 1.5)
+        self.assertTrue(0.39 <= attemptTimes[2] - attemptTimes[1] < 1.5)
+        stats = pool.getStats()['win10']
+        self.assertEqual((stats['failedWarms'], stats['warms'], stats['leases']), (2, 1, 1))
+        self.assertEqual(pool.notBefore, {})
+        self.assertEqual(pool.warmFailures[vmList[0]], 0)
+
+    def testBrokenCutoff(self):
+        pool, vmList = self.makePool(2, 2, retryDelay = 0.05, maxWarmFailures = 3)
+        self.server.revertFails['vm1'] = -1
+        pool.start()
+        self.assertTrue(waitUntil(lambda: pool.getStats()['win10']['broken'] == 1))
+        time.sleep(0.3)
+        self.assertEqual(len(self.server.attemptTimes['vm1']), 3)
+        stats = pool.getStats()['win10']
+        self.assertEqual((stats['ready'], stats['broken'], stats['dirty'], stats['failedWarms']), (1, 1, 0, 3))
+        self.assertNotIn(vmList[1], pool.notBefore)
+        self.assertEqual(pool.warmingCount, 0)
+        self.assertTrue(any('FAILED TO WARM 3 TIMES' in i for i in self.server.logList))
+
+    def testMaxWarming(self):
+        self.server.warmTime = 0.1
+        pool, vmList = self.makePool(6, 6, maxWarming = 2)
+        pool.start()
+        self.assertTrue(waitUntil(lambda: pool.depth('win10') == 6))
+        self.assertEqual(self.server.maxInFlight, 2)
+        self.assertEqual(pool.warmingCount, 0)
+
+    def testWarmingCountAfterErrors(self):
+        # AN EXCEPTION IN THE MIDDLE OF A BATCH STILL HANDS BACK EVERY WARMING SLOT
+        pool, vmList = self.makePool(3, 3, maxWarming = 3, retryDelay = 0.05)
+        self.server.powerOnFails['vm0'] = 1
+        pool.start()
+        self.assertTrue(waitUntil(lambda: pool.depth('win10') == 3))
+        self.assertTrue(waitUntil(lambda: pool.warmingCount == 0))
+        stats = pool.getStats()['win10']
+        self.assertEqual((stats['failedWarms'], stats['warms']), (3, 3))
+        self.assertTrue(any('HOST WENT AWAY' in i for i in self.server.logList))
+
+    def testLeaseRewarmsStaleVm(self):
+        pool, vmList = self.makePool(1, 1, retryDelay = 0.05)
+        pool.start()
+        self.assertTrue(waitUntil(lambda: pool.depth('win10') == 1))
+        vmList[0].poweredOn = False
+        self.assertIs(pool.lease('win10', 10), vmList[0])
+        self.assertEqual(len(self.server.attemptTimes['vm0']), 2)
+        self.assertTrue(any('IS NO LONGER READY' in i for i in self.server.logList))
+
+    def testLeaseTimeout(self):
+        pool, vmList = self.makePool(1, 1)
+        self.assertIs(pool.lease('win10', 0.1), None)
+        self.assertIs(pool.lease('linux', 0.1), None)
+        self.assertEqual(pool.getStats()['win10']['timeouts'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
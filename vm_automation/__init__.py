@@ -1,2 +1,10 @@
+import sys
+
 from .esxiVm import esxiServer, esxiVm
+from .guestProcess import processCondition
+from .logWriter import configureLogging, startLogQueue, stopLogQueue, useLogQueue
+from .vmPool import vmPool
 from .workstationVm import workstationServer, workstationVm
+if sys.version_info >= (3, 6):
+    # THE asyncio FACADE USES ASYNC GENERATORS, WHICH NEED PYTHON 3.6
+    from .asyncEsxi import asyncEsxiServer, asyncEsxiVm
@@ -0,0 +1,448 @@
+"""
+asyncio FACADE OVER esxiServer/esxiVm.  PYTHON 3.6 AND UP; vm_automation SKIPS IT ON OLDER PYTHONS.
+
+pyVmomi ONLY SPEAKS BLOCKING SOAP, SO EVERY SOAP CALL STILL RUNS ON A THREAD, BUT ALL THE
+asyncEsxiServer OBJECTS FOR ONE HOST SHARE ONE BOUNDED EXECUTOR.  THE WAITING IS WHERE THE
+THREADS USED TO GO, AND NONE OF THAT HAPPENS ON A THREAD HERE: vSphere TASKS ARE AWAITED
+THROUGH THE SERVER'S TASK TRACKER, BOOT/STATE WAITS ARE asyncio.sleep POLLING LOOPS, AND FILE
+TRANSFERS USE aiohttp WHEN IT IS INSTALLED.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pyVmomi import vim
+from .esxiVm import esxiServer, BOOT_PROPERTIES
+from .guestTransfer import fixTransferUrl, openTempFile, removeQuietly, replaceFile
+
+import asyncio
+import functools
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# ONE EXECUTOR PER HOST, SHARED BY EVERY asyncEsxiServer POINTED AT IT
+hostExecutors = {}
+hostExecutorsLock = threading.Lock()
+
+
+def getHostExecutor(hostname, maxWorkers = 16):
+    with hostExecutorsLock:
+        if hostname not in hostExecutors:
+            hostExecutors[hostname] = ThreadPoolExecutor(max_workers=maxWorkers)
+        return hostExecutors[hostname]
+
+
+class asyncEsxiServer:
+    """
+    WRAPS A CONNECTED esxiServer.  USE create() TO BUILD ONE WITHOUT BLOCKING THE LOOP:
+        server = await asyncEsxiServer.create(host, user, password, 443)
+        vm = await server.getVmByName('[APT] Windows 10x64 Pro')
+        await vm.powerOn()
+    maxConcurrent CAPS THE SOAP CALLS IN FLIGHT FOR THE HOST; maxTransfers CAPS THE HTTP FILE
+    TRANSFERS.
+    """
+    def __init__(self, serverObject, maxConcurrent = 16, maxTransfers = 32):
+        self.server =       serverObject
+        self.executor =     getHostExecutor(serverObject.hostname, maxConcurrent)
+        self.maxTransfers = maxTransfers
+        self.httpSession =  None
+        self.vmWrappers =   {}
+
+    @classmethod
+    async def create(cls, hostname, username, password, port, logFile = "defaultLogfile.log",
+                     maxConcurrent = 16, maxTransfers = 32):
+        loop = asyncio.get_event_loop()
+        serverObject = await loop.run_in_executor(getHostExecutor(hostname, maxConcurrent),
+                                                  esxiServer, hostname, username, password, port, logFile)
+        if serverObject.connection == None:
+            return None
+        return cls(serverObject, maxConcurrent, maxTransfers)
+
+    async def call(self, fn, *args, **kwargs):
+        """
+        RUNS A BLOCKING CALL ON THIS HOST'S EXECUTOR
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def close(self):
+        if self.httpSession != None:
+            await self.httpSession.close()
+            self.httpSession = None
+
+    def getHttpSession(self):
+        if self.httpSession == None and aiohttp != None:
+            connector = aiohttp.TCPConnector(ssl=False, limit=self.maxTransfers)
+            self.httpSession = aiohttp.ClientSession(connector=connector)
+        return self.httpSession
+
+    def wrapVm(self, vm):
+        if vm == None:
+            return None
+        if id(vm) not in self.vmWrappers:
+            self.vmWrappers[id(vm)] = asyncEsxiVm(self, vm)
+        return self.vmWrappers[id(vm)]
+
+    async def awaitTask(self, task, timeout = None):
+        """
+        AWAITS A vSphere TASK WITHOUT TYING UP A THREAD AND RETURNS ITS taskHandle
+        """
+        if timeout == None:
+            timeout = self.server.taskTimeout
+        handle = await self.call(self.server.trackTask, task, timeout)
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def settle(finishedHandle):
+            if not future.done():
+                future.set_result(finishedHandle)
+        handle.addDoneCallback(lambda finishedHandle: loop.call_soon_threadsafe(settle, finishedHandle))
+        return await future
+
+    async def waitForTask(self, task, timeout = None):
+        """
+        THE AWAITABLE VERSION OF esxiServer.waitForTask; RETURNS True IF THE TASK SUCCEEDED
+        """
+        handle = await self.awaitTask(task, timeout)
+        if handle.succeeded():
+            self.server.logMsg("DONE")
+            return True
+        self.server.logMsg("TASK " + handle.state.upper() + ": " + handle.errorMsg())
+        return False
+
+    async def enumerateVms(self, negFilter = None, extraProperties = None):
+        await self.call(self.server.enumerateVms, negFilter, extraProperties)
+        return [self.wrapVm(vm) for vm in self.server.vmList]
+
+    async def getVersion(self):
+        return await self.call(self.server.getVersion)
+
+    async def getVmByName(self, vmName, maxAge = None):
+        return self.wrapVm(await self.call(self.server.getVmByName, vmName, maxAge))
+
+    async def powerOnMany(self, vmList, maxConcurrent = 32, timeout = None):
+        return await self.__mapMany(self.server.powerOnMany, vmList, maxConcurrent, timeout)
+
+    async def powerOffMany(self, vmList, maxConcurrent = 32, timeout = None):
+        return await self.__mapMany(self.server.powerOffMany, vmList, maxConcurrent, timeout)
+
+    async def shutdownMany(self, vmList, timeout = 300, forcePowerOff = True):
+        return await self.__mapMany(self.server.shutdownMany, vmList, timeout, forcePowerOff)
+
+    async def __mapMany(self, fn, vmList, *args):
+        wrapperDict = dict((id(vm.vm), vm) for vm in vmList)
+        resultDict = await self.call(fn, [vm.vm for vm in vmList], *args)
+        return dict((wrapperDict[id(vm)], result) for vm, result in resultDict.items())
+
+    async def waitForVmsToBoot(self, vmList, timeout = 600, pollInterval = 2, requireIp = True):
+        """
+        POLLS THE BOOT STATE OF ALL THE VMS WITH ONE BULK PROPERTY READ PER ROUND AND RETURNS
+        THE LIST OF VMS THAT WERE READY BEFORE timeout SECONDS PASSED
+        """
+        pendingDict = dict((vm.vm.vmObject._moId, vm) for vm in vmList)
+        readyList = []
+        deadline = time.time() + timeout
+        while len(pendingDict) > 0 and time.time() < deadline:
+            propertyList = await self.call(self.server.retrieveProperties,
+                                           vim.VirtualMachine,
+                                           BOOT_PROPERTIES,
+                                           [vm.vm.vmObject for vm in pendingDict.values()])
+            for vimVm, vmProperties in propertyList:
+                if vmProperties.get('runtime.powerState') != vim.VirtualMachinePowerState.poweredOn:
+                    continue
+                if vmProperties.get('guest.toolsRunningStatus') != 'guestToolsRunning':
+                    continue
+                if vmProperties.get('guest.guestOperationsReady') == False:
+                    continue
+                if requireIp and vmProperties.get('guest.ipAddress') == None:
+                    continue
+                vm = pendingDict.pop(vimVm._moId)
+                vm.vm.vmIp = vmProperties.get('guest.ipAddress')
+                readyList.append(vm)
+            if len(pendingDict) > 0:
+                await asyncio.sleep(min(pollInterval, max(0, deadline - time.time())))
+        for vm in pendingDict.values():
+            self.server.logMsg(vm.vmName + " FAILED TO INITIALIZE")
+        return readyList
+
+
+class asyncEsxiVm:
+    """
+    THE AWAITABLE TWIN OF esxiVm.  THE WRAPPED esxiVm IS IN vm IF YOU NEED SOMETHING THAT IS
+    NOT MIRRORED HERE.
+    """
+    def __init__(self, asyncServer, vm):
+        self.server =   asyncServer
+        self.vm =       vm
+
+    @property
+    def vmName(self):
+        return self.vm.vmName
+
+    def setUsername(self, vmUsername):
+        self.vm.setUsername(vmUsername)
+
+    def setPassword(self, vmPassword):
+        self.vm.setPassword(vmPassword)
+
+    async def getVmProperty(self, propertyPath):
+        return await self.server.call(self.vm.getVmProperty, propertyPath)
+
+    async def checkTools(self):
+        return self.vm.toolsState(await self.getVmProperty('guest.toolsStatus'))
+
+    async def isPoweredOn(self):
+        return await self.server.call(self.vm.isPoweredOn)
+
+    async def isPoweredOff(self):
+        return not await self.isPoweredOn()
+
+    async def getVmIp(self, ipTimeout = 120, pollInterval = 2):
+        """
+        LIKE esxiVm.getVmIp, BUT EACH LOOK AT guest.ipAddress IS ONE QUICK READ ON THE EXECUTOR
+        AND THE WAITING BETWEEN LOOKS IS asyncio.sleep
+        """
+        if await self.checkTools() == 'TOOLS_NOT_INSTALLED':
+            return self.vm.vmIp
+        deadline = time.time() + ipTimeout
+        self.vm.vmIp = await self.getVmProperty('guest.ipAddress')
+        if self.vm.vmIp == None:
+            self.vm.server.logMsg("WAITING UP TO " + str(ipTimeout) + " SECONDS FOR AN IP ADDRESS FROM " + self.vmName)
+        while self.vm.vmIp == None and time.time() < deadline:
+            await asyncio.sleep(min(pollInterval, max(0, deadline - time.time())))
+            self.vm.vmIp = await self.getVmProperty('guest.ipAddress')
+        if self.vm.vmIp == None:
+            self.vm.server.logMsg("FAILED TO GET IP ADDRESS FROM " + self.vmName)
+        return self.vm.vmIp
+
+    async def powerOn(self):
+        if await self.isPoweredOn():
+            self.vm.server.logMsg(self.vmName + " IS ALREADY RUNNING, CANNOT POWER-ON HARDER")
+            return None
+        self.vm.server.logMsg("POWERING ON " + self.vmName)
+        task = await self.server.call(self.vm.vmObject.PowerOnVM_Task)
+        return await self.server.waitForTask(task)
+
+    async def powerOff(self):
+        if await self.isPoweredOff():
+            self.vm.server.logMsg(self.vmName + " IS ALREADY OFF, CANNOT POWER-OFF HARDER")
+            return None
+        self.vm.server.logMsg("POWERING OFF " + self.vmName)
+        task = await self.server.call(self.vm.vmObject.PowerOffVM_Task)
+        return await self.server.waitForTask(task)
+
+    async def waitForVmToBoot(self, timeout = 600, pollInterval = 2):
+        """
+        POLLS THROUGH asyncEsxiServer.waitForVmsToBoot, SO NO EXECUTOR THREAD IS HELD WHILE WE WAIT
+        """
+        return len(await self.server.waitForVmsToBoot([self], timeout, pollInterval)) == 1
+
+    async def getSnapshots(self):
+        await self.server.call(self.vm.getSnapshots)
+        return self.vm.snapshotList
+
+    async def takeSnapshot(self, snapshotName, snapshotDescription = '', dumpMemory = False, setQuiescent = False):
+        self.vm.server.logMsg("TAKING SNAPSHOT " + snapshotName + " ON " + self.vmName)
+        try:
+            task = await self.server.call(self.vm.vmObject.CreateSnapshot_Task,
+                                          snapshotName,
+                                          snapshotDescription,
+                                          dumpMemory,
+                                          setQuiescent)
+        except vim.fault.RestrictedVersion:
+            self.vm.server.logMsg("[WARNING]: SNAPSHOTS NOT SUPPORTED FOR " + self.vmName + " ON TARGET")
+            return False
+        return await self.server.waitForTask(task)
+
+    async def revertToSnapshotByName(self, snapshotName):
+        snapshot = await self.__findSnapshot(lambda index: index.findByName(snapshotName))
+        if snapshot == None:
+            return None
+        self.vm.server.logMsg("REVERTING VM " + self.vmName + " TO " + snapshot.name)
+        task = await self.server.call(snapshot.snapshot.RevertToSnapshot_Task)
+        return await self.server.waitForTask(task)
+
+    async def revertToTestingBase(self):
+        snapshot = await self.__findSnapshot(lambda index: index.findFirst(lambda name: 'testing_base' in name.lower()))
+        if snapshot == None:
+            return None
+        self.vm.server.logMsg("REVERTING VM " + self.vmName + " TO " + snapshot.name)
+        task = await self.server.call(snapshot.snapshot.RevertToSnapshot_Task)
+        return await self.server.waitForTask(task)
+
+    async def deleteSnapshot(self, snapshotName):
+        snapshot = await self.__findSnapshot(lambda index: index.findByName(snapshotName, exact=True))
+        if snapshot == None:
+            return None
+        self.vm.server.logMsg("DELETING SNAPSHOT " + snapshotName + " FROM " + self.vmName)
+        task = await self.server.call(snapshot.snapshot.RemoveSnapshot_Task, False)
+        return await self.server.waitForTask(task)
+
+    async def getSnapshotIndex(self, direct = False):
+        return await self.server.call(self.vm.getSnapshotIndex, direct)
+
+    async def __findSnapshot(self, findFn):
+        snapshot = findFn(await self.getSnapshotIndex())
+        mirror = self.vm.server.inventoryMirror
+        if snapshot == None and mirror != None and mirror.hasVm(self.vm.vmObject):
+            snapshot = findFn(await self.getSnapshotIndex(True))
+        return snapshot
+
+    async def makeDirOnGuest(self, dirPath):
+        return await self.server.call(self.vm.makeDirOnGuest, dirPath)
+
+    async def runCmdOnGuest(self, cmdAndArgList):
+        return await self.server.call(self.vm.runCmdOnGuest, cmdAndArgList)
+
+    async def updateProcList(self):
+        return await self.server.call(self.vm.updateProcList)
+
+    async def uploadFileToGuest(self, srcFile, dstFile, chunkSize = 1024 * 1024):
+        """
+        THE SOAP HALF (InitiateFileTransferToGuest) RUNS ON THE EXECUTOR; THE HTTP PUT STREAMS
+        FROM DISK THROUGH aiohttp.  WITHOUT aiohttp, THE WHOLE THING RUNS ON THE EXECUTOR.
+        """
+        if aiohttp == None:
+            return await self.server.call(self.vm.uploadFileToGuest, srcFile, dstFile)
+        serverLog = self.vm.server.logMsg
+        serverLog("ATTEMPTING TO UPLOAD " + srcFile + " TO " + dstFile + " ON " + self.vmName)
+        if await self.checkTools() != 'TOOLS_READY':
+            serverLog("THERE IS A PROBLEM WITH THE VMWARE TOOLS ON " + self.vmName)
+            return False
+        try:
+            fileSize = os.path.getsize(srcFile)
+        except OSError:
+            serverLog("FAILED TO OPEN FILE " + srcFile)
+            return False
+        try:
+            fileManager = self.vm.server.connection.content.guestOperationsManager.fileManager
+            transferUrl = await self.server.call(fileManager.InitiateFileTransferToGuest,
+                                                 self.vm.vmObject,
+                                                 self.__getCreds(),
+                                                 dstFile,
+                                                 vim.vm.guest.FileManager.FileAttributes(),
+                                                 fileSize,
+                                                 True)
+        except Exception as e:
+            serverLog("[ERROR]: UNABLE TO START UPLOAD OF " + srcFile + " TO " + self.vmName)
+            serverLog("SYSTEM ERROR: " + str(e))
+            return False
+        loop = asyncio.get_event_loop()
+
+        async def readChunks():
+            with open(srcFile, 'rb') as srcFileObj:
+                while True:
+                    chunk = await loop.run_in_executor(None, srcFileObj.read, chunkSize)
+                    if not chunk:
+                        break
+                    yield chunk
+        try:
+            async with self.server.getHttpSession().put(fixTransferUrl(self.vm.server.hostname, transferUrl),
+                                                        data=readChunks(),
+                                                        headers={'Content-Length': str(fileSize)}) as resp:
+                if resp.status != 200:
+                    serverLog("ERROR UPLOADING FILE TO " + self.vmName + " HTTP CODE " + str(resp.status))
+                    return False
+        except aiohttp.ClientError as e:
+            serverLog("[ERROR]: UPLOAD TO " + self.vmName + " FAILED: " + str(e))
+            return False
+        serverLog("UPLOADED FILE TO " + self.vmName + " HTTP CODE 200")
+        return True
+
+    async def getFileFromGuest(self, srcFile, dstFile, chunkSize = 1024 * 1024, hashName = None, expectedHash = None):
+        """
+        SAME SPLIT AS uploadFileToGuest.  LIKE esxiVm.getFileFromGuest, THE DOWNLOAD STREAMS INTO
+        A TEMP FILE NEXT TO dstFile THAT IS ONLY RENAMED OVER IT ONCE IT IS THE SIZE THE GUEST
+        SAID IT WOULD BE (AND, IF expectedHash IS GIVEN, HASHES TO IT); THE HEX DIGEST OF
+        hashName IS LEFT IN vm.lastFileHash.  THERE ARE NO RETRIES HERE.
+        """
+        if aiohttp == None:
+            return await self.server.call(self.vm.getFileFromGuest, srcFile, dstFile, None,
+                                          hashName, expectedHash, chunkSize)
+        serverLog = self.vm.server.logMsg
+        if expectedHash != None and hashName == None:
+            hashName = 'sha256'
+        self.vm.lastFileHash = None
+        serverLog("ATTEMPTING TO GET " + srcFile)
+        hashObj = None
+        if hashName != None:
+            try:
+                hashObj = hashlib.new(hashName)
+            except ValueError:
+                serverLog("[ERROR]: UNKNOWN HASH " + str(hashName))
+                return False
+        if await self.checkTools() != 'TOOLS_READY':
+            serverLog("THERE IS A PROBLEM WITH THE VMWARE TOOLS ON " + self.vmName)
+            return False
+        try:
+            fileManager = self.vm.server.connection.content.guestOperationsManager.fileManager
+            ftInfo = await self.server.call(fileManager.InitiateFileTransferFromGuest,
+                                            self.vm.vmObject,
+                                            self.__getCreds(),
+                                            srcFile)
+        except vim.fault.FileNotFound as e:
+            serverLog("FAILED TO FIND FILE ON VM: " + srcFile)
+            serverLog("SYSTEM ERROR: " + str(e))
+            return False
+        except Exception as e:
+            serverLog("UNPREDICTED EXCEPTION:\n" + str(e))
+            return False
+        loop = asyncio.get_event_loop()
+        httpStatus = None
+        bytesReceived = 0
+        try:
+            tempFile, tempFileObj = openTempFile(dstFile)
+        except (IOError, OSError) as e:
+            serverLog("[ERROR]: UNABLE TO SAVE " + dstFile)
+            serverLog("SYSTEM ERROR: " + str(e))
+            return False
+        try:
+            try:
+                async with self.server.getHttpSession().get(fixTransferUrl(self.vm.server.hostname, ftInfo.url)) as resp:
+                    httpStatus = resp.status
+                    if httpStatus == 200:
+                        async for chunk in resp.content.iter_chunked(chunkSize):
+                            await loop.run_in_executor(None, tempFileObj.write, chunk)
+                            if hashObj != None:
+                                hashObj.update(chunk)
+                            bytesReceived += len(chunk)
+            finally:
+                tempFileObj.close()
+        except (aiohttp.ClientError, IOError, OSError) as e:
+            removeQuietly(tempFile)
+            serverLog("[ERROR]: DOWNLOAD FROM " + self.vmName + " FAILED: " + str(e))
+            return False
+        if httpStatus != 200:
+            removeQuietly(tempFile)
+            serverLog("ERROR GETTING FILE " + srcFile + " FROM " + self.vmName + " HTTP CODE " + str(httpStatus))
+            return False
+        if bytesReceived != ftInfo.size:
+            removeQuietly(tempFile)
+            serverLog("[ERROR]: GOT " + str(bytesReceived) + " OF " + str(ftInfo.size) + \
+                      " BYTES OF " + srcFile + " FROM " + self.vmName)
+            return False
+        if hashObj != None:
+            self.vm.lastFileHash = hashObj.hexdigest()
+            serverLog(srcFile + " " + hashName.upper() + " = " + self.vm.lastFileHash)
+            if expectedHash != None and self.vm.lastFileHash.lower() != expectedHash.lower():
+                removeQuietly(tempFile)
+                serverLog("[ERROR]: " + hashName.upper() + " MISMATCH FOR " + srcFile + \
+                          " FROM " + self.vmName + "; EXPECTED " + expectedHash)
+                return False
+        try:
+            replaceFile(tempFile, dstFile)
+        except OSError as e:
+            removeQuietly(tempFile)
+            serverLog("[ERROR]: UNABLE TO SAVE " + dstFile)
+            serverLog("SYSTEM ERROR: " + str(e))
+            return False
+        serverLog("SAVED FILE FROM " + self.vmName + " AS " + dstFile)
+        return True
+
+    def __getCreds(self):
+        return vim.vm.guest.NamePasswordAuthentication(username=self.vm.vmUsername,
+                                                       password=self.vm.vmPassword)
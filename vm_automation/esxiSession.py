@@ -0,0 +1,244 @@
+from atexit import register
+from pyVim.connect import Disconnect, SmartStubAdapter, VimSessionOrientedStub
+from pyVmomi import SoapStubAdapter, vim
+
+import json
+import os
+import stat
+import threading
+import time
+
+
+class pooledSession:
+    """
+    ONE LOGGED-IN vSphere SESSION AND HOW MANY esxiServer OBJECTS ARE CURRENTLY USING IT
+    """
+    def __init__(self, poolKey, serviceInstance):
+        self.poolKey =          poolKey
+        self.serviceInstance =  serviceInstance
+        self.leases =           0
+        self.lastUsed =         time.time()
+
+
+class sessionPool:
+    """
+    sessionPool HANDS OUT AUTHENTICATED ServiceInstances KEYED BY HOST/PORT/USER SO THAT
+    esxiServer OBJECTS IN THE SAME PROCESS DO NOT EACH LOG IN.  THE STUBS ARE pyVmomi'S
+    VimSessionOrientedStub, WHICH LOGS BACK IN ON ITS OWN WHEN THE SERVER SAYS NotAuthenticated,
+    AND A KEEPALIVE THREAD PINGS EVERY SESSION WITH CurrentTime SO IDLE ONES DO NOT EXPIRE.
+    AT MOST maxSessionsPerHost SESSIONS ARE OPENED PER KEY; ONCE THAT MANY EXIST, NEW LEASES
+    SHARE THE LEAST BUSY ONE (THE STUBS ARE SAFE TO SHARE BETWEEN THREADS).
+    """
+    def __init__(self, maxSessionsPerHost = 4, keepaliveInterval = 300):
+        self.maxSessionsPerHost =   maxSessionsPerHost
+        self.keepaliveInterval =    keepaliveInterval
+        self.lock =                 threading.Condition()
+        self.sessions =             {}
+        self.loginsInProgress =     {}
+        self.keepaliveThread =      None
+        self.ownerPid =             os.getpid()
+        register(self.closeAll)
+
+    def acquire(self, hostname, username, password, port = 443, sslContext = None):
+        """
+        RETURNS A LOGGED-IN ServiceInstance; HAND IT BACK WITH release() WHEN YOU ARE DONE.
+        LOGIN FAULTS (vim.fault.InvalidLogin AND FRIENDS) ARE RAISED TO THE CALLER.
+        """
+        poolKey = (hostname, int(port), username, password)
+        with self.lock:
+            while True:
+                sessionList = self.sessions.setdefault(poolKey, [])
+                idleList = [i for i in sessionList if i.leases == 0]
+                if len(idleList) > 0:
+                    return self.__lease(idleList[0])
+                if len(sessionList) + self.loginsInProgress.get(poolKey, 0) < self.maxSessionsPerHost:
+                    self.loginsInProgress[poolKey] = self.loginsInProgress.get(poolKey, 0) + 1
+                    break
+                if len(sessionList) > 0:
+                    return self.__lease(min(sessionList, key=lambda i: i.leases))
+                # EVERY SLOT IS A LOGIN THAT HAS NOT FINISHED YET; WAIT FOR ONE
+                self.lock.wait(1)
+        try:
+            serviceInstance = self.__login(hostname, username, password, int(port), sslContext)
+        finally:
+            with self.lock:
+                self.loginsInProgress[poolKey] -= 1
+                self.lock.notify_all()
+        with self.lock:
+            newSession = pooledSession(poolKey, serviceInstance)
+            self.sessions[poolKey].append(newSession)
+            self.__startKeepalive()
+            return self.__lease(newSession)
+
+    def release(self, serviceInstance):
+        with self.lock:
+            for sessionList in self.sessions.values():
+                for pooled in sessionList:
+                    if pooled.serviceInstance is serviceInstance:
+                        pooled.leases = max(0, pooled.leases - 1)
+                        pooled.lastUsed = time.time()
+                        return True
+        return False
+
+    def closeAll(self):
+        """
+        LOGS OUT OF EVERY SESSION IN THE POOL; REGISTERED TO RUN AT EXIT
+        """
+        if os.getpid() != self.ownerPid:
+            return
+        with self.lock:
+            sessionLists = list(self.sessions.values())
+            self.sessions = {}
+        for sessionList in sessionLists:
+            for pooled in sessionList:
+                try:
+                    Disconnect(pooled.serviceInstance)
+                except Exception:
+                    pass
+
+    def sessionCount(self, hostname = None):
+        with self.lock:
+            return sum(len(j) for i, j in self.sessions.items() if hostname == None or i[0] == hostname)
+
+    def __lease(self, pooled):
+        pooled.leases += 1
+        pooled.lastUsed = time.time()
+        return pooled.serviceInstance
+
+    def __login(self, hostname, username, password, port, sslContext):
+        soapStub = SmartStubAdapter(host=hostname, port=port, sslContext=sslContext)
+        loginMethod = VimSessionOrientedStub.makeUserLoginMethod(username, password)
+        sessionStub = VimSessionOrientedStub(soapStub, loginMethod)
+        serviceInstance = vim.ServiceInstance('ServiceInstance', sessionStub)
+        # THE STUB LOGS IN ON THE FIRST CALL; MAKE THAT HAPPEN NOW SO BAD CREDENTIALS SHOW UP HERE
+        serviceInstance.content.sessionManager.currentSession
+        return serviceInstance
+
+    def __startKeepalive(self):
+        if self.keepaliveThread == None:
+            self.keepaliveThread = threading.Thread(target=self.__keepalive, name="sessionPoolKeepalive")
+            self.keepaliveThread.daemon = True
+            self.keepaliveThread.start()
+
+    def __keepalive(self):
+        while True:
+            time.sleep(self.keepaliveInterval)
+            with self.lock:
+                pooledList = [j for i in self.sessions.values() for j in i]
+            for pooled in pooledList:
+                try:
+                    pooled.serviceInstance.CurrentTime()
+                except Exception:
+                    # IF THE HOST IS GONE, DROP IDLE SESSIONS; BUSY ONES WILL RE-LOGIN ON THEIR OWN
+                    with self.lock:
+                        sessionList = self.sessions.get(pooled.poolKey, [])
+                        if pooled.leases == 0 and pooled in sessionList:
+                            sessionList.remove(pooled)
+
+
+# ONE POOL PER PROCESS; A CHILD FORKED FROM A PROCESS WITH A POOL MUST NOT SHARE ITS SOCKETS
+defaultPool = None
+defaultPoolPid = None
+defaultPoolLock = threading.Lock()
+
+
+def getSessionPool():
+    global defaultPool, defaultPoolPid
+    with defaultPoolLock:
+        if defaultPool == None or defaultPoolPid != os.getpid():
+            defaultPool = sessionPool()
+            defaultPoolPid = os.getpid()
+        return defaultPool
+
+
+def sessionKey(hostname, port, username):
+    return str(username) + "@" + str(hostname) + ":" + str(port)
+
+
+def readSessionFile(sessionFile):
+    """
+    RETURNS THE {sessionKey: {cookie, version}} DICTIONARY IN sessionFile, OR AN EMPTY ONE IF
+    THE FILE IS MISSING, UNREADABLE OR READABLE BY ANYONE BUT ITS OWNER
+    """
+    try:
+        if os.name == 'posix' and os.stat(sessionFile).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            return {}
+        fileObj = open(sessionFile, 'r')
+        sessionDic = json.loads(fileObj.read())
+        fileObj.close()
+    except Exception:
+        return {}
+    if not isinstance(sessionDic, dict):
+        return {}
+    return sessionDic
+
+
+def writeSessionFile(sessionFile, sessionDic):
+    """
+    WRITES sessionDic TO A TEMP FILE ONLY THE OWNER CAN READ, THEN RENAMES IT INTO PLACE SO A
+    CONCURRENT READER NEVER SEES HALF A FILE
+    """
+    tempFile = sessionFile + "." + str(os.getpid()) + ".tmp"
+    try:
+        fileDesc = os.open(tempFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        fileObj = os.fdopen(fileDesc, 'w')
+        fileObj.write(json.dumps(sessionDic))
+        fileObj.close()
+        if hasattr(os, 'replace'):
+            os.replace(tempFile, sessionFile)
+        else:
+            if os.name != 'posix' and os.path.exists(sessionFile):
+                os.remove(sessionFile)
+            os.rename(tempFile, sessionFile)
+    except Exception:
+        try:
+            os.remove(tempFile)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def loadSessionCookie(sessionFile, hostname, port, username, sslContext = None):
+    """
+    RECONNECTS USING A SESSION COOKIE SAVED BY saveSessionCookie, SKIPPING THE LOGIN.  RETURNS
+    THE ServiceInstance, OR None IF NOTHING IS SAVED FOR hostname/port/username OR THE SERVER
+    NO LONGER RECOGNIZES THE SESSION
+    """
+    sessionEntry = readSessionFile(sessionFile).get(sessionKey(hostname, port, username))
+    if sessionEntry == None:
+        return None
+    try:
+        soapStub = SoapStubAdapter(host=hostname,
+                                   port=int(port),
+                                   version=sessionEntry['version'],
+                                   sslContext=sslContext)
+        soapStub.cookie = sessionEntry['cookie']
+        serviceInstance = vim.ServiceInstance('ServiceInstance', soapStub)
+        # currentSession IS None (RATHER THAN A FAULT) WHEN THE COOKIE HAS EXPIRED
+        if serviceInstance.content.sessionManager.currentSession == None:
+            return None
+    except Exception:
+        return None
+    return serviceInstance
+
+
+def saveSessionCookie(sessionFile, serviceInstance, hostname, port, username):
+    """
+    SAVES THE SESSION COOKIE OF A LOGGED-IN serviceInstance SO THE NEXT PROCESS CAN PICK IT UP
+    WITH loadSessionCookie.  THE PASSWORD IS NOT SAVED.
+    """
+    soapStub = serviceInstance._stub
+    if not getattr(soapStub, 'cookie', None):
+        return False
+    sessionDic = readSessionFile(sessionFile)
+    sessionDic[sessionKey(hostname, port, username)] = {'cookie': soapStub.cookie,
+                                                        'version': soapStub.version}
+    return writeSessionFile(sessionFile, sessionDic)
+
+
+def forgetSessionCookie(sessionFile, hostname, port, username):
+    sessionDic = readSessionFile(sessionFile)
+    if sessionDic.pop(sessionKey(hostname, port, username), None) == None:
+        return True
+    return writeSessionFile(sessionFile, sessionDic)
@@ -0,0 +1,359 @@
+from pyVmomi import vim
+from .esxiWatcher import propertyWatcher
+
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+TASK_PROPERTIES = ['info.state',
+                   'info.progress',
+                   'info.result',
+                   'info.error']
+
+# vSphere'S OWN TASK STATES ARE queued, running, success AND error; WE ADD timeout AND cancelled
+TASK_FINISHED_STATES = ['success', 'error', 'timeout', 'cancelled']
+
+
+class taskHandle:
+    """
+    A FUTURE-LIKE HANDLE FOR ONE vSphere TASK WATCHED BY A taskTracker.  state, progress,
+    taskResult AND taskError ARE UPDATED BY THE TRACKER THREAD; wait() BLOCKS UNTIL THE TASK
+    SUCCEEDS, FAILS, TIMES OUT OR IS CANCELLED.
+    """
+    def __init__(self, tracker, task, timeout = None, cancelOnTimeout = False):
+        self.tracker =          tracker
+        self.task =             task
+        self.state =            'queued'
+        self.progress =         None
+        self.taskResult =       None
+        self.taskError =        None
+        self.cancelOnTimeout =  cancelOnTimeout
+        self.cancelRequested =  False
+        self.startTime =        time.time()
+        self.endTime =          None
+        self.callbacks =        []
+        self.doneEvent =        threading.Event()
+        if timeout == None:
+            self.deadline = None
+        else:
+            self.deadline = self.startTime + timeout
+
+    def addDoneCallback(self, callback):
+        """
+        callback(handle) IS CALLED ONCE THE TASK FINISHES (RIGHT AWAY IF IT ALREADY HAS), FROM
+        WHATEVER THREAD FINISHES IT, SO KEEP IT SHORT.
+        """
+        with self.tracker.lock:
+            if not self.doneEvent.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self):
+        return self.tracker.cancel(self)
+
+    def done(self):
+        return self.doneEvent.is_set()
+
+    def error(self, timeout = None):
+        self.wait(timeout)
+        return self.taskError
+
+    def errorMsg(self):
+        if self.taskError == None:
+            return ""
+        if hasattr(self.taskError, 'msg') and self.taskError.msg:
+            return str(self.taskError.msg)
+        return str(self.taskError)
+
+    def result(self, timeout = None):
+        self.wait(timeout)
+        return self.taskResult
+
+    def succeeded(self):
+        return self.state == 'success'
+
+    def wait(self, timeout = None):
+        self.doneEvent.wait(timeout)
+        return self.doneEvent.is_set()
+
+    def finish(self, state, taskError = None):
+        """
+        ONLY THE TRACKER SHOULD CALL THIS, AND ONLY WHILE HOLDING ITS LOCK
+        """
+        self.state = state
+        if taskError != None:
+            self.taskError = taskError
+        self.endTime = time.time()
+        callbackList = self.callbacks
+        self.callbacks = []
+        self.doneEvent.set()
+        return callbackList
+
+
+class taskTracker:
+    """
+    taskTracker WATCHES ANY NUMBER OF vSphere TASKS THROUGH ONE PropertyCollector FILTER OVER A
+    LIST VIEW.  TASKS ARE ADDED TO THE VIEW WHEN YOU track() THEM AND DROPPED FROM IT WHEN THEY
+    FINISH, SO NOTHING LEAKS ON THE SERVER.  ONE BACKGROUND THREAD WAITS FOR UPDATES FOR ALL OF
+    THEM, AND ONLY WHILE THERE IS SOMETHING TO WAIT FOR.
+    """
+    def __init__(self, serverObject, maxWaitSeconds = 30):
+        self.server =           serverObject
+        self.maxWaitSeconds =   maxWaitSeconds
+        self.lock =             threading.Condition()
+        self.handles =          {}
+        self.watcher =          None
+        self.thread =           None
+
+    def track(self, task, timeout = None, cancelOnTimeout = False):
+        """
+        STARTS WATCHING task AND RETURNS ITS taskHandle.  IF timeout IS SET, THE HANDLE FINISHES
+        IN THE timeout STATE AFTER THAT MANY SECONDS (AND THE TASK IS CANCELLED ON THE SERVER IF
+        cancelOnTimeout IS True).
+        """
+        with self.lock:
+            handle = self.handles.get(task._moId)
+            if handle != None:
+                return handle
+            handle = taskHandle(self, task, timeout, cancelOnTimeout)
+            self.handles[task._moId] = handle
+            if self.watcher == None:
+                self.watcher = propertyWatcher(self.server,
+                                               vim.Task,
+                                               TASK_PROPERTIES,
+                                               objList=[],
+                                               lock=self.lock)
+            watcher = self.watcher
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.__run, name="taskTracker-" + str(self.server.hostname))
+                self.thread.daemon = True
+                self.thread.start()
+            self.lock.notify_all()
+        try:
+            unresolvedList = watcher.addObjects([task])
+        except Exception as e:
+            self.server.logMsg("[ERROR]: UNABLE TO WATCH TASK " + str(task._moId))
+            self.server.logMsg("SYSTEM ERROR:\n" + str(e))
+            self.__finishHandles([handle], 'error', e)
+            return handle
+        if unresolvedList:
+            self.__finishHandles([handle], 'error', "TASK " + str(task._moId) + " NO LONGER EXISTS ON THE SERVER")
+        return handle
+
+    def cancel(self, handle):
+        """
+        ASKS THE SERVER TO CANCEL THE TASK; THE HANDLE FINISHES AS cancelled ONCE THE SERVER
+        SAYS IT STOPPED.  RETURNS False IF THE TASK CANNOT BE CANCELLED.
+        """
+        if handle.done():
+            return False
+        handle.cancelRequested = True
+        try:
+            handle.task.CancelTask()
+        except Exception as e:
+            self.server.logMsg("[WARNING]: UNABLE TO CANCEL TASK " + str(handle.task._moId))
+            self.server.logMsg("SYSTEM ERROR:\n" + str(e))
+            handle.cancelRequested = False
+            return False
+        return True
+
+    def pendingCount(self):
+        with self.lock:
+            return len(self.handles)
+
+    def __finishHandles(self, handleList, state, taskError = None):
+        callbackList = []
+        with self.lock:
+            for handle in handleList:
+                if handle.done():
+                    continue
+                self.handles.pop(handle.task._moId, None)
+                callbackList.extend([(i, handle) for i in handle.finish(state, taskError)])
+        self.__removeFromView(handleList)
+        for callback, handle in callbackList:
+            try:
+                callback(handle)
+            except Exception as e:
+                self.server.logMsg("[WARNING]: TASK CALLBACK FAILED: " + str(e))
+
+    def __removeFromView(self, handleList):
+        watcher = self.watcher
+        if watcher == None or len(handleList) == 0:
+            return
+        try:
+            watcher.removeObjects([i.task for i in handleList])
+        except Exception:
+            pass
+
+    def __applyChanges(self, changeList):
+        """
+        RETURNS THE LIST OF (HANDLE, STATE, ERROR) THAT FINISHED, EITHER ON THE SERVER OR
+        BECAUSE THEY RAN OUT OF TIME.  CALLED WHILE HOLDING THE LOCK.
+        """
+        finishedList = []
+        for moId, kind, changedPaths in changeList:
+            handle = self.handles.get(moId)
+            if handle == None or kind == 'leave':
+                continue
+            taskProperties = self.watcher.store.get(moId, {})
+            handle.progress = taskProperties.get('info.progress', handle.progress)
+            taskState = taskProperties.get('info.state', handle.state)
+            if taskState == 'success':
+                handle.taskResult = taskProperties.get('info.result')
+                finishedList.append((handle, 'success', None))
+            elif taskState == 'error':
+                if handle.cancelRequested:
+                    taskState = 'cancelled'
+                finishedList.append((handle, taskState, taskProperties.get('info.error')))
+            else:
+                handle.state = taskState
+        now = time.time()
+        for handle in self.handles.values():
+            if handle.deadline != None and handle.deadline <= now:
+                finishedList.append((handle, 'timeout', None))
+        return finishedList
+
+    def __nextWait(self):
+        maxWait = self.maxWaitSeconds
+        now = time.time()
+        for handle in self.handles.values():
+            if handle.deadline != None:
+                maxWait = min(maxWait, handle.deadline - now)
+        return max(1, int(maxWait + 0.999))
+
+    def __run(self):
+        retryDelay = 1
+        while True:
+            with self.lock:
+                while len(self.handles) == 0:
+                    self.lock.wait()
+                watcher = self.watcher
+                maxWait = self.__nextWait()
+            try:
+                changeList = watcher.waitForUpdates(maxWait)
+                retryDelay = 1
+            except Exception as e:
+                self.server.logMsg("[WARNING]: TASK TRACKER LOST ITS UPDATES; RETRYING IN " + str(retryDelay) + " SECONDS")
+                self.server.logMsg("SYSTEM ERROR:\n" + str(e))
+                time.sleep(retryDelay)
+                retryDelay = min(retryDelay * 2, 30)
+                with self.lock:
+                    watcher.destroy()
+                    try:
+                        self.watcher = propertyWatcher(self.server,
+                                                       vim.Task,
+                                                       TASK_PROPERTIES,
+                                                       objList=[i.task for i in self.handles.values()],
+                                                       lock=self.lock)
+                    except Exception:
+                        self.watcher = watcher
+                    changeList = []
+            with self.lock:
+                finishedList = self.__applyChanges(changeList)
+            for handle, state, taskError in finishedList:
+                if state == 'timeout' and handle.cancelOnTimeout:
+                    try:
+                        handle.task.CancelTask()
+                    except Exception:
+                        pass
+                self.__finishHandles([handle], state, taskError)
+
+
+def iterCompleted(handleList, timeout = None):
+    """
+    YIELDS THE taskHandles IN handleList AS THEY FINISH, IN THE ORDER THEY FINISH.  IF timeout
+    SECONDS PASS FIRST, WE STOP YIELDING; ANYTHING LEFT OVER IS STILL NOT done().
+    """
+    completedQueue = queue.Queue()
+    for handle in handleList:
+        handle.addDoneCallback(completedQueue.put)
+    deadline = None
+    if timeout != None:
+        deadline = time.time() + timeout
+    for i in range(len(handleList)):
+        if deadline == None:
+            # A BARE get() CANNOT BE INTERRUPTED ON PYTHON 2, SO WAKE UP NOW AND THEN
+            handle = None
+            while handle == None:
+                try:
+                    handle = completedQueue.get(True, 60)
+                except queue.Empty:
+                    pass
+        else:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            try:
+                handle = completedQueue.get(True, remaining)
+            except queue.Empty:
+                return
+        yield handle
+
+
+def iterTaskJobs(tracker, jobList, submitFn, maxConcurrent = 16, timeout = None, limitFn = None):
+    """
+    RUNS ONE vSphere TASK PER ENTRY IN jobList WITH AT MOST maxConcurrent OF THEM IN FLIGHT,
+    YIELDING (job, handle) AS EACH ONE FINISHES (handle IS None IF NOTHING WAS SUBMITTED).
+    submitFn(job) MUST START THE TASK AND RETURN IT (OR None IF IT COULD NOT).  limitFn(job),
+    IF GIVEN, RETURNS A LIST OF (KEY, LIMIT) PAIRS, E.G. [(hostMoref, 4), (datastoreMoref, 2)]:
+    A JOB ONLY STARTS WHILE FEWER THAN LIMIT RUNNING JOBS SHARE EACH OF ITS KEYS, SO THE NEXT
+    JOB TO START IS THE FIRST ONE IN jobList THAT FITS.  timeout APPLIES TO EACH TASK FROM THE
+    MOMENT IT IS SUBMITTED.
+    """
+    doneQueue = queue.Queue()
+    pendingList = list(jobList)
+    runningCount = 0
+    keyCounts = {}
+    jobLimits = {}
+    while len(pendingList) > 0 or runningCount > 0:
+        startIndex = 0
+        while runningCount < maxConcurrent and startIndex < len(pendingList):
+            job = pendingList[startIndex]
+            if limitFn != None:
+                if job not in jobLimits:
+                    jobLimits[job] = limitFn(job)
+                if any(keyCounts.get(key, 0) >= max(1, limit) for key, limit in jobLimits[job]):
+                    startIndex += 1
+                    continue
+            pendingList.pop(startIndex)
+            try:
+                task = submitFn(job)
+            except Exception as e:
+                tracker.server.logMsg("[ERROR]: UNABLE TO START TASK: " + str(e))
+                task = None
+            if task == None:
+                yield job, None
+                continue
+            for key, limit in jobLimits.get(job, []):
+                keyCounts[key] = keyCounts.get(key, 0) + 1
+            handle = tracker.track(task, timeout)
+            runningCount += 1
+            handle.addDoneCallback(lambda finishedHandle, job=job: doneQueue.put((job, finishedHandle)))
+        if runningCount == 0:
+            break
+        try:
+            job, handle = doneQueue.get(True, 60)
+        except queue.Empty:
+            continue
+        runningCount -= 1
+        for key, limit in jobLimits.get(job, []):
+            keyCounts[key] -= 1
+        yield job, handle
+
+
+def runTaskJobs(tracker, jobList, submitFn, maxConcurrent = 16, timeout = None, onDone = None, limitFn = None):
+    """
+    iterTaskJobs FOR CALLERS WHO WANT EVERYTHING AT THE END: onDone(job, handle) IS CALLED AS
+    EACH JOB FINISHES, AND WE RETURN {job: taskHandle OR None}.
+    """
+    handleDict = {}
+    for job, handle in iterTaskJobs(tracker, jobList, submitFn, maxConcurrent, timeout, limitFn):
+        handleDict[job] = handle
+        if onDone != None:
+            onDone(job, handle)
+    return handleDict
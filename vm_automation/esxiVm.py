@@ -5,23 +5,50 @@ from random import choice
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 from socket import error as SocketError
 from string import ascii_lowercase
-
+from .esxiSession import forgetSessionCookie, getSessionPool, loadSessionCookie, saveSessionCookie
+from .esxiTasks import iterTaskJobs, runTaskJobs, taskTracker
+from .esxiWatcher import inventoryMirror, propertyWatcher
+from .guestTransfer import TRANSFER_CHUNK_SIZE, chunkedBufferReader, chunkedFileReader, fixTransferUrl, makeHttpSession
+from .guestProcess import iterProcessConditions, iterProcessExits, processTable, readOutputFile, redirectCommand, waitForProcesses
+from .guestTransfer import guestDirName, readShared, removeQuietly, replaceFile, runParallel, streamToFile
+from .logWriter import getLogWriter
+from .snapshotIndex import snapshotIndex
+from .sshPool import getSshPool
+
+import calendar
 import datetime
+import hashlib
 import json
+import os
 import paramiko
 import requests
+import shutil
 import ssl
 import socket
+import tempfile
+import threading
 import time
 
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
+# PROPERTIES esxiVm NEEDS TO BUILD ITSELF; enumerateVms FETCHES THESE FOR EVERY VM IN ONE CALL
+VM_PREFETCH_PROPERTIES = ['summary.config.name',
+                          'summary.config.vmPathName',
+                          'summary.config.guestFullName']
+
+# WHAT iterVmsReady WATCHES TO DECIDE A VM HAS FINISHED BOOTING
+BOOT_PROPERTIES = ['runtime.powerState',
+                   'guest.toolsRunningStatus',
+                   'guest.guestOperationsReady',
+                   'guest.ipAddress']
+
 class esxiServer:
     """
     THE esxiServer CLASS IS A CLASS THAT STORES INFORMATION ON AND SIMPLIFIES INTERACTION
     WITH AN ESXI SERVER.
     """
-    def __init__(self, hostname, username, password, port, logFile = "defaultLogfile.log"):
+    def __init__(self, hostname, username, password, port, logFile = "defaultLogfile.log", inventoryTtl = 300,
+                 usePool = False, sessionFile = None):
         self.hostname   = hostname
         self.type       = "ESXi"
         self.username   = username
@@ -31,13 +58,30 @@ class esxiServer:
         self.vmList     = []
         self.fullName   = ""
         self.connection = None
+        # INVENTORY CACHE USED BY getVmByName AND FRIENDS; SEE refreshInventory
+        self.inventoryTtl   = inventoryTtl
+        self.inventoryTime  = None
+        self.vmNameIndex    = {}
+        self.vmMorefIndex   = {}
+        # EVERY PROPERTY PATH AN enumerateVms CALL HAS ASKED FOR; EVERY RELOAD PULLS ALL OF THEM
+        self.inventoryProperties = list(VM_PREFETCH_PROPERTIES)
+        self.inventoryMirror = None
+        self.taskTracker    = None
+        self.taskTimeout    = 600
+        # KEEP-ALIVE HTTP CONNECTIONS FOR GUEST FILE TRANSFERS; SEE getHttpSession
+        self.httpSession    = None
+        # WITH usePool, connect() BORROWS A SESSION FROM THE PROCESS-WIDE POOL INSTEAD OF LOGGING IN
+        self.usePool        = usePool
+        # WITH sessionFile, connect() REUSES THE SESSION COOKIE SAVED THERE BY AN EARLIER PROCESS
+        self.sessionFile    = sessionFile
         self.connect()
 
     @staticmethod
-    def createFromConfig(configDictionary, logFile="defaultLogfile.log"):
+    def createFromConfig(configDictionary, logFile="defaultLogfile.log", usePool=False):
         """
         IN MOST USE CASES, I JUST EXPECT A JSON FILE, SO I MADE AN OPTIONAL
         CONSTRUCTOR THAT TAKES A DICTIONARY GENERATED BY A JSON FILE
+        HYPERVISOR_SESSION_FILE IS OPTIONAL; SEE connect()
         """
         try:
             hostname = configDictionary['HYPERVISOR_HOST']
@@ -46,10 +90,11 @@ class esxiServer:
             port = configDictionary['HYPERVISOR_LISTENING_PORT']
         except:
             return None
-        return esxiServer(hostname, username, password, port, logFile)
+        sessionFile = configDictionary.get('HYPERVISOR_SESSION_FILE')
+        return esxiServer(hostname, username, password, port, logFile, usePool=usePool, sessionFile=sessionFile)
 
     @staticmethod
-    def createFromFile(configFile, logFile="defaultLogfile.log"):
+    def createFromFile(configFile, logFile="defaultLogfile.log", usePool=False):
         """
         IN MOST USE CASES, I JUST EXPECT A JSON FILE, SO I MADE AN OPTIONAL
         CONSTRUCTOR THAT TAKES A JSON FILE
@@ -64,24 +109,51 @@ class esxiServer:
             hypervisorDic = json.loads(configStr)
         except:
             return None
-        return esxiServer.createFromConfig(hypervisorDic, logFile)
+        return esxiServer.createFromConfig(hypervisorDic, logFile, usePool)
 
     def connect(self):
         """
         connect() INITIATES A CONNECTION TO THE ESXi SERVER AND STORES THE RESULT IN
         THE CLASS VARIABLE connection.  AFTER THE INITIAL CONNECT, MEMBER FUNCTIONS
         USE THE connection VARIABLE.
+        IF usePool IS SET, THE CONNECTION IS A SHARED, KEPT-ALIVE SESSION FROM THE PROCESS-WIDE
+        SESSION POOL THAT LOGS ITSELF BACK IN IF THE SERVER DROPS IT.
+        OTHERWISE, IF sessionFile IS SET, WE TRY THE SESSION COOKIE SAVED THERE FIRST AND ONLY LOG
+        IN IF IT HAS EXPIRED; A FRESH LOGIN SAVES ITS COOKIE FOR NEXT TIME.  THOSE SESSIONS ARE
+        LEFT LOGGED IN WHEN WE EXIT SO THE NEXT PROCESS CAN USE THEM (disconnect() LOGS OUT).
         """
         retVal = True
         context = None
         if hasattr(ssl, '_create_unverified_context'):
             context = ssl._create_unverified_context()
             try:
-                self.connection = SmartConnect(host=self.hostname,
-                                               user=self.username,
-                                               pwd=self.password,
-                                               port=int(self.port),
-                                               sslContext=context)
+                if self.usePool:
+                    self.connection = getSessionPool().acquire(self.hostname,
+                                                               self.username,
+                                                               self.password,
+                                                               int(self.port),
+                                                               context)
+                else:
+                    self.connection = None
+                    if self.sessionFile != None:
+                        self.connection = loadSessionCookie(self.sessionFile,
+                                                            self.hostname,
+                                                            int(self.port),
+                                                            self.username,
+                                                            context)
+                    if self.connection == None:
+                        self.connection = SmartConnect(host=self.hostname,
+                                                       user=self.username,
+                                                       pwd=self.password,
+                                                       port=int(self.port),
+                                                       sslContext=context)
+                        if self.sessionFile != None and self.connection != None:
+                            if not saveSessionCookie(self.sessionFile,
+                                                     self.connection,
+                                                     self.hostname,
+                                                     int(self.port),
+                                                     self.username):
+                                self.logMsg("[WARNING]: UNABLE TO SAVE SESSION TO " + self.sessionFile)
             except SocketError as e:
                 self.logMsg("[ERROR]: CANNOT CONTACT SERVER " + self.hostname)
                 self.logMsg("SYSTEM ERROR MESSAGE:\n" + str(e))
@@ -104,20 +176,38 @@ class esxiServer:
                     retVal = False
                 else:
                     retVal = True
-            register(Disconnect, self.connection)
+            if not self.usePool and self.sessionFile == None:
+                register(Disconnect, self.connection)
         return retVal
 
-    def logMsg(self, strMsg):
+    def disconnect(self):
+        """
+        STOPS ANY BACKGROUND WATCHERS AND LOGS OUT (OR HANDS A POOLED SESSION BACK TO THE POOL)
+        """
+        self.stopInventoryMirror()
+        if self.connection == None:
+            return True
+        if self.usePool:
+            getSessionPool().release(self.connection)
+        else:
+            if self.sessionFile != None:
+                forgetSessionCookie(self.sessionFile, self.hostname, int(self.port), self.username)
+            try:
+                Disconnect(self.connection)
+            except Exception as e:
+                self.logMsg("[WARNING]: LOGOUT FROM " + self.hostname + " FAILED: " + str(e))
+        self.connection = None
+        self.taskTracker = None
+        return True
+
+    def logMsg(self, strMsg, level = None):
+        """
+        LINES ARE BUFFERED AND WRITTEN BY THE PROCESS'S logWriter; level DEFAULTS TO WHATEVER
+        THE "[WARNING]:"-STYLE PREFIX ON strMsg SAYS (SEE configureLogging TO FILTER BY LEVEL)
+        """
         if strMsg == None:
             strMsg="[None]"
-        dateStamp = 'serverlog:[' + str(datetime.datetime.now())+ '] '
-        try:
-            logFileObj = open(self.logFile, 'a')
-            logFileObj.write(dateStamp + strMsg + '\n')
-            logFileObj.close()
-        except IOError:
-            return False
-        return True
+        return getLogWriter().write(self.logFile, 'serverlog', strMsg, level)
     
     def getObject(self, thingToGet):
         """
@@ -131,67 +221,675 @@ class esxiServer:
         content = self.connection.RetrieveContent()
         container = content.viewManager.CreateContainerView(content.rootFolder, [thingToGet], True)
         return container.view
-    def waitForVmsToBoot(self, vmList):
+    def startInventoryMirror(self, extraProperties = None, timeout = 60):
         """
-        IF YOU TRY AND INTERACT WITH A VM BEFORE IT FINISHES LOADING VMWARE TOOLS, IT CAUSES A FAULT AND CRASHES
-        IF YOU TRY AND INTERACT WITH A VM BEFORE IT FINISHES BOOTING, IT CAUSES A FAULT AND CRASHES
-        IF YOU TRY AND CHECK IF IT BOOTED BEFORE TOOLS ARE RUNNING, IT CAUSES A FAULT AND CRASHES
-        THIS JUST POLLS THE TOOLS INSTALLATION UNTIL TOOLS RESPONDS CORRECTLY, THEN STARTS ASKING FOR THE IP
-        ADDRESS.  ONCE THE IP ADDRESS COMES UP, YOU CAN USE IT.
+        STARTS A BACKGROUND MIRROR OF POWER STATE, TOOLS STATE, IP ADDRESS AND SNAPSHOTS (PLUS
+        extraProperties) FOR EVERY VM ON THE SERVER.  WHILE IT RUNS, isPoweredOn, checkTools,
+        getVmIp AND FRIENDS READ LOCAL MEMORY, AND waitForCondition BLOCKS ON CHANGE
+        NOTIFICATIONS INSTEAD OF SLEEPING.  RETURNS True ONCE THE FIRST SYNC IS DONE.
         """
-        self.logMsg("WAITING FOR VMS TO BE READY; THIS COULD TAKE A FEW MINUTES")
-        vmsReady = False
-        while(vmsReady == False):
-            vmsReady = True
-            for i in vmList:
-                if i.isPoweredOn() == False:
-                    time.sleep(1)
-                    self.logMsg(i.vmName + " DID NOT POWER ON AS EXPECTED; RETRYING")
-                    i.powerOn(True)
-                toolsStatus = i.checkTools(True)
-                if toolsStatus == 'TOOLS_NOT_READY':
-                    vmsReady = False
-                else:
-                    vmsReady = True
-            time.sleep(1)
-        retVal = True
-        self.logMsg("VMS APPEAR TO BE READY; PULLING IP ADDRESSES TO VERIFY")
-        time.sleep(5)
-        for i in vmList:
-            for j in range(5):
-                ipAddress = i.getVmIp()
-                if ipAddress != None:
-                    break;
+        if self.inventoryMirror == None:
+            self.inventoryMirror = inventoryMirror(self, extraProperties)
+        if not self.inventoryMirror.start(timeout):
+            self.logMsg("[WARNING]: INVENTORY MIRROR FOR " + self.hostname + " DID NOT SYNC IN " + str(timeout) + " SECONDS")
+            return False
+        self.logMsg("INVENTORY MIRROR RUNNING FOR " + self.hostname)
+        return True
+
+    def stopInventoryMirror(self):
+        if self.inventoryMirror != None:
+            self.inventoryMirror.stop()
+            self.inventoryMirror = None
+        return True
+
+    def waitForCondition(self, predicate, timeout, pollInterval = 1):
+        """
+        WAITS UNTIL predicate() RETURNS SOMETHING TRUE OR timeout SECONDS PASS, AND RETURNS THE
+        LAST THING predicate() RETURNED.  WITH AN INVENTORY MIRROR RUNNING, predicate IS ONLY
+        RE-CHECKED WHEN THE MIRROR CHANGES; WITHOUT ONE, WE POLL EVERY pollInterval SECONDS.
+        """
+        if self.inventoryMirror != None and self.inventoryMirror.isSynced():
+            return self.inventoryMirror.waitFor(predicate, timeout)
+        deadline = time.time() + timeout
+        while True:
+            retVal = predicate()
+            remaining = deadline - time.time()
+            if retVal or remaining <= 0:
+                return retVal
+            time.sleep(min(pollInterval, remaining))
+
+    def getHttpSession(self):
+        """
+        ONE requests.Session PER SERVER, SO GUEST FILE TRANSFERS REUSE TLS CONNECTIONS
+        """
+        if self.httpSession == None:
+            self.httpSession = makeHttpSession()
+        return self.httpSession
+
+    def getTaskTracker(self):
+        if self.taskTracker == None:
+            self.taskTracker = taskTracker(self)
+        return self.taskTracker
+
+    def trackTask(self, task, timeout = None, cancelOnTimeout = False):
+        """
+        HANDS task TO THE SERVER'S SHARED TASK TRACKER AND RETURNS A taskHandle YOU CAN wait()
+        ON, ASK FOR result()/error()/progress, OR cancel().  ANY NUMBER OF TASKS SHARE ONE
+        PropertyCollector FILTER.
+        """
+        return self.getTaskTracker().track(task, timeout, cancelOnTimeout)
+
+    def waitForTask(self, task, timeout = None):
+        """
+        BLOCKS UNTIL task FINISHES AND RETURNS True IF IT SUCCEEDED.  A TASK THAT FAILS IS
+        REPORTED AS SOON AS THE SERVER SAYS SO; ONE THAT IS STILL RUNNING AFTER timeout SECONDS
+        (DEFAULTS TO taskTimeout) COUNTS AS A FAILURE.
+        """
+        if timeout == None:
+            timeout = self.taskTimeout
+        handle = self.trackTask(task, timeout)
+        handle.wait()
+        if handle.state == 'success':
+            self.logMsg("DONE")
+            return True
+        elif handle.state == 'timeout':
+            self.logMsg("TASK NOT COMPLETED IN ALLOTTED TIME")
+        else:
+            self.logMsg("TASK " + handle.state.upper() + ": " + handle.errorMsg())
+        return False
+
+    def powerOnMany(self, vmList, maxConcurrent = 32, timeout = None):
+        """
+        POWERS ON ALL THE VMS IN vmList AT ONCE AND RETURNS {esxiVm: RESULT}, WHERE RESULT IS
+        True IF IT POWERED ON, False IF IT FAILED AND None IF IT WAS ALREADY ON (JUST LIKE
+        esxiVm.powerOn).  WE HAND THE WHOLE BATCH TO Datacenter.PowerOnMultiVM_Task WHEN THE
+        SERVER HAS ONE DATACENTER AND SUPPORTS IT; OTHERWISE WE START UP TO maxConcurrent
+        PowerOnVM_Tasks AT A TIME.  EITHER WAY, THE BATCH TAKES ABOUT AS LONG AS THE SLOWEST VM.
+        """
+        if timeout == None:
+            timeout = self.taskTimeout
+        resultDict = {}
+        pendingList = []
+        powerStates = self.__getVmPropertiesMany(vmList, ['runtime.powerState'])
+        for vm in vmList:
+            if powerStates[vm].get('runtime.powerState') == vim.VirtualMachinePowerState.poweredOn:
+                self.logMsg(vm.vmName + " IS ALREADY RUNNING, CANNOT POWER-ON HARDER")
+                resultDict[vm] = None
+            else:
+                pendingList.append(vm)
+        if len(pendingList) == 0:
+            return resultDict
+        self.logMsg("POWERING ON " + str(len(pendingList)) + " VMS")
+        multiResults = self.__powerOnMulti(pendingList, timeout)
+        if multiResults == None:
+            handleDict = runTaskJobs(self.getTaskTracker(),
+                                     pendingList,
+                                     lambda vm: vm.vmObject.PowerOnVM_Task(),
+                                     maxConcurrent,
+                                     timeout)
+            multiResults = self.__summarizeTaskJobs(handleDict, "POWER ON")
+        resultDict.update(multiResults)
+        return resultDict
+
+    def powerOffMany(self, vmList, maxConcurrent = 32, timeout = None):
+        """
+        HARD POWER-OFF FOR ALL THE VMS IN vmList, UP TO maxConcurrent AT A TIME.  RETURNS
+        {esxiVm: RESULT} WITH THE SAME True/False/None MEANING AS powerOnMany.
+        """
+        if timeout == None:
+            timeout = self.taskTimeout
+        resultDict = {}
+        pendingList = []
+        powerStates = self.__getVmPropertiesMany(vmList, ['runtime.powerState'])
+        for vm in vmList:
+            if powerStates[vm].get('runtime.powerState') != vim.VirtualMachinePowerState.poweredOn:
+                self.logMsg(vm.vmName + " IS ALREADY OFF, CANNOT POWER-OFF HARDER")
+                resultDict[vm] = None
+            else:
+                pendingList.append(vm)
+        if len(pendingList) == 0:
+            return resultDict
+        self.logMsg("POWERING OFF " + str(len(pendingList)) + " VMS")
+        handleDict = runTaskJobs(self.getTaskTracker(),
+                                 pendingList,
+                                 lambda vm: vm.vmObject.PowerOffVM_Task(),
+                                 maxConcurrent,
+                                 timeout)
+        resultDict.update(self.__summarizeTaskJobs(handleDict, "POWER OFF"))
+        return resultDict
+
+    def shutdownMany(self, vmList, timeout = 300, forcePowerOff = True, maxConcurrent = 32):
+        """
+        ASKS EVERY VM IN vmList WITH RUNNING TOOLS TO SHUT DOWN ITS GUEST, THEN WAITS (ON ONE
+        PropertyCollector FILTER FOR ALL OF THEM) UP TO timeout SECONDS FOR THEM TO POWER OFF.
+        IF forcePowerOff IS True, VMS WITHOUT RUNNING TOOLS AND VMS THAT DID NOT GO DOWN IN TIME
+        ARE POWERED OFF HARD.  RETURNS {esxiVm: True/False/None} LIKE powerOffMany.
+        """
+        resultDict = {}
+        shutdownList = []
+        forceList = []
+        vmProperties = self.__getVmPropertiesMany(vmList, ['runtime.powerState', 'guest.toolsRunningStatus'])
+        for vm in vmList:
+            if vmProperties[vm].get('runtime.powerState') != vim.VirtualMachinePowerState.poweredOn:
+                self.logMsg(vm.vmName + " IS ALREADY OFF, CANNOT POWER-OFF HARDER")
+                resultDict[vm] = None
+            elif vmProperties[vm].get('guest.toolsRunningStatus') != 'guestToolsRunning':
+                forceList.append(vm)
+            else:
+                try:
+                    self.logMsg("SHUTTING DOWN " + vm.vmName)
+                    vm.vmObject.ShutdownGuest()
+                    shutdownList.append(vm)
+                except Exception as e:
+                    self.logMsg("[WARNING]: GUEST SHUTDOWN FAILED FOR " + vm.vmName + ": " + str(e))
+                    forceList.append(vm)
+        if len(shutdownList) > 0:
+            poweredOff = self.__waitForPowerState(shutdownList, vim.VirtualMachinePowerState.poweredOff, timeout)
+            for vm in shutdownList:
+                if vm in poweredOff:
+                    resultDict[vm] = True
                 else:
-                    self.logMsg("IP ADDRESS LOOKUP FAILED FOR " + i.vmName + " = " + str(ipAddress))
-                time.sleep(1)
-            if ipAddress == None:
-                retVal = False
-                self.logMsg(i.vmName + " FAILED TO INITIALIZE")
+                    self.logMsg(vm.vmName + " DID NOT SHUT DOWN IN " + str(timeout) + " SECONDS")
+                    forceList.append(vm)
+        if len(forceList) > 0:
+            if forcePowerOff:
+                resultDict.update(self.powerOffMany(forceList, maxConcurrent))
             else:
-                self.logMsg("IP ADDRESS FOR " + i.vmName + " = " + ipAddress)
-        return retVal
+                for vm in forceList:
+                    resultDict[vm] = False
+        return resultDict
 
+    def iterSnapshotMany(self, action, vmList, snapshotName, maxPerHost = 4, maxPerDatastore = 2,
+                         maxConcurrent = 32, timeout = None, snapshotDescription = '', dumpMemory = False,
+                         setQuiescent = False):
+        """
+        TAKES ('create'), REVERTS TO ('revert') OR DELETES ('delete') A SNAPSHOT ON EVERY VM IN
+        vmList, SUBMITTING THE TASKS CONCURRENTLY BUT NEVER MORE THAN maxConcurrent IN ALL,
+        maxPerHost ON ONE ESXi HOST OR maxPerDatastore ON ONE DATASTORE, SINCE SNAPSHOT WORK IS
+        BOUND BY STORAGE.  FOR revert AND delete, snapshotName MAY BE A FUNCTION OF THE SNAPSHOT
+        NAME INSTEAD OF A NAME; revert USES THE FIRST MATCH (LIKE revertToSnapshotByName) AND
+        delete REMOVES EVERY MATCH, ONE AT A TIME PER VM.  YIELDS (esxiVm, RESULT) AS EACH VM
+        FINISHES: True IF EVERYTHING WORKED, False IF ANYTHING FAILED, None IF THERE WAS NO
+        MATCHING SNAPSHOT.
+        """
+        if action not in ['create', 'revert', 'delete']:
+            self.logMsg("[ERROR]: UNKNOWN SNAPSHOT ACTION " + str(action))
+            return
+        if action == 'create' and callable(snapshotName):
+            self.logMsg("[ERROR]: A NEW SNAPSHOT NEEDS A NAME, NOT A FUNCTION")
+            return
+        if timeout == None:
+            timeout = self.taskTimeout
+        if callable(snapshotName):
+            namePredicate = snapshotName
+            actionName = action.upper() + " SNAPSHOT"
+        else:
+            namePredicate = lambda name: name.strip() == snapshotName.strip()
+            actionName = action.upper() + " SNAPSHOT " + snapshotName
+        pathSet = ['runtime.host', 'datastore']
+        if action != 'create':
+            pathSet.append('snapshot')
+        vmProperties = self.__getVmPropertiesMany(vmList, pathSet)
+        # A JOB IS (esxiVm, vim.vm.Snapshot OR None FOR create)
+        jobList = []
+        jobCounts = {}
+        snapshotNames = {}
+        for vm in vmList:
+            if action == 'create':
+                snapshotList = [None]
+            else:
+                index = snapshotIndex(vmProperties[vm].get('snapshot'))
+                treeList = [i for i, j in index.snapshotList if namePredicate(i.name)]
+                if action == 'revert':
+                    treeList = treeList[:1]
+                snapshotList = [i.snapshot for i in treeList]
+                for snapshotTree in treeList:
+                    snapshotNames[(vm, snapshotTree.snapshot)] = snapshotTree.name
+            if len(snapshotList) == 0:
+                self.logMsg("NO MATCHING SNAPSHOT TO " + action.upper() + " ON " + vm.vmName)
+                yield vm, None
+                continue
+            jobCounts[vm] = len(snapshotList)
+            for snapshot in snapshotList:
+                jobList.append((vm, snapshot))
+        if len(jobList) == 0:
+            return
 
+        def submitJob(job):
+            vm, snapshot = job
+            if action == 'create':
+                self.logMsg("TAKING SNAPSHOT " + snapshotName + " ON " + vm.vmName)
+                return vm.vmObject.CreateSnapshot_Task(snapshotName, snapshotDescription, dumpMemory, setQuiescent)
+            if action == 'revert':
+                self.logMsg("REVERTING " + vm.vmName + " TO " + snapshotNames[job])
+                return snapshot.RevertToSnapshot_Task()
+            self.logMsg("DELETING SNAPSHOT " + snapshotNames[job] + " FROM " + vm.vmName)
+            return snapshot.RemoveSnapshot_Task(False)
+
+        def jobLimits(job):
+            vm = job[0]
+            # ONE TASK AT A TIME PER VM; THE SERVER WOULD REFUSE A SECOND ONE ANYWAY
+            limitList = [(vm.vmObject._moId, 1)]
+            hostObject = vmProperties[vm].get('runtime.host')
+            if hostObject != None:
+                limitList.append((hostObject._moId, maxPerHost))
+            for datastore in vmProperties[vm].get('datastore') or []:
+                limitList.append((datastore._moId, maxPerDatastore))
+            return limitList
+
+        self.logMsg("RUNNING " + actionName + " ON " + str(len(jobCounts)) + " VMS")
+        resultDict = {}
+        for job, handle in iterTaskJobs(self.getTaskTracker(), jobList, submitJob, maxConcurrent, timeout, jobLimits):
+            vm = job[0]
+            jobResult = self.__summarizeTaskJobs({vm: handle}, actionName)[vm]
+            resultDict[vm] = resultDict.get(vm, True) and jobResult
+            jobCounts[vm] -= 1
+            if jobCounts[vm] == 0:
+                yield vm, resultDict[vm]
+
+    def snapshotMany(self, action, vmList, snapshotName, maxPerHost = 4, maxPerDatastore = 2, maxConcurrent = 32,
+                     timeout = None, callback = None, **kwargs):
+        """
+        iterSnapshotMany FOR WHEN YOU WANT THE REPORT AT THE END: RETURNS {esxiVm: RESULT}.
+        callback(esxiVm, RESULT) IS CALLED AS EACH VM FINISHES.  EXTRA KEYWORD ARGUMENTS
+        (snapshotDescription, dumpMemory, setQuiescent) ARE FOR create.
+        """
+        resultDict = {}
+        for vm, vmResult in self.iterSnapshotMany(action, vmList, snapshotName, maxPerHost, maxPerDatastore,
+                                                  maxConcurrent, timeout, **kwargs):
+            resultDict[vm] = vmResult
+            if callback != None:
+                callback(vm, vmResult)
+        return resultDict
+
+    def distributeFile(self, vmList, srcFile, dstFile, maxPerHost = 8, maxConcurrent = 32, skipMatching = True,
+                       callback = None):
+        """
+        COPIES ONE LOCAL FILE TO THE SAME PATH ON EVERY VM IN vmList.  THE FILE IS READ ONCE (AS
+        AN mmap) AND EVERY UPLOAD SLICES THE SAME BUFFER; UP TO maxConcurrent UPLOADS RUN AT ONCE,
+        BUT NEVER MORE THAN maxPerHost TO VMS ON THE SAME ESXi HOST.  THE GUEST COPY IS STAMPED
+        WITH THE LOCAL FILE'S MODIFICATION TIME, SO IF skipMatching IS True, A VM WHOSE
+        ListFilesInGuest SHOWS THE SAME SIZE AND TIME ALREADY HAS IT AND IS SKIPPED.
+        callback(esxiVm, bytesSent, totalBytes) REPORTS PROGRESS.
+        RETURNS {esxiVm: True/False}; A SKIPPED VM COUNTS AS True
+        """
+        resultDict = dict((vm, False) for vm in vmList)
+        try:
+            fileSize = os.path.getsize(srcFile)
+            fileTime = int(os.path.getmtime(srcFile))
+            dataBuffer = readShared(srcFile)
+        except (IOError, OSError) as e:
+            self.logMsg("[ERROR]: UNABLE TO READ " + srcFile)
+            self.logMsg("SYSTEM ERROR: " + str(e))
+            return resultDict
+        hostLocks = {}
+        vmLocks = {}
+        for vm, vmProperties in self.__getVmPropertiesMany(vmList, ['runtime.host']).items():
+            hostKey = getattr(vmProperties.get('runtime.host'), '_moId', None)
+            if hostKey not in hostLocks:
+                hostLocks[hostKey] = threading.BoundedSemaphore(maxPerHost)
+            vmLocks[vm] = hostLocks[hostKey]
+        skipList = []
+
+        def distributeOne(vm):
+            with vmLocks[vm]:
+                if skipMatching:
+                    fileInfo = vm.getGuestFileInfo(dstFile)
+                    if fileInfo != None and fileInfo.size == fileSize and fileInfo.attributes != None \
+                            and fileInfo.attributes.modificationTime != None \
+                            and abs(calendar.timegm(fileInfo.attributes.modificationTime.utctimetuple()) - fileTime) <= 2:
+                        self.logMsg(dstFile + " ON " + vm.vmName + " IS ALREADY UP TO DATE")
+                        skipList.append(vm)
+                        return True
+                vmCallback = None
+                if callback != None:
+                    vmCallback = lambda doneBytes, totalBytes: callback(vm, doneBytes, totalBytes)
+                return vm.uploadBufferToGuest(dataBuffer, dstFile, vmCallback, fileTime)
+        try:
+            resultDict.update(runParallel(vmList, distributeOne, maxConcurrent))
+        finally:
+            if hasattr(dataBuffer, 'close'):
+                dataBuffer.close()
+        self.logMsg("DISTRIBUTED " + srcFile + " TO " + str(sum(1 for i in resultDict.values() if i)) + " OF " + \
+                    str(len(vmList)) + " VMS (" + str(len(skipList)) + " ALREADY HAD IT)")
+        return resultDict
+
+    def iterProcessExits(self, procList, timeout = None):
+        """
+        procList IS A LIST OF (esxiVm, pid), E.G. FROM runCmdOnGuest ON MANY VMS.  YIELDS
+        (esxiVm, pid, exitCode, endTime) AS EACH ONE EXITS, POLLING EACH VM ONCE PER ROUND FOR
+        ALL OF ITS PIDS AND BACKING OFF WHILE NOTHING IS HAPPENING
+        """
+        return iterProcessExits(procList, timeout)
+
+    def iterProcessConditions(self, conditionList, timeout = None):
+        """
+        conditionList IS A LIST OF processConditions (A PROCESS APPEARED OR EXITED ON SOME VM).
+        ALL OF THEIR VMS ARE POLLED TOGETHER, AND EACH CONDITION IS YIELDED AS SOON AS IT IS MET
+        OR RUNS OUT OF TIME; CHECK ITS met
+        """
+        return iterProcessConditions(conditionList, timeout)
+
+    def waitForProcessConditions(self, conditionList, timeout = 600):
+        """
+        RETURNS {processCondition: True/False} ONCE EVERY CONDITION IS MET OR HAS TIMED OUT
+        """
+        resultDict = {}
+        for condition in iterProcessConditions(conditionList, timeout):
+            resultDict[condition] = condition.met
+        return resultDict
 
-    def enumerateVms(self, negFilter = None):
+    def waitForProcesses(self, procList, timeout = 600):
+        """
+        RETURNS {(esxiVm, pid): (exitCode, endTime)} ONCE EVERYTHING IN procList HAS EXITED OR
+        timeout SECONDS PASS; ANYTHING STILL RUNNING MAPS TO None
+        """
+        return waitForProcesses(procList, timeout)
+
+    def __getVmPropertiesMany(self, vmList, pathSet):
+        """
+        RETURNS {esxiVm: {PROPERTY PATH: VALUE}} FOR vmList, FROM THE INVENTORY MIRROR IF IT HAS
+        EVERYTHING, OTHERWISE WITH ONE RetrievePropertiesEx CALL
+        """
+        retDict = {}
+        mirror = self.inventoryMirror
+        if mirror != None and all(i in mirror.pathSet for i in pathSet) and all(mirror.hasVm(vm.vmObject) for vm in vmList):
+            for vm in vmList:
+                retDict[vm] = dict((i, mirror.getProperty(vm.vmObject, i)) for i in pathSet)
+            return retDict
+        vmByMoref = dict((vm.vmObject._moId, vm) for vm in vmList)
+        for vm in vmList:
+            retDict[vm] = {}
+        for vimVm, vmProperties in self.retrieveProperties(vim.VirtualMachine, pathSet, [vm.vmObject for vm in vmList]):
+            retDict[vmByMoref[vimVm._moId]] = vmProperties
+        return retDict
+
+    def __powerOnMulti(self, vmList, timeout):
+        """
+        TRIES Datacenter.PowerOnMultiVM_Task; RETURNS None IF WE CANNOT USE IT SO THE CALLER CAN
+        FALL BACK TO ONE TASK PER VM
+        """
+        datacenterList = self.retrieveProperties(vim.Datacenter, ['name'])
+        if len(datacenterList) != 1:
+            return None
+        try:
+            multiTask = datacenterList[0][0].PowerOnMultiVM_Task([vm.vmObject for vm in vmList])
+        except Exception as e:
+            self.logMsg("PowerOnMultiVM NOT AVAILABLE (" + str(e).strip() + "); POWERING ON ONE AT A TIME")
+            return None
+        multiHandle = self.trackTask(multiTask, timeout)
+        multiHandle.wait()
+        if not multiHandle.succeeded():
+            self.logMsg("PowerOnMultiVM FAILED (" + multiHandle.errorMsg() + "); POWERING ON ONE AT A TIME")
+            return None
+        vmByMoref = dict((vm.vmObject._moId, vm) for vm in vmList)
+        resultDict = {}
+        handleDict = {}
+        multiResult = multiHandle.taskResult
+        for notAttempted in (multiResult.notAttempted or []):
+            vm = vmByMoref.get(notAttempted.vm._moId)
+            if vm != None:
+                self.logMsg("[ERROR]: " + vm.vmName + " WAS NOT POWERED ON: " + str(notAttempted.fault.msg))
+                resultDict[vm] = False
+        for attempted in (multiResult.attempted or []):
+            vm = vmByMoref.get(attempted.vm._moId)
+            if vm == None:
+                continue
+            if attempted.task == None:
+                resultDict[vm] = True
+            else:
+                handleDict[vm] = self.trackTask(attempted.task, timeout)
+        for vm in vmList:
+            if vm not in resultDict and vm not in handleDict:
+                self.logMsg("[ERROR]: " + vm.vmName + " WAS NOT POWERED ON")
+                resultDict[vm] = False
+        for handle in handleDict.values():
+            handle.wait()
+        resultDict.update(self.__summarizeTaskJobs(handleDict, "POWER ON"))
+        return resultDict
+
+    def __summarizeTaskJobs(self, handleDict, operationName):
+        resultDict = {}
+        for vm, handle in handleDict.items():
+            if handle != None and handle.succeeded():
+                resultDict[vm] = True
+            else:
+                if handle == None:
+                    self.logMsg("[ERROR]: " + operationName + " FAILED TO START FOR " + vm.vmName)
+                else:
+                    self.logMsg("[ERROR]: " + operationName + " " + handle.state.upper() + " FOR " + vm.vmName + ": " + handle.errorMsg())
+                resultDict[vm] = False
+        return resultDict
+
+    def __waitForPowerState(self, vmList, powerState, timeout):
+        """
+        WAITS UNTIL EVERY VM IN vmList REACHES powerState OR timeout SECONDS PASS, WATCHING THEM
+        ALL THROUGH ONE FILTER.  RETURNS THE LIST OF VMS THAT GOT THERE.
+        """
+        vmByMoref = dict((vm.vmObject._moId, vm) for vm in vmList)
+        reachedList = []
+        watcher = propertyWatcher(self, vim.VirtualMachine, ['runtime.powerState'], [vm.vmObject for vm in vmList])
+        deadline = time.time() + timeout
+        try:
+            while len(reachedList) < len(vmList):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                watcher.waitForUpdates(max(1, int(remaining)))
+                for moId, vm in vmByMoref.items():
+                    if vm not in reachedList and watcher.store.get(moId, {}).get('runtime.powerState') == powerState:
+                        reachedList.append(vm)
+        finally:
+            watcher.destroy()
+        return reachedList
+
+    def iterVmsReady(self, vmList, timeout = 600, requireIp = True):
+        """
+        YIELDS EACH VM IN vmList AS SOON AS IT IS READY TO TALK TO: POWERED ON, TOOLS RUNNING,
+        GUEST OPERATIONS READY AND (IF requireIp) REPORTING AN IP ADDRESS, WHICH IS STORED IN
+        vmIp.  ALL THE VMS ARE WATCHED AT ONCE THROUGH ONE PropertyCollector FILTER, SO THE
+        WHOLE BATCH TAKES AS LONG AS THE SLOWEST VM.  VMS THAT ARE OFF GET ONE POWER-ON NUDGE.
+        ANYTHING NOT READY BEFORE timeout SECONDS IS LOGGED AND NEVER YIELDED.
+        """
+        pendingDict = dict((vm.vmObject._moId, vm) for vm in vmList)
+        powerOnAttempted = []
+        deadline = time.time() + timeout
+        watcher = propertyWatcher(self, vim.VirtualMachine, BOOT_PROPERTIES, [vm.vmObject for vm in vmList])
+        try:
+            while len(pendingDict) > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                for moId, kind, changedPaths in watcher.waitForUpdates(max(1, int(remaining))):
+                    vm = pendingDict.get(moId)
+                    if vm == None:
+                        continue
+                    vmProperties = watcher.store.get(moId, {})
+                    if vmProperties.get('runtime.powerState') != vim.VirtualMachinePowerState.poweredOn:
+                        if moId not in powerOnAttempted:
+                            powerOnAttempted.append(moId)
+                            self.logMsg(vm.vmName + " DID NOT POWER ON AS EXPECTED; RETRYING")
+                            try:
+                                vm.vmObject.PowerOnVM_Task()
+                            except Exception as e:
+                                self.logMsg("[ERROR]: UNABLE TO POWER ON " + vm.vmName + ": " + str(e))
+                        continue
+                    if vmProperties.get('guest.toolsRunningStatus') != 'guestToolsRunning':
+                        continue
+                    if vmProperties.get('guest.guestOperationsReady') == False:
+                        continue
+                    if requireIp and vmProperties.get('guest.ipAddress') == None:
+                        continue
+                    del pendingDict[moId]
+                    vm.vmIp = vmProperties.get('guest.ipAddress')
+                    yield vm
+        finally:
+            watcher.destroy()
+        for vm in pendingDict.values():
+            self.logMsg(vm.vmName + " FAILED TO INITIALIZE")
+
+    def waitForVmsToBoot(self, vmList, timeout = 600, callback = None):
+        """
+        IF YOU TRY AND INTERACT WITH A VM BEFORE IT FINISHES LOADING VMWARE TOOLS, IT CAUSES A FAULT AND CRASHES
+        IF YOU TRY AND INTERACT WITH A VM BEFORE IT FINISHES BOOTING, IT CAUSES A FAULT AND CRASHES
+        IF YOU TRY AND CHECK IF IT BOOTED BEFORE TOOLS ARE RUNNING, IT CAUSES A FAULT AND CRASHES
+        THIS WATCHES TOOLS, GUEST OPERATIONS AND THE IP ADDRESS OF ALL THE VMS AT ONCE (SEE
+        iterVmsReady), CALLS callback(vm) FOR EACH ONE AS IT BECOMES READY, AND RETURNS True IF
+        THEY ALL DID BEFORE timeout SECONDS WENT BY.
+        """
+        self.logMsg("WAITING FOR VMS TO BE READY; THIS COULD TAKE A FEW MINUTES")
+        readyCount = 0
+        for vm in self.iterVmsReady(vmList, timeout):
+            readyCount += 1
+            self.logMsg("IP ADDRESS FOR " + vm.vmName + " = " + str(vm.vmIp))
+            if callback != None:
+                callback(vm)
+        if readyCount < len(set(vm.vmObject._moId for vm in vmList)):
+            return False
+        self.logMsg("VMS APPEAR TO BE READY")
+        return True
+
+    def enumerateVms(self, negFilter = None, extraProperties = None, prefetch = True):
         """
         THERE ARE SEVERAL WAYS TO ENUMERATE VMs. THIS IS BY FAR THE EASIEST,
         BUT I AM NOT SURE IF IT WILL WORK ON LARGER DEPLOYMENTS BECAUSE OF
         vSPHERE'S HIERARCHICAL STORAGE METHODOLOGY
+        BY DEFAULT, THE PROPERTIES esxiVm NEEDS (AND ANY extraProperties, LIKE
+        'runtime.powerState' OR 'guest.ipAddress') ARE PULLED FOR ALL VMS IN ONE
+        PAGED PropertyCollector CALL INSTEAD OF SEVERAL ROUND TRIPS PER VM.  THE
+        PREFETCHED VALUES END UP IN esxiVm.vmProperties.  SET prefetch TO False
+        TO GET THE OLD ONE-VM-AT-A-TIME BEHAVIOR.
         """
-        content = self.connection.content
-        objView = content.viewManager.CreateContainerView(content.rootFolder,
-                                                          [vim.VirtualMachine],
-                                                          True)
-        vimVmList = objView.view
-        objView.Destroy()
+        if not prefetch:
+            self.vmList = []
+            content = self.connection.content
+            objView = content.viewManager.CreateContainerView(content.rootFolder,
+                                                              [vim.VirtualMachine],
+                                                              True)
+            vimVmList = objView.view
+            objView.Destroy()
+            for i in vimVmList:
+                if negFilter != None and negFilter.upper() in i.name.upper():
+                    continue
+                vm = self.vmMorefIndex.get(i._moId)
+                if vm != None:
+                    vm.vmObject = i
+                    vm.setVmProperties()
+                else:
+                    vm = esxiVm(self, i)
+                self.vmList.append(vm)
+            if negFilter == None:
+                self.__indexInventory(self.vmList)
+            return
         self.vmList = []
-        for i in vimVmList:
-            if negFilter != None and negFilter.upper() in i.name.upper():
+        for vm in self.__loadInventory(extraProperties):
+            if negFilter != None and vm.vmName != None and negFilter.upper() in vm.vmName.upper():
                 continue
             else:
-                self.vmList.append(esxiVm(self, i))
+                self.vmList.append(vm)
+
+    def __loadInventory(self, extraProperties = None):
+        """
+        PULLS EVERY VM (UNFILTERED) FROM THE SERVER AND REBUILDS THE NAME AND MOREF INDEXES.
+        esxiVm OBJECTS WE ALREADY KNOW ABOUT ARE UPDATED IN PLACE RATHER THAN REPLACED, SO
+        THINGS LIKE CREDENTIALS SET ON THEM SURVIVE A REFRESH.  extraProperties ARE ADDED TO
+        inventoryProperties, AND EVERY LOAD (INCLUDING A TTL RELOAD) PULLS ALL OF THOSE, SO A
+        REFRESH NEVER DROPS A PROPERTY SOMEONE ASKED FOR EARLIER.
+        """
+        for propertyPath in extraProperties or []:
+            if propertyPath not in self.inventoryProperties:
+                self.inventoryProperties.append(propertyPath)
+        inventoryList = []
+        for vimVm, vmProperties in self.retrieveProperties(vim.VirtualMachine, list(self.inventoryProperties)):
+            vm = self.vmMorefIndex.get(vimVm._moId)
+            if vm != None:
+                vm.vmObject = vimVm
+                vm.setVmProperties(vmProperties)
+            else:
+                vm = esxiVm(self, vimVm, vmProperties)
+            inventoryList.append(vm)
+        self.__indexInventory(inventoryList)
+        return inventoryList
+
+    def __indexInventory(self, inventoryList):
+        vmNameIndex = {}
+        vmMorefIndex = {}
+        for vm in inventoryList:
+            vmNameIndex.setdefault(vm.vmName, []).append(vm)
+            vmMorefIndex[vm.vmObject._moId] = vm
+        self.vmNameIndex = vmNameIndex
+        self.vmMorefIndex = vmMorefIndex
+        self.inventoryTime = time.time()
+
+    def isInventoryFresh(self, maxAge = None):
+        if maxAge == None:
+            maxAge = self.inventoryTtl
+        if self.inventoryTime == None:
+            return False
+        return (time.time() - self.inventoryTime) < maxAge
+
+    def refreshInventory(self, maxAge = None):
+        """
+        RELOADS THE INVENTORY CACHE IF IT IS OLDER THAN maxAge SECONDS (DEFAULTS TO
+        inventoryTtl).  THIS DOES NOT TOUCH vmList; USE enumerateVms FOR THAT.
+        """
+        if not self.isInventoryFresh(maxAge):
+            self.__loadInventory()
+        return True
+
+    def invalidate(self):
+        """
+        FORGET THE INVENTORY CACHE; THE NEXT LOOKUP GOES BACK TO THE SERVER.  CALL THIS AFTER
+        CREATING, DELETING OR RENAMING VMS OUTSIDE THIS LIBRARY.
+        """
+        self.inventoryTime = None
+
+    def setInventoryTtl(self, inventoryTtl):
+        self.inventoryTtl = inventoryTtl
+
+    def retrieveProperties(self, objType, pathSet, objList = None, pageSize = 1000):
+        """
+        PULLS pathSet FOR MANY OBJECTS WITH RetrievePropertiesEx, FOLLOWING THE CONTINUATION
+        TOKEN UNTIL ALL PAGES ARE IN.  IF objList IS None, EVERY objType IN THE INVENTORY IS
+        QUERIED THROUGH A CONTAINER VIEW; OTHERWISE ONLY THE OBJECTS IN objList ARE.
+        RETURNS A LIST OF (OBJECT, {PROPERTY PATH: VALUE}) TUPLES; UNSET PROPERTIES ARE
+        SIMPLY MISSING FROM THE DICTIONARY.
+        """
+        content = self.connection.content
+        propertyCollector = content.propertyCollector
+        viewRef = None
+        if objList is None:
+            viewRef = content.viewManager.CreateContainerView(content.rootFolder, [objType], True)
+            traversalSpec = vmodl.query.PropertyCollector.TraversalSpec(name='traverseView',
+                                                                        path='view',
+                                                                        skip=False,
+                                                                        type=vim.view.ContainerView)
+            objSpecs = [vmodl.query.PropertyCollector.ObjectSpec(obj=viewRef,
+                                                                 skip=True,
+                                                                 selectSet=[traversalSpec])]
+        else:
+            if len(objList) == 0:
+                return []
+            objSpecs = [vmodl.query.PropertyCollector.ObjectSpec(obj=i, skip=False) for i in objList]
+        propSpec = vmodl.query.PropertyCollector.PropertySpec(type=objType, pathSet=pathSet, all=False)
+        filterSpec = vmodl.query.PropertyCollector.FilterSpec(objectSet=objSpecs, propSet=[propSpec])
+        retrieveOptions = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=pageSize)
+        retList = []
+        try:
+            result = propertyCollector.RetrievePropertiesEx([filterSpec], retrieveOptions)
+            while result != None:
+                for objContent in result.objects:
+                    objProperties = {}
+                    for dynProperty in objContent.propSet:
+                        objProperties[dynProperty.name] = dynProperty.val
+                    retList.append((objContent.obj, objProperties))
+                if result.token == None:
+                    break
+                result = propertyCollector.ContinueRetrievePropertiesEx(result.token)
+        finally:
+            if viewRef != None:
+                viewRef.Destroy()
+        return retList
 
     def getVersion(self):
         """
@@ -201,12 +899,31 @@ class esxiServer:
         self.fullName = content.about.fullName
         return self.fullName
 
-    def getVmByName(self, vmName):
-        self.enumerateVms()
-        for vm in self.vmList:
-            if vmName == vm.vmName:
-                return vm
-        return None
+    def getVmByName(self, vmName, maxAge = None):
+        """
+        LOOKS THE VM UP IN THE INVENTORY CACHE, RELOADING IT ONLY IF IT IS OLDER THAN maxAge
+        (DEFAULTS TO inventoryTtl).  VM NAMES ARE NOT UNIQUE; IF THERE IS MORE THAN ONE MATCH,
+        WE COMPLAIN AND HAND BACK THE FIRST.  USE getVmsByName TO SEE ALL OF THEM.
+        """
+        vmMatches = self.getVmsByName(vmName, maxAge)
+        if len(vmMatches) == 0:
+            return None
+        if len(vmMatches) > 1:
+            self.logMsg("[WARNING]: " + str(len(vmMatches)) + " VMS ARE NAMED " + vmName + "; USING THE FIRST ONE")
+        return vmMatches[0]
+
+    def getVmsByName(self, vmName, maxAge = None):
+        self.refreshInventory(maxAge)
+        return list(self.vmNameIndex.get(vmName, []))
+
+    def getVmByMoref(self, moref, maxAge = None):
+        """
+        moref CAN BE A vim.VirtualMachine OR ITS MANAGED OBJECT ID STRING (e.g. 'vm-42')
+        """
+        self.refreshInventory(maxAge)
+        if hasattr(moref, '_moId'):
+            moref = moref._moId
+        return self.vmMorefIndex.get(moref)
 
     def cloneToServer(self, srcVm, destServer, destDatastore, destVm, timeout=60*30):
         # Copying between servers takes a while, so the default timeout is 30 minutes.
@@ -226,23 +943,34 @@ class esxiServer:
             self.logMsg("Unable to find VM to clone.")
             return False
 
-        session = self.__loginToEsx()
-
-        # Configure source server firewall to allow outbound SSH and HTTP
-        self.__toggleFirewallRules(session, enabled=True)
-
-        # Deploy OVF Tool on source server
-        if self.__deployOvfTool(session) is False:
+        # Configure source server firewall to allow outbound SSH and HTTP, and only close
+        # afterwards the rulesets that were closed before we started
+        ruleStates = self.__getFirewallRules(['sshClient', 'httpClient'])
+        if ruleStates is None:
             return False
+        openedRules = [i for i in ruleStates if not ruleStates[i]]
 
-        srcServer = self.username + ":" + self.password + "@" + self.hostname
         try:
-            stdin, stdout, stderr = session.exec_command('/tmp/ovftool/ovftool -dm=thin -ds=' + destDatastore +
-                                                         ' --name=' + destVm + ' vi://' + srcServer + '/' + srcVm +
-                                                         ' vi://' + destServer)
-            output = stdout.read()
-            if 'Completed successfully' in output:
+            if not self.__toggleFirewallRules(True, openedRules):
+                return False
+
+            # Deploy OVF Tool on source server
+            if self.__deployOvfTool() is False:
+                return False
+
+            srcServer = self.username + ":" + self.password + "@" + self.hostname
+            cmdResult = self.runShellCommand('/tmp/ovftool/ovftool -dm=thin -ds=' + destDatastore +
+                                             ' --name=' + destVm + ' vi://' + srcServer + '/' + srcVm +
+                                             ' vi://' + destServer, timeout)
+            if cmdResult is None:
+                self.logMsg("Failed to execute ovftool based clone.")
+                return False
+            exitCode, output, errors = cmdResult
+            output = output + errors
+            if exitCode == 0 and 'Completed successfully' in output:
                 return True
+            if exitCode is None:
+                self.logMsg("ovftool did not finish in " + str(timeout) + " seconds.")
             if 'Error: Internal error: Failed to connect to server' in output:
                 self.logMsg("Unable to connect to destination server.  Connection timed out or refused.")
             if 'Error: Duplicate name' in output:
@@ -251,11 +979,12 @@ class esxiServer:
                 self.logMsg("Datastore name not found on destination server")
             if 'No network mapping specified' in output:
                 self.logMsg("Destination server is missing the case-sensitive network name required by this VM.")
-        except paramiko.SSHException:
-            self.logMsg("Failed to execute ovftool based clone.")
-        return False
+            return False
+        finally:
+            if len(openedRules) > 0:
+                self.__toggleFirewallRules(False, openedRules)
 
-    def clone(self, srcVm, destVm, thinProvision=True):
+    def clone(self, srcVm, destVm, thinProvision=True, linked=False, snapshotName=None, useApi=False):
         # srcVm = string, name of source VM
         # destVm = string, name of destination VM
         #    Limitations:
@@ -263,6 +992,16 @@ class esxiServer:
         #         Source VM name must be unique
         #         esxiServer must not be a vCenter server
         #         VM cannot contain multiple disks
+        # THOSE LIMITATIONS ARE FOR THE SSH COPY, WHICH IS STILL THE DEFAULT.  useApi = True
+        # CLONES THROUGH THE API INSTEAD (SEE cloneFull), WHICH HAS NONE OF THEM AND NEEDS NO
+        # SSH, BUT THE SOURCE VM MUST BE POWERED OFF.
+        # linked = True MAKES A LINKED CLONE INSTEAD (SEE cloneMany), WHICH NEEDS vCenter;
+        # snapshotName PICKS THE PARENT SNAPSHOT.
+
+        if linked:
+            return self.cloneMany(srcVm, [destVm], snapshotName)[destVm] != False
+        if useApi:
+            return self.cloneFull(srcVm, destVm, thinProvision) != False
 
         if type(srcVm) != str or type(destVm) != str:
             self.logMsg("Source and destination VMs must be the VM names as strings.")
@@ -270,65 +1009,284 @@ class esxiServer:
 
         path, srcVmdk = self.__findVmdkPath(srcVm)
 
-        session = self.__loginToEsx()
-
-        if session is None:
+        if path is None or srcVmdk is None:
+            self.logMsg("Unable to find VM to clone.")
             return False
 
-        result = True
+        destPath = path + "/" + destVm
+        destVmdk = srcVmdk.split('/')[-1]
+        if thinProvision:
+            diskFormat = 'thin'
+        else:
+            diskFormat = 'zeroedthick'
+
+        # EACH STEP WAITS FOR THE ONE BEFORE IT TO EXIT CLEANLY
+        shellSteps = [('mkdir -p "' + destPath + '"',
+                       "Failed to create path: " + destPath,
+                       None),
+                      # Copy non-VMDK files from source VM to destination VM
+                      ('find "' + path + '/' + srcVm + '" -maxdepth 1 -type f | grep -v ".vmdk"' +
+                       ' | while read file; do cp "$file" "' + destPath + '" || exit 1; done',
+                       "Failed to copy non-vmdk files.",
+                       "Copied all non-vmdk files to: " + destPath),
+                      # Copy VMDK files from source VM to destination VM
+                      ('vmkfstools -i "' + path + '/' + srcVmdk + '" -d ' + diskFormat + ' "' +
+                       destPath + '/' + destVmdk + '"',
+                       "Failed to clone vmdk image.",
+                       "Successfully cloned vmdk image."),
+                      ('vim-cmd solo/registervm "' + destPath + '/' + srcVm + '.vmx" "' + destVm + '"',
+                       "Failed to register clone as " + destVm + ".",
+                       "Successfully registered clone as " + destVm + ".")]
+        for shellCmd, failMsg, successMsg in shellSteps:
+            cmdResult = self.runShellCommand(shellCmd)
+            if cmdResult is None or cmdResult[0] != 0:
+                self.logMsg(failMsg)
+                if cmdResult is not None:
+                    if "Failed to lock" in cmdResult[2] or "Failed to lock" in cmdResult[1]:
+                        self.logMsg("Failed to obtain lock during clone.")
+                    self.logMsg("SYSTEM ERROR: " + (cmdResult[2] or cmdResult[1]).strip())
+                return False
+            if successMsg is not None:
+                self.logMsg(successMsg)
+        return True
+
+    def cloneMany(self, srcVm, destVmList, snapshotName = None, maxConcurrent = 8, powerOn = False, timeout = None):
+        """
+        MAKES A LINKED CLONE OF srcVm (AN esxiVm OR A UNIQUE VM NAME) FOR EVERY NAME IN
+        destVmList, UP TO maxConcurrent CloneVM_Tasks AT A TIME.  EACH CLONE GETS NEW CHILD DISKS
+        (diskMoveType createNewChildDiskBacking) ON TOP OF THE DISKS OF snapshotName (THE
+        CURRENT SNAPSHOT IF None), SO IT TAKES SECONDS AND ALMOST NO STORAGE NO MATTER HOW MANY
+        DISKS OR DATASTORES THE SOURCE HAS.  CLONES GO IN THE SOURCE'S FOLDER AND RESOURCE POOL
+        AND INHERIT ITS GUEST CREDENTIALS.  CloneVM_Task NEEDS vCenter; A STANDALONE ESXi HOST
+        REFUSES IT.
+        RETURNS {destVmName: NEW esxiVm, OR False IF THAT CLONE FAILED}
+        """
+        resultDict = dict((i, False) for i in destVmList)
+        srcEsxiVm = self.__resolveVm(srcVm)
+        if srcEsxiVm == None:
+            return resultDict
+        if snapshotName == None:
+            snapshotTree = srcEsxiVm.getSnapshotIndex(True).currentSnapshot
+        else:
+            snapshotTree = srcEsxiVm.getSnapshotIndex(True).findByName(snapshotName)
+        if snapshotTree == None:
+            self.logMsg("[ERROR]: " + srcEsxiVm.vmName + " HAS NO SNAPSHOT " + str(snapshotName) + " TO LINK CLONES TO")
+            return resultDict
+        if timeout == None:
+            timeout = self.taskTimeout
+        srcVmObject = srcEsxiVm.vmObject
+        relocateSpec = vim.vm.RelocateSpec(diskMoveType='createNewChildDiskBacking',
+                                           pool=srcVmObject.resourcePool)
+        cloneSpec = vim.vm.CloneSpec(location=relocateSpec,
+                                     powerOn=powerOn,
+                                     template=False,
+                                     snapshot=snapshotTree.snapshot)
+        cloneFolder = srcVmObject.parent
+        self.logMsg("LINKED CLONING " + str(len(destVmList)) + " VMS FROM " + srcEsxiVm.vmName + " AT SNAPSHOT " + snapshotTree.name)
+        handleDict = runTaskJobs(self.getTaskTracker(),
+                                 list(destVmList),
+                                 lambda destVm: srcVmObject.CloneVM_Task(folder=cloneFolder, name=destVm, spec=cloneSpec),
+                                 maxConcurrent,
+                                 timeout)
+        # THE NEW VMS ARE NOT IN THE INVENTORY CACHE YET; THE FIRST LOOKUP RELOADS IT ONCE
+        self.invalidate()
+        for destVm, handle in handleDict.items():
+            newVm = self.adoptClone(handle, srcEsxiVm, destVm)
+            if newVm == None:
+                continue
+            resultDict[destVm] = newVm
+            self.logMsg("CLONED " + destVm + " FROM " + srcEsxiVm.vmName)
+        return resultDict
 
-        # Make destination directory
+    def cloneFull(self, srcVm, destVm, thinProvision = True, destDatastore = None, maxConcurrent = 8,
+                  timeout = 60*60):
+        """
+        MAKES A FULL COPY OF srcVm (AN esxiVm OR A UNIQUE VM NAME, POWERED OFF) NAMED destVm
+        WITHOUT SSH, SO IT WORKS ON LOCKED-DOWN HOSTS AND THROUGH vCenter ALIKE:
+            MakeDirectory            [destDatastore] destVm
+            CopyDatastoreFile_Task   THE .vmx, .nvram AND .vmxf
+            CopyVirtualDisk_Task     EVERY DISK, WHEREVER IT LIVES, AS destVm.vmdk, destVm_1.vmdk...
+            RegisterVM_Task          IN THE SOURCE'S FOLDER AND RESOURCE POOL
+            ReconfigVM_Task          POINTS THE NEW VM AT ITS OWN DISKS AND GIVES IT A NEW UUID
+        THE FILE AND DISK COPIES ALL RUN AT ONCE (UP TO maxConcurrent), SO THE CLONE TAKES ABOUT
+        AS LONG AS THE BIGGEST DISK.  destDatastore DEFAULTS TO THE ONE HOLDING THE SOURCE .vmx.
+        IF ANYTHING FAILS, THE NEW DIRECTORY IS DELETED.  RETURNS THE NEW esxiVm OR False.
+        """
+        srcEsxiVm = self.__resolveVm(srcVm)
+        if srcEsxiVm == None:
+            return False
+        srcVmObject = srcEsxiVm.vmObject
+        if srcEsxiVm.getVmProperty('runtime.powerState') != vim.VirtualMachinePowerState.poweredOff:
+            self.logMsg("[ERROR]: POWER OFF " + srcEsxiVm.vmName + " BEFORE CLONING IT")
+            return False
+        content = self.connection.content
+        datacenter = self.__findDatacenter(srcVmObject)
+        vmxDatastore, vmxPath = splitDatastorePath(srcVmObject.config.files.vmPathName)
+        if destDatastore == None:
+            destDatastore = vmxDatastore
+        destDir = "[" + destDatastore + "] " + destVm
         try:
-            session.exec_command('mkdir -p ' + path + "/" + destVm)
-        except paramiko.SSHException:
-            self.logMsg("Failed to create path: " + path + "/" + destVm)
-            result = False
+            content.fileManager.MakeDirectory(name=destDir, datacenter=datacenter, createParentDirectories=True)
+        except vim.fault.FileAlreadyExists:
+            self.logMsg("[ERROR]: " + destDir + " ALREADY EXISTS")
+            return False
+        except Exception as e:
+            self.logMsg("[ERROR]: UNABLE TO CREATE " + destDir)
+            self.logMsg("SYSTEM ERROR: " + str(e))
+            return False
 
-        if result:
-            # Copy non-VMDK files from source VM to destination VM
-            try:
-                session.exec_command('find "' + path + '/' + srcVm +
-                                     '" -maxdepth 1 -type f | grep -v ".vmdk"' +
-                                     ' | while read file; do cp "$file" "' + path +
-                                     '/' + destVm + '"; done')
-                self.logMsg("Copied all non-vmdk files to: " + path + '/' + destVm)
-            except paramiko.SSHException:
-                self.logMsg("Failed to copy non-vmdk files.")
-                result = False
-
-        if result:
-            # Copy VMDK files from source VM to destination VM
-            try:
-                destVmdk = srcVmdk.split('/')[-1]
-                if thinProvision:
-                    stdin, stdout, stderr = session.exec_command('vmkfstools -i "' + path + '/' + srcVmdk + '" -d thin "' +
-                                                                 path + '/' + destVm + '/' + destVmdk + '"')
-                else:
-                    stdin, stdout, stderr = session.exec_command('vmkfstools -i "' + path + '/' + srcVmdk + '" -d zeroedthick "' +
-                                                                 path + '/' + destVm + '/' + destVmdk + '"')
-                output = stdout.read()
-                if "Failed to clone disk" in output:
-                    self.logMsg("Failed to clone remote image.")
-                    result = False
-                if "Failed to clone disk" in output:
-                    self.logMsg("Failed to obtain lock during clone.")
-                    result = False
-            except paramiko.SSHException:
-                self.logMsg("Failed to clone vmdk image.")
-                result = False
-
-        if result:
-            self.logMsg("Successfully cloned vmdk image.")
+        # EACH COPY IS (KIND, SOURCE, DESTINATION, VirtualDisk OR None); JOBS ARE INDEXES INTO THIS
+        copyList = []
+        vmxName = None
+        for fileInfo in srcVmObject.layoutEx.file:
+            if fileInfo.type in ['config', 'nvram', 'extendedConfig']:
+                fileName = fileInfo.name.split('/')[-1]
+                copyList.append(('file', fileInfo.name, destDir + "/" + fileName, None))
+                if fileInfo.type == 'config':
+                    vmxName = destDir + "/" + fileName
+        controllerDict = dict((i.key, i) for i in srcVmObject.config.hardware.device
+                              if isinstance(i, vim.vm.device.VirtualController))
+        diskList = [i for i in srcVmObject.config.hardware.device if isinstance(i, vim.vm.device.VirtualDisk)]
+        for diskIndex, diskDevice in enumerate(diskList):
+            if diskIndex == 0:
+                diskName = destDir + "/" + destVm + ".vmdk"
+            else:
+                diskName = destDir + "/" + destVm + "_" + str(diskIndex) + ".vmdk"
+            copyList.append(('disk', diskDevice.backing.fileName, diskName, diskDevice))
+        if vmxName == None:
+            self.logMsg("[ERROR]: UNABLE TO FIND THE .vmx FILE OF " + srcEsxiVm.vmName)
+            self.__deleteDatastoreDir(destDir, datacenter)
+            return False
+
+        def startCopy(copyIndex):
+            copyKind, srcName, dstName, diskDevice = copyList[copyIndex]
+            self.logMsg("COPYING " + srcName + " TO " + dstName)
+            if copyKind == 'file':
+                return content.fileManager.CopyDatastoreFile_Task(sourceName=srcName,
+                                                                  sourceDatacenter=datacenter,
+                                                                  destinationName=dstName,
+                                                                  destinationDatacenter=datacenter,
+                                                                  force=False)
+            if thinProvision:
+                diskType = 'thin'
+            else:
+                diskType = 'preallocated'
+            diskSpec = vim.VirtualDiskManager.VirtualDiskSpec(diskType=diskType,
+                                                              adapterType=diskAdapterType(controllerDict.get(diskDevice.controllerKey)))
+            return content.virtualDiskManager.CopyVirtualDisk_Task(sourceName=srcName,
+                                                                   sourceDatacenter=datacenter,
+                                                                   destName=dstName,
+                                                                   destDatacenter=datacenter,
+                                                                   destSpec=diskSpec,
+                                                                   force=False)
+
+        self.logMsg("CLONING " + srcEsxiVm.vmName + " TO " + destDir + ": " + str(len(diskList)) + " DISKS, " + \
+                    str(len(copyList) - len(diskList)) + " OTHER FILES")
+        handleDict = runTaskJobs(self.getTaskTracker(), list(range(len(copyList))), startCopy, maxConcurrent, timeout)
+        copyFailed = False
+        for copyIndex, handle in handleDict.items():
+            if handle == None or not handle.succeeded():
+                if handle != None:
+                    self.logMsg("[ERROR]: COPY TO " + copyList[copyIndex][2] + " " + handle.state.upper() + ": " + handle.errorMsg())
+                copyFailed = True
+        if copyFailed:
+            self.__deleteDatastoreDir(destDir, datacenter)
+            return False
+
+        registerHandle = self.trackTask(srcVmObject.parent.RegisterVM_Task(path=vmxName,
+                                                                           name=destVm,
+                                                                           asTemplate=False,
+                                                                           pool=srcVmObject.resourcePool),
+                                        timeout)
+        registerHandle.wait()
+        if not registerHandle.succeeded():
+            self.logMsg("[ERROR]: UNABLE TO REGISTER " + vmxName + ": " + registerHandle.errorMsg())
+            self.__deleteDatastoreDir(destDir, datacenter)
+            return False
+        newVmObject = registerHandle.taskResult
+
+        # THE COPIED .vmx STILL NAMES THE SOURCE'S DISKS; SWAP EACH ONE FOR ITS COPY IN PLACE
+        deviceChanges = []
+        for copyKind, srcName, dstName, diskDevice in copyList:
+            if copyKind != 'disk':
+                continue
+            deviceChanges.append(vim.vm.device.VirtualDeviceSpec(operation='remove', device=diskDevice))
+            newDisk = vim.vm.device.VirtualDisk(key=-diskDevice.key,
+                                                controllerKey=diskDevice.controllerKey,
+                                                unitNumber=diskDevice.unitNumber,
+                                                capacityInKB=diskDevice.capacityInKB,
+                                                backing=vim.vm.device.VirtualDisk.FlatVer2BackingInfo(fileName=dstName,
+                                                                                                      diskMode=diskDevice.backing.diskMode,
+                                                                                                      thinProvisioned=thinProvision))
+            deviceChanges.append(vim.vm.device.VirtualDeviceSpec(operation='add', device=newDisk))
+        configSpec = vim.vm.ConfigSpec(deviceChange=deviceChanges,
+                                       extraConfig=[vim.option.OptionValue(key='uuid.action', value='create')])
+        reconfigHandle = self.trackTask(newVmObject.ReconfigVM_Task(spec=configSpec), timeout)
+        reconfigHandle.wait()
+        if not reconfigHandle.succeeded():
+            self.logMsg("[ERROR]: UNABLE TO ATTACH THE COPIED DISKS TO " + destVm + ": " + reconfigHandle.errorMsg())
             try:
-                session.exec_command('vim-cmd solo/registervm ' + path + '/' + destVm + '/' +
-                                     srcVm + '.vmx ' + destVm)
-                self.logMsg("Successfully registered clone as " + destVm + ".")
-            except paramiko.SSHException:
-                self.logMsg("Failed to register clone as " + destVm + ".")
-                result = False
+                newVmObject.UnregisterVM()
+            except Exception:
+                pass
+            self.__deleteDatastoreDir(destDir, datacenter)
+            return False
+        self.invalidate()
+        newVm = self.adoptClone(registerHandle, srcEsxiVm, destVm)
+        self.logMsg("CLONED " + srcEsxiVm.vmName + " TO " + destVm)
+        return newVm
+
+    def adoptClone(self, handle, srcEsxiVm, cloneName, cloneKind = "CLONE"):
+        """
+        TURNS THE taskHandle OF A CLONE (OR REGISTER) TASK INTO THE NEW esxiVm, WITH srcEsxiVm'S
+        GUEST CREDENTIALS.  IF handle IS None (THE TASK NEVER STARTED) OR THE TASK FAILED, THAT
+        IS LOGGED AND WE RETURN None.  SHARED BY cloneMany, cloneFull AND esxiVm.instantClone.
+        """
+        if handle == None:
+            self.logMsg("[ERROR]: " + cloneKind + " " + cloneName + " FAILED TO START")
+            return None
+        if not handle.succeeded():
+            self.logMsg("[ERROR]: " + cloneKind + " " + cloneName + " " + handle.state.upper() + ": " + handle.errorMsg())
+            return None
+        newVm = self.getVmByMoref(handle.taskResult)
+        if newVm == None:
+            newVm = esxiVm(self, handle.taskResult)
+        newVm.setUsername(srcEsxiVm.vmUsername)
+        newVm.setPassword(srcEsxiVm.vmPassword)
+        return newVm
+
+    def __deleteDatastoreDir(self, dirName, datacenter):
+        self.logMsg("REMOVING " + dirName)
+        try:
+            self.waitForTask(self.connection.content.fileManager.DeleteDatastoreFile_Task(name=dirName,
+                                                                                          datacenter=datacenter))
+        except Exception as e:
+            self.logMsg("[WARNING]: UNABLE TO REMOVE " + dirName + ": " + str(e))
 
-        session.close()
-        return result
+    def __findDatacenter(self, vmodlObject):
+        """
+        THE DATACENTER AN INVENTORY OBJECT LIVES IN (ESXi HAS EXACTLY ONE, ha-datacenter)
+        """
+        parentObject = vmodlObject.parent
+        while parentObject != None and not isinstance(parentObject, vim.Datacenter):
+            parentObject = parentObject.parent
+        return parentObject
+
+    def __resolveVm(self, vm):
+        """
+        TAKES AN esxiVm OR A VM NAME AND RETURNS THE esxiVm, OR None (LOGGED) IF THE NAME DOES
+        NOT MATCH EXACTLY ONE VM
+        """
+        if isinstance(vm, esxiVm):
+            return vm
+        vmList = self.getVmsByName(vm)
+        if len(vmList) == 1:
+            return vmList[0]
+        if len(vmList) == 0:
+            self.logMsg("[ERROR]: NO VM NAMED " + str(vm))
+        else:
+            self.logMsg("[ERROR]: " + str(len(vmList)) + " VMS ARE NAMED " + str(vm))
+        return None
 
     def __copyOvfTool(self):
         # TODO: Detect if this version of ovftool is already present on remote server, then return true
@@ -344,53 +1302,73 @@ class esxiServer:
             self.logMsg("and place it in ovfToolsPath: " + ovfToolsPath)
             return False
 
-        session = self.__loginToEsx()
-        if session is not None:
-            sftp = session.open_sftp()
-            sftp.put(ovfToolsPath, "/tmp/ovftool.tgz")
-            session.close()
+        try:
+            sftp = getSshPool().openSftp(self.hostname, self.username, self.password)
+            try:
+                sftp.put(ovfToolsPath, "/tmp/ovftool.tgz")
+            finally:
+                sftp.close()
             return True
-
+        except (paramiko.SSHException, IOError, socket.error) as e:
+            self.logMsg("Failed to copy ovftool to " + self.hostname + ": " + str(e))
         return False
 
-    def __deployOvfTool(self, session):
+    def __deployOvfTool(self):
         # Clear any previous files/directories
-        session.exec_command('rm -rf /tmp/ovftool*')
+        if self.__runShellStep('rm -rf /tmp/ovftool*', "Failed to clear old OVFTool files") is False:
+            return False
 
         # SCP the OVF tool to the source server
         if self.__copyOvfTool() is False:
             return False
 
-        try:
-            # Deploy the OVF tool
-            session.exec_command('mkdir /tmp/ovftool')
-            session.exec_command('tar xf /tmp/ovftool.tgz -C /tmp/ovftool')
-
-            # Confirm OVF tool deployed properly
-            session.exec_command('/tmp/ovftool/ovftool --version')
-        except paramiko.SSHException:
-            self.logMsg("Failed to deploy OVFTool")
-
-    def __toggleFirewallRules(self, session, enabled=False):
-        prompt = ':~]'
-        session.expect(prompt)
-
-        for service in ['sshClient', 'httpClient']:
-            try:
-                session.exec_command('esxcli network firewall ruleset set -e ' + str(enabled).lower() +
-                                     ' -r ' + service)
-            except paramiko.SSHException:
-                self.logMsg("Failed to change firewall for: " + service)
+        # Deploy the OVF tool, then confirm it deployed properly
+        for shellCmd in ['mkdir /tmp/ovftool',
+                         'tar xf /tmp/ovftool.tgz -C /tmp/ovftool',
+                         '/tmp/ovftool/ovftool --version']:
+            if self.__runShellStep(shellCmd, "Failed to deploy OVFTool") is False:
+                return False
+        return True
 
-    def __loginToEsx(self):
-        session = paramiko.SSHClient()
-        session.load_system_host_keys()
-        session.set_missing_host_key_policy(paramiko.client.AutoAddPolicy)
+    def __getFirewallRules(self, serviceList):
+        # Returns {ruleset: enabled} for every ruleset in serviceList, or None if we cannot tell
+        cmdResult = self.runShellCommand('esxcli network firewall ruleset list')
+        if cmdResult is None or cmdResult[0] != 0:
+            self.logMsg("Failed to read firewall rulesets")
+            return None
+        ruleStates = {}
+        for outputLine in cmdResult[1].splitlines():
+            lineParts = outputLine.split()
+            if len(lineParts) == 2 and lineParts[0] in serviceList and lineParts[1] in ['true', 'false']:
+                ruleStates[lineParts[0]] = (lineParts[1] == 'true')
+        for service in serviceList:
+            if service not in ruleStates:
+                self.logMsg("Firewall ruleset not found: " + service)
+                return None
+        return ruleStates
+
+    def __toggleFirewallRules(self, enabled, serviceList):
+        retVal = True
+        for service in serviceList:
+            if not self.__runShellStep('esxcli network firewall ruleset set -e ' + str(enabled).lower() +
+                                       ' -r ' + service,
+                                       "Failed to change firewall for: " + service):
+                retVal = False
+        return retVal
 
+    def runShellCommand(self, command, timeout = None, callback = None):
+        """
+        RUNS command IN A SHELL ON THE ESXi HOST OVER THE PROCESS-WIDE SSH POOL (ONE LOGIN PER
+        HOST, ONE CHANNEL PER COMMAND; SEE sshPool) AND WAITS FOR IT TO EXIT.  callback(streamName,
+        text) GETS stdout/stderr AS IT ARRIVES.  RETURNS (exitCode, stdout, stderr), WITH
+        exitCode None IF timeout SECONDS WENT BY, OR None IF WE COULD NOT GET THERE AT ALL.
+        """
+        if self.password is None:
+            self.logMsg("Failed to authenticate.")
+            return None
         try:
-            if self.password is not None:
-                session.connect(hostname=self.hostname, username=self.username, password=self.password)
-            return session
+            return getSshPool().runCommand(self.hostname, self.username, self.password, command,
+                                           timeout=timeout, callback=callback)
         except paramiko.BadHostKeyException:
             self.logMsg("Rejected for changed host key.")
         except paramiko.AuthenticationException:
@@ -401,6 +1379,19 @@ class esxiServer:
             self.logMsg("Failed to connect, host cannot be reached.")
         return None
 
+    def __runShellStep(self, command, failMsg, timeout = None):
+        """
+        runShellCommand FOR STEPS THAT EITHER WORK OR DO NOT: True IF command EXITED 0, OTHERWISE
+        failMsg AND WHAT IT SAID ARE LOGGED AND WE RETURN False
+        """
+        cmdResult = self.runShellCommand(command, timeout)
+        if cmdResult is not None and cmdResult[0] == 0:
+            return True
+        self.logMsg(failMsg)
+        if cmdResult is not None:
+            self.logMsg("SYSTEM ERROR: " + (cmdResult[2] or cmdResult[1]).strip())
+        return False
+
     def __findVmdkPath(self, srcVm):
         # srcVm could be a name (str), a vmId (int), or a vm object (vmObject)
         # destVm must be a name (what about workstation?  where will I store the new VM?)
@@ -440,15 +1431,18 @@ class esxiServer:
         src = None
 
         for device in vmObject.config.hardware.device:
-           if str(type(device)) == "<class 'pyVmomi.VmomiSupport.vim.vm.device.VirtualDisk'>":
+           if isinstance(device, vim.vm.device.VirtualDisk):
                if src == None:
                    src = device.backing.fileName
                else:
                    self.logMsg("VM has multiple disks. Clone not supported.")
                    return None, None
 
-        (datastore, srcVmdk) = src.split(" ")
-        datastore = datastore[1:-1]
+        if src == None:
+            self.logMsg("VM has no disks. Clone not supported.")
+            return None, None
+
+        (datastore, srcVmdk) = splitDatastorePath(src)
 
         return datastore, srcVmdk
 
@@ -471,23 +1465,67 @@ class esxiServer:
                 return datastore.mountInfo.path
 
 
+def splitDatastorePath(datastorePath):
+    """
+    '[datastore1] dir/file.vmdk' -> ('datastore1', 'dir/file.vmdk')
+    """
+    datastoreName, filePath = datastorePath.split("] ", 1)
+    return datastoreName.lstrip('['), filePath
+
+
+def diskAdapterType(controllerDevice):
+    """
+    THE VirtualDiskManager adapterType FOR A DISK ON controllerDevice; ANYTHING THAT IS NOT IDE OR
+    BUSLOGIC GETS lsiLogic, WHICH ONLY SETS A HINT IN THE DISK DESCRIPTOR
+    """
+    if isinstance(controllerDevice, vim.vm.device.VirtualIDEController):
+        return 'ide'
+    if isinstance(controllerDevice, vim.vm.device.VirtualBusLogicController):
+        return 'busLogic'
+    return 'lsiLogic'
+
+
 class esxiVm:
-    def __init__(self, serverObject, vmObject):
+    def __init__(self, serverObject, vmObject, vmProperties = None):
+        """
+        vmProperties IS AN OPTIONAL DICTIONARY OF PROPERTY PATHS TO VALUES THAT WERE ALREADY
+        PULLED FROM THE SERVER (SEE esxiServer.enumerateVms); WHEN WE ARE HANDED IT WE DO NOT GO
+        BACK TO THE SERVER, AND A VALUE IT LACKS STAYS None.
+        """
         self.server =           serverObject
         self.vmObject =         vmObject
         self.procList =         []
+        self.processTable =     processTable()
         self.revertSnapshots =  []
         self.snapshotList =     []
+        self.snapshotIndex =    None
         self.testVm =           False
-        self.vmIdentifier =     vmObject.summary.config.vmPathName
         self.vmIp =             None
-        self.vmName =           vmObject.summary.config.name
-        self.vmOS =             vmObject.summary.config.guestFullName
         self.vmPassword =       ""
         self.vmUsername =       ""
         self.uploadDir =        ""
         self.payloadList =      []
         self.resultDict =       {}
+        self.lastFileHash =     None
+        self.setVmProperties(vmProperties)
+
+    def setVmProperties(self, vmProperties = None):
+        """
+        REFRESHES THE NAME/PATH/OS FIELDS, EITHER FROM PREFETCHED PROPERTIES OR STRAIGHT FROM
+        THE SERVER IF WE WERE NOT HANDED THEM.  A PREFETCHED VALUE THE SERVER LEFT UNSET (A VM
+        WITH A BROKEN CONFIG CAN BE MISSING ITS guestFullName) STAYS None RATHER THAN COSTING
+        THREE MORE ROUND TRIPS.
+        """
+        if vmProperties is None:
+            self.vmProperties = {}
+            self.vmIdentifier = self.vmObject.summary.config.vmPathName
+            self.vmName =       self.vmObject.summary.config.name
+            self.vmOS =         self.vmObject.summary.config.guestFullName
+        else:
+            self.vmProperties = vmProperties
+            self.vmIdentifier = vmProperties.get('summary.config.vmPathName')
+            self.vmName =       vmProperties.get('summary.config.name')
+            self.vmOS =         vmProperties.get('summary.config.guestFullName')
         if self.vmOS is not None:
             if '64-bit' in self.vmOS:
                 self.arch = 'x64'
@@ -509,14 +1547,10 @@ class esxiVm:
             self.server.logMsg(self.vmName + " IS POWERED OFF")
             return False
         else:
-            attempts = 60
-            tools_ready = False
-            for i in range(attempts):
-                if self.checkTools(True) != 'TOOLS_NOT_READY':
-                    tools_ready = True
-                    break
-                time.sleep(5)
-                # No tools available return as result.
+            toolsStates = ['toolsOk', 'toolsOld', 'toolsNotInstalled']
+            tools_ready = self.server.waitForCondition(lambda: self.getVmProperty('guest.toolsStatus') in toolsStates,
+                                                       300,
+                                                       5)
             if not tools_ready:
                 self.server.logMsg(self.vmName + " IS POWERED ON TOOLS WERE NOT READY IN TIME")
                 return tools_ready
@@ -544,7 +1578,12 @@ class esxiVm:
         TOOLS_READY:         VMWARE_TOOLS IS READY
         TOOLS_NOT_INSTALLED: VMWARE TOOLS IS NOT READY AND NEVER WILL BE
         """
-        tools_status = self.vmObject.guest.toolsStatus
+        return self.toolsState(self.getVmProperty('guest.toolsStatus'))
+
+    def toolsState(self, tools_status):
+        """
+        TURNS A guest.toolsStatus VALUE INTO ONE OF checkTools' THREE ANSWERS
+        """
         if tools_status == 'toolsNotRunning':
             retVal = 'TOOLS_NOT_READY'
         elif tools_status == 'toolsOld':
@@ -561,23 +1600,26 @@ class esxiVm:
         return retVal
 
     def deleteSnapshot(self, snapshotName):
-        self.getSnapshots()
-        for i in self.snapshotList:
-            if i[0].name == snapshotName:
-                self.server.logMsg("DELETING SNAPSHOT " + snapshotName + " FROM " + self.vmName)
-                return self.waitForTask(i[0].snapshot.RemoveSnapshot_Task(False))
+        snapshotTree = self.__findSnapshot(lambda index: index.findByName(snapshotName, exact=True))
+        if snapshotTree != None:
+            self.server.logMsg("DELETING SNAPSHOT " + snapshotName + " FROM " + self.vmName)
+            return self.waitForTask(snapshotTree.snapshot.RemoveSnapshot_Task(False))
 
     def enumerateSnapshotsRecursively(self, snapshots, snapshot_location):
-        if not snapshots:
-            return
-
-        for snapshot in snapshots:
-            if snapshot_location:
-                current_snapshot_path = snapshot_location + '/' + snapshot.name
+        """
+        KEPT FOR ANYONE STILL CALLING IT; getSnapshots USES snapshotIndex NOW.  DESPITE THE NAME,
+        THIS NO LONGER RECURSES, SO A LONG CHAIN OF SNAPSHOTS CANNOT HIT THE RECURSION LIMIT.
+        """
+        walkStack = [(i, snapshot_location) for i in reversed(snapshots or [])]
+        while len(walkStack) > 0:
+            snapshot, parentPath = walkStack.pop()
+            if parentPath:
+                current_snapshot_path = parentPath + '/' + snapshot.name
             else:
                 current_snapshot_path = snapshot.name
             self.snapshotList.append((snapshot, current_snapshot_path))
-            self.enumerateSnapshotsRecursively(snapshot.childSnapshotList, current_snapshot_path)
+            for childSnapshot in reversed(snapshot.childSnapshotList or []):
+                walkStack.append((childSnapshot, current_snapshot_path))
         return
 
     def getArch(self):
@@ -593,61 +1635,201 @@ class esxiVm:
               if self.vmObject in vmList:
                  return child
 
-    def getFileFromGuest(self, srcFile, dstFile):
-        for i in range(3):
-            self.server.logMsg("ATTEMPTING TO GET " +srcFile)
-            retVal = False
-            if self.checkTools() == 'TOOLS_READY':
-                creds = vim.vm.guest.NamePasswordAuthentication(username=self.vmUsername,
-                                                                password=self.vmPassword)
-                content = self.server.connection.RetrieveContent()
-                try:
-                    file_attribute = vim.vm.guest.FileManager.FileAttributes()
-                    vmFileManager = content.guestOperationsManager.fileManager
-                    ftInfo = vmFileManager.InitiateFileTransferFromGuest(self.vmObject,
-                                                                    creds,
-                                                                    srcFile)
-                    #THIS IS STUPID, BUT THERE IS SOME ASSEMBLY REQUIRED
-                    splitUrl = ftInfo.url.split('*')
-                    realUrl = splitUrl[0] + self.server.hostname + splitUrl[1]
-                    self.server.logMsg(srcFile + " URL = " + realUrl)
-                    self.server.logMsg(srcFile +" SIZE = " + str(ftInfo.size))
-                    resp = requests.get(realUrl, verify=False)
-                    if not resp.status_code == 200:
-                        self.server.logMsg("ERROR GETTING FILE " + \
-                                          srcFile + " FROM " +\
-                                          self.vmName + " HTTP CODE " + \
-                                          str(resp.status_code))
-                    else:
-                        getFile = open(dstFile, 'wb')
-                        getFile.write(resp.content)
-                        getFile.close()
-                        self.server.logMsg("SAVED FILE FROM " + self.vmName + \
-                                          " AS " + dstFile + \
-                                          " HTTP RESPONSE WAS " + str(resp.status_code))
-                        retVal=True
-                except vim.fault.FileNotFound as e:
-                    self.server.logMsg("FAILED TO FIND FILE ON VM: " + srcFile)
+    def getFileFromGuest(self, srcFile, dstFile, callback = None, hashName = None, expectedHash = None,
+                         chunkSize = TRANSFER_CHUNK_SIZE, maxAttempts = 3):
+        """
+        getFileFromGuest DOWNLOADS srcFile FROM THE VM TO dstFile
+        THE DOWNLOAD STREAMS chunkSize BYTES AT A TIME INTO A TEMP FILE NEXT TO dstFile, WHICH IS
+        ONLY RENAMED TO dstFile ONCE IT IS THE SIZE THE GUEST SAID IT WOULD BE (AND, IF
+        expectedHash IS GIVEN, HASHES TO IT), SO dstFile IS NEVER LEFT HALF-WRITTEN.
+        IF hashName (ANY hashlib NAME; sha256 IF ONLY expectedHash IS GIVEN) IS SET, THE HEX
+        DIGEST IS LEFT IN self.lastFileHash.  callback(bytesReceived, totalBytes) REPORTS PROGRESS.
+        BROKEN OR SHORT TRANSFERS AND SERVER-SIDE HTTP ERRORS ARE RETRIED UP TO maxAttempts
+        TIMES; A MISSING FILE, BAD CREDENTIALS OR BROKEN TOOLS ARE NOT.
+        """
+        if expectedHash != None and hashName == None:
+            hashName = 'sha256'
+        self.lastFileHash = None
+        self.server.logMsg("ATTEMPTING TO GET " +srcFile)
+        if self.checkTools() != 'TOOLS_READY':
+            self.server.logMsg("THERE IS A PROBLEM WITH THE VMWARE TOOLS ON " + self.vmName)
+            return False
+        retVal, self.lastFileHash = self.__downloadFile(self.__getFileManager(),
+                                                        self.__getGuestCreds(),
+                                                        srcFile,
+                                                        dstFile,
+                                                        callback,
+                                                        hashName,
+                                                        expectedHash,
+                                                        chunkSize,
+                                                        maxAttempts)
+        return retVal
+
+    def getFilesFromGuest(self, fileMap, maxConcurrent = 8, callback = None, maxAttempts = 3):
+        """
+        DOWNLOADS MANY FILES AT ONCE; fileMap IS {GUEST PATH: LOCAL PATH}.  TOOLS ARE CHECKED
+        ONCE, MISSING LOCAL DIRECTORIES ARE CREATED, AND UP TO maxConcurrent DOWNLOADS RUN AT A
+        TIME OVER THE SERVER'S KEEP-ALIVE SESSION, EACH WITH getFileFromGuest'S CHECKS AND
+        RETRIES.  callback(GUEST PATH, bytesReceived, totalBytes) REPORTS PROGRESS.
+        RETURNS {GUEST PATH: True/False}
+        """
+        resultDict = dict((i, False) for i in fileMap)
+        self.server.logMsg("ATTEMPTING TO GET " + str(len(fileMap)) + " FILES FROM " + self.vmName)
+        if len(fileMap) == 0:
+            return resultDict
+        if self.checkTools() != 'TOOLS_READY':
+            self.server.logMsg("THERE IS A PROBLEM WITH THE VMWARE TOOLS ON " + self.vmName)
+            return resultDict
+        pendingList = []
+        for srcFile, dstFile in fileMap.items():
+            dstDir = os.path.dirname(os.path.abspath(dstFile))
+            try:
+                if not os.path.isdir(dstDir):
+                    os.makedirs(dstDir)
+            except OSError as e:
+                if not os.path.isdir(dstDir):
+                    self.server.logMsg("[ERROR]: UNABLE TO CREATE " + dstDir)
                     self.server.logMsg("SYSTEM ERROR: " + str(e))
-                    pass
-                except Exception as e:
-                    self.server.logMsg("UNPREDICTED EXCEPTION:\n" + str(e))
-                    pass
-            else:
-                self.server.logMsg("THERE IS A PROBLEM WITH THE VMWARE TOOLS ON " + self.vmName)
-            return retVal
+                    continue
+            pendingList.append(srcFile)
+        vmFileManager = self.__getFileManager()
+        creds = self.__getGuestCreds()
+
+        def getOneFile(srcFile):
+            fileCallback = None
+            if callback != None:
+                fileCallback = lambda doneBytes, totalBytes: callback(srcFile, doneBytes, totalBytes)
+            return self.__downloadFile(vmFileManager, creds, srcFile, fileMap[srcFile], fileCallback,
+                                       None, None, TRANSFER_CHUNK_SIZE, maxAttempts)[0]
+        resultDict.update(runParallel(pendingList, getOneFile, maxConcurrent))
+        self.server.logMsg("GOT " + str(sum(1 for i in resultDict.values() if i)) + " OF " + \
+                           str(len(fileMap)) + " FILES FROM " + self.vmName)
+        return resultDict
+
+    def __downloadFile(self, vmFileManager, creds, srcFile, dstFile, callback, hashName, expectedHash,
+                       chunkSize, maxAttempts):
+        """
+        THE RETRY LOOP SHARED BY getFileFromGuest AND getFilesFromGuest; RETURNS (SUCCEEDED, HEX DIGEST)
+        """
+        for i in range(maxAttempts):
+            if i > 0:
+                self.server.logMsg("[WARNING]: RETRYING DOWNLOAD OF " + srcFile + " FROM " + self.vmName)
+                time.sleep(2 ** i)
+            retVal, retryable, fileHash = self.__downloadFileOnce(vmFileManager, creds, srcFile, dstFile,
+                                                                  callback, hashName, expectedHash, chunkSize)
+            if retVal or not retryable:
+                return retVal, fileHash
+        return False, None
+
+    def __downloadFileOnce(self, vmFileManager, creds, srcFile, dstFile, callback, hashName, expectedHash, chunkSize):
+        """
+        ONE DOWNLOAD ATTEMPT; RETURNS (SUCCEEDED, WORTH RETRYING, HEX DIGEST)
+        """
+        try:
+            ftInfo = vmFileManager.InitiateFileTransferFromGuest(self.vmObject,
+                                                                 creds,
+                                                                 srcFile)
+        except vim.fault.FileNotFound as e:
+            self.server.logMsg("FAILED TO FIND FILE ON VM: " + srcFile)
+            self.server.logMsg("SYSTEM ERROR: " + str(e))
+            return False, False, None
+        except vim.fault.InvalidGuestLogin as e:
+            self.server.logMsg("INCORRECT USERTNAME/PASSWORD PROVIDED FOR " + self.vmName)
+            self.server.logMsg("SYSTEM ERROR: " + str(e))
+            return False, False, None
+        except Exception as e:
+            self.server.logMsg("UNPREDICTED EXCEPTION:\n" + str(e))
+            return False, True, None
+        realUrl = fixTransferUrl(self.server.hostname, ftInfo.url)
+        self.server.logMsg(srcFile + " URL = " + realUrl)
+        self.server.logMsg(srcFile +" SIZE = " + str(ftInfo.size))
+        hashObj = None
+        if hashName != None:
+            try:
+                hashObj = hashlib.new(hashName)
+            except ValueError:
+                self.server.logMsg("[ERROR]: UNKNOWN HASH " + str(hashName))
+                return False, False, None
+        try:
+            resp = self.server.getHttpSession().get(realUrl, stream=True)
+            try:
+                if not resp.status_code == 200:
+                    self.server.logMsg("[ERROR]: ERROR GETTING FILE " + \
+                                      srcFile + " FROM " +\
+                                      self.vmName + " HTTP CODE " + \
+                                      str(resp.status_code))
+                    return False, resp.status_code >= 500, None
+                tempFile, bytesReceived = streamToFile(resp, dstFile, chunkSize, callback, hashObj)
+            finally:
+                resp.close()
+        except (requests.exceptions.RequestException, IOError, OSError) as e:
+            self.server.logMsg("[ERROR]: DOWNLOAD OF " + srcFile + " FROM " + self.vmName + " FAILED")
+            self.server.logMsg("SYSTEM ERROR: " + str(e))
+            return False, True, None
+        if bytesReceived != ftInfo.size:
+            removeQuietly(tempFile)
+            self.server.logMsg("[ERROR]: GOT " + str(bytesReceived) + " OF " + str(ftInfo.size) + \
+                               " BYTES OF " + srcFile + " FROM " + self.vmName)
+            return False, True, None
+        fileHash = None
+        if hashObj != None:
+            fileHash = hashObj.hexdigest()
+            self.server.logMsg(srcFile + " " + hashName.upper() + " = " + fileHash)
+            if expectedHash != None and fileHash.lower() != expectedHash.lower():
+                removeQuietly(tempFile)
+                self.server.logMsg("[ERROR]: " + hashName.upper() + " MISMATCH FOR " + srcFile + \
+                                   " FROM " + self.vmName + "; EXPECTED " + expectedHash)
+                return False, True, None
+        try:
+            replaceFile(tempFile, dstFile)
+        except OSError as e:
+            removeQuietly(tempFile)
+            self.server.logMsg("[ERROR]: UNABLE TO SAVE " + dstFile)
+            self.server.logMsg("SYSTEM ERROR: " + str(e))
+            return False, False, None
+        self.server.logMsg("SAVED FILE FROM " + self.vmName + \
+                          " AS " + dstFile + \
+                          " HTTP RESPONSE WAS " + str(resp.status_code))
+        return True, False, fileHash
 
     def getSnapshots(self):
         """
-        SEARCHING FOR SNAPSHOTS IS UNPLEASANT
-        SINCE SNAPSHOTS ARE NESTED, RECURSIVE CALLS ARE NECESSARY
+        SEARCHING FOR SNAPSHOTS IS UNPLEASANT; SEE getSnapshotIndex.  THIS FILLS
+        self.snapshotList WITH (vim.vm.SnapshotTree, PATH) ENTRIES, THE WAY IT ALWAYS HAS.
         """
         self.server.logMsg("FINDING SNAPSHOTS FOR " + self.vmName)
-        self.snapshotList = []
-        if hasattr(self.vmObject.snapshot, 'rootSnapshotList'):
-            self.enumerateSnapshotsRecursively(self.vmObject.snapshot.rootSnapshotList, '')
+        self.getSnapshotIndex()
         return
 
+    def getSnapshotIndex(self, direct = False):
+        """
+        RETURNS A snapshotIndex OF THIS VM'S SNAPSHOTS (LOOKUPS BY NAME, PATH AND MOREF, PARENT
+        LINKS AND THE CURRENT SNAPSHOT).  THE INDEX IS ONLY REBUILT WHEN THE VM'S 'snapshot'
+        PROPERTY HAS CHANGED: WITH THE INVENTORY MIRROR RUNNING, THAT COSTS NOTHING UNTIL THE
+        SERVER REPORTS A CHANGE; WITHOUT IT, EVERY READ IS A FRESH COPY, SO IT IS ONE PROPERTY
+        READ AND A REBUILD PER CALL.  direct = True SKIPS THE MIRROR AND ASKS THE SERVER, FOR
+        WHEN THE MIRROR MAY NOT HAVE CAUGHT UP YET.
+        """
+        if direct:
+            snapshotInfo = self.vmObject.snapshot
+        else:
+            snapshotInfo = self.getVmProperty('snapshot')
+        if self.snapshotIndex == None or not self.snapshotIndex.isFor(snapshotInfo):
+            self.snapshotIndex = snapshotIndex(snapshotInfo)
+            self.snapshotList = self.snapshotIndex.snapshotList
+        return self.snapshotIndex
+
+    def __findSnapshot(self, findFn):
+        """
+        RETURNS findFn(snapshotIndex), ASKING THE SERVER DIRECTLY IF THE MIRROR'S COPY CAME UP
+        EMPTY (A SNAPSHOT WE JUST TOOK MAY NOT HAVE REACHED THE MIRROR YET)
+        """
+        snapshotTree = findFn(self.getSnapshotIndex())
+        mirror = self.server.inventoryMirror
+        if snapshotTree == None and mirror != None and mirror.hasVm(self.vmObject):
+            snapshotTree = findFn(self.getSnapshotIndex(True))
+        return snapshotTree
+
     def getVmIp(self):
         """
         IT IS POSSIBLE TO GET NO IP ADDRESS IN THE GAP BETWEEN WHEN VMWARE
@@ -655,17 +1837,30 @@ class esxiVm:
         THIS WILL TRY TO GET THE IP ADDRESS FOR 2 MINUTES
         """
         if self.checkTools(True) != 'TOOLS_NOT_INSTALLED':
-            ipAttempts = 120
-            for i in range(ipAttempts):
-                self.vmIp = self.vmObject.summary.guest.ipAddress
-                if self.vmIp != None:
-                    break
-                else:
-                    strAttempt = "(ATTEMPT " + str(i) + " OF " + str(ipAttempts) + ")"
-                    self.server.logMsg(strAttempt + " FAILED TO GET IP ADDRESS FROM " + self.vmName)
-                    time.sleep(1)
+            ipTimeout = 120
+            self.vmIp = self.getVmProperty('guest.ipAddress')
+            if self.vmIp == None:
+                self.server.logMsg("WAITING UP TO " + str(ipTimeout) + " SECONDS FOR AN IP ADDRESS FROM " + self.vmName)
+                self.vmIp = self.server.waitForCondition(lambda: self.getVmProperty('guest.ipAddress'), ipTimeout)
+                if self.vmIp == None:
+                    self.server.logMsg("FAILED TO GET IP ADDRESS FROM " + self.vmName)
         return self.vmIp
 
+    def getVmProperty(self, propertyPath):
+        """
+        READS A PROPERTY LIKE 'runtime.powerState' FROM THE SERVER'S INVENTORY MIRROR WHEN ONE IS
+        RUNNING AND KNOWS ABOUT THIS VM; OTHERWISE, WE ASK THE SERVER.
+        """
+        mirror = self.server.inventoryMirror
+        if mirror != None and mirror.hasVm(self.vmObject):
+            return mirror.getProperty(self.vmObject, propertyPath)
+        retVal = self.vmObject
+        for attribute in propertyPath.split('.'):
+            if retVal == None:
+                break
+            retVal = getattr(retVal, attribute)
+        return retVal
+
     def getVmInterfaces(self):
         """ 
         IT IS POSSIBLE TO GET NO IP ADDRESS IN THE GAP BETWEEN WHEN VMWARE 
@@ -699,14 +1894,66 @@ class esxiVm:
     def getPassword(self):
         return self.vmPassword
 
+    def instantClone(self, cloneName, count = 1, customization = None, maxConcurrent = 8, readyTimeout = 120,
+                     requireIp = False, timeout = None):
+        """
+        FORKS THIS (RUNNING) VM INTO count CHILDREN WITH InstantClone_Task (vSphere 6.7 AND UP).
+        THE CHILDREN START FROM THE PARENT'S MEMORY, SO THERE IS NO BOOT TO WAIT FOR; WE ONLY
+        WAIT (UP TO readyTimeout SECONDS, ALL AT ONCE THROUGH iterVmsReady) FOR THEIR TOOLS TO
+        CHECK IN.  WITH count = 1 THE CHILD IS NAMED cloneName; OTHERWISE cloneName-1,
+        cloneName-2 AND SO ON.  customization IS A DICTIONARY OF guestinfo KEYS AND VALUES (E.G.
+        {'guestinfo.hostname': 'test-1'}) HANDED TO EVERY CHILD, OR A FUNCTION OF THE CHILD'S
+        NAME THAT RETURNS ONE; A SCRIPT IN THE GUEST READS THEM WITH vmtoolsd --cmd "info-get".
+        RETURNS THE LIST OF CHILD esxiVms THAT CAME UP READY; THE REST ARE LOGGED.
+        """
+        if not self.isPoweredOn():
+            self.server.logMsg("[ERROR]: " + self.vmName + " MUST BE RUNNING TO INSTANT CLONE IT")
+            return []
+        if count == 1:
+            nameList = [cloneName]
+        else:
+            nameList = [cloneName + "-" + str(i + 1) for i in range(count)]
+        if timeout == None:
+            timeout = self.server.taskTimeout
+        cloneLocation = vim.vm.RelocateSpec(pool=self.vmObject.resourcePool, folder=self.vmObject.parent)
+
+        def startClone(childName):
+            if callable(customization):
+                guestInfo = customization(childName)
+            else:
+                guestInfo = customization
+            cloneSpec = vim.vm.InstantCloneSpec(name=childName, location=cloneLocation)
+            if guestInfo:
+                cloneSpec.config = [vim.option.OptionValue(key=i, value=j) for i, j in guestInfo.items()]
+            return self.vmObject.InstantClone_Task(spec=cloneSpec)
+
+        self.server.logMsg("INSTANT CLONING " + str(len(nameList)) + " VMS FROM " + self.vmName)
+        handleDict = runTaskJobs(self.server.getTaskTracker(), nameList, startClone, maxConcurrent, timeout)
+        self.server.invalidate()
+        childList = []
+        for childName in nameList:
+            childVm = self.server.adoptClone(handleDict.get(childName), self, childName, "INSTANT CLONE")
+            if childVm != None:
+                childList.append(childVm)
+        readyList = list(self.server.iterVmsReady(childList, readyTimeout, requireIp))
+        return [i for i in childList if i in readyList]
+
     def isTestVm(self):
         return self.testVm
 
+    def isWindows(self):
+        """
+        GOES BY THE GUEST OS THE VM IS CONFIGURED FOR, OR ITS NAME IF WE DO NOT KNOW THAT
+        """
+        if self.vmOS:
+            return 'windows' in self.vmOS.lower()
+        return 'win' in self.vmName.lower()
+
     def isPoweredOff(self):
         return not self.isPoweredOn()
 
     def isPoweredOn(self):
-        if self.vmObject.runtime.powerState == vim.VirtualMachinePowerState.poweredOn:
+        if self.getVmProperty('runtime.powerState') == vim.VirtualMachinePowerState.poweredOn:
             return True
         else:
             return False
@@ -788,11 +2035,10 @@ class esxiVm:
 
     def revertToTestingBase(self):
         self.server.logMsg("RESETTING VM " + self.vmName)
-        self.getSnapshots()
-        for i in self.snapshotList:
-            if 'testing_base' in i[0].name.lower():
-                self.server.logMsg("REVERTING VM TO " + i[0].name)
-                return self.revertToSnapshot(i[0].snapshot)
+        snapshotTree = self.__findSnapshot(lambda index: index.findFirst(lambda name: 'testing_base' in name.lower()))
+        if snapshotTree != None:
+            self.server.logMsg("REVERTING VM TO " + snapshotTree.name)
+            return self.revertToSnapshot(snapshotTree.snapshot)
         return None
 
     def revertToSnapshot(self, snapshotObj):
@@ -800,22 +2046,26 @@ class esxiVm:
 
     def revertToSnapshotByName(self, snapshotName):
         self.server.logMsg("RESETTING VM " + self.vmName)
-        self.getSnapshots()
-        for snapshotObject in self.snapshotList:
-            if snapshotName.strip() == snapshotObject[0].name.strip():
-                self.server.logMsg("REVERTING VM TO " + snapshotObject[0].name)
-                return self.revertToSnapshot(snapshotObject[0].snapshot)
+        snapshotTree = self.__findSnapshot(lambda index: index.findByName(snapshotName))
+        if snapshotTree != None:
+            self.server.logMsg("REVERTING VM TO " + snapshotTree.name)
+            return self.revertToSnapshot(snapshotTree.snapshot)
         return None
 
     def revertMsfVm(self):
-        self.getSnapshots()
-        for i in self.snapshotList:
-            if "PAYLOAD_TESTING-" in i[0].name:
-                self.server.logMsg("REVERTING " + self.vmName + " TO " + i[0].name)
-                self.revertToSnapshot(i[0].snapshot)
-                self.deleteSnapshot(i[0].name)
+        # ONE LOOK AT THE TREE; THE SNAPSHOT OBJECTS STAY VALID AS WE DELETE THEIR SIBLINGS
+        for snapshotTree, snapshotPath in list(self.getSnapshotIndex().snapshotList):
+            if "PAYLOAD_TESTING-" in snapshotTree.name:
+                self.server.logMsg("REVERTING " + self.vmName + " TO " + snapshotTree.name)
+                self.revertToSnapshot(snapshotTree.snapshot)
+                self.server.logMsg("DELETING SNAPSHOT " + snapshotTree.name + " FROM " + self.vmName)
+                self.waitForTask(snapshotTree.snapshot.RemoveSnapshot_Task(False))
 
     def runCmdOnGuest(self, cmdAndArgList):
+        """
+        STARTS cmdAndArgList ON THE GUEST AND RETURNS ITS PID (False IF IT DID NOT START); THE
+        COMMAND IS STILL RUNNING WHEN WE RETURN, SO USE waitForProcess IF YOU NEED IT TO FINISH
+        """
         self.server.logMsg("RUNNING '" + ' '.join(cmdAndArgList) + "' ON " + self.vmName)
         if self.checkTools() == 'TOOLS_READY':
             try:
@@ -827,9 +2077,8 @@ class esxiVm:
                 cmdpid = content.guestOperationsManager.processManager.StartProgramInGuest(vm=self.vmObject,
                                                                                            auth=creds,
                                                                                            spec=cmdspec)
-                retVal = False
-                self.server.logMsg("LAUNCHING '" + ' '.join(cmdAndArgList) + "' ON " + self.vmName)
-                retVal = True
+                self.server.logMsg("LAUNCHED '" + ' '.join(cmdAndArgList) + "' ON " + self.vmName + " AS PID " + str(cmdpid))
+                retVal = cmdpid
             except vim.fault.InvalidGuestLogin as e:
                 self.server.logMsg("INCORRECT USERTNAME/PASSWORD PROVIDED FOR " + self.vmName)
                 self.server.logMsg("SYSTEM ERROR:\n" + str(e))
@@ -849,6 +2098,116 @@ class esxiVm:
             retVal = False
         return retVal
 
+    def listGuestProcesses(self, pidList = None):
+        """
+        ONE ListProcessesInGuest CALL; RETURNS THE vim.vm.guest.ProcessManager.ProcessInfo LIST
+        (ONLY FOR pidList, IF GIVEN, INCLUDING ONES THAT EXITED RECENTLY) OR None IF THE GUEST
+        DID NOT ANSWER.  NO RETRIES; CALLERS THAT POLL WILL ASK AGAIN ANYWAY.
+        """
+        try:
+            processManager = self.server.connection.RetrieveContent().guestOperationsManager.processManager
+            return processManager.ListProcessesInGuest(vm=self.vmObject,
+                                                       auth=self.__getGuestCreds(),
+                                                       pids=pidList)
+        except vim.fault.InvalidGuestLogin as e:
+            self.server.logMsg("[ERROR]: INCORRECT USERNAME/PASSWORD PROVIDED FOR " + self.vmName)
+            self.server.logMsg("SYSTEM ERROR:\n" + str(e))
+        except Exception as e:
+            self.server.logMsg("[WARNING]: UNABLE TO LIST PROCESSES ON " + self.vmName)
+            self.server.logMsg("SYSTEM ERROR:\n" + str(e))
+        return None
+
+    def waitForProcess(self, pid, timeout = 600):
+        """
+        BLOCKS UNTIL GUEST PROCESS pid EXITS (POLLING WITH BACKOFF; SEE iterProcessExits) AND
+        RETURNS ITS EXIT CODE, OR None IF IT IS STILL RUNNING AFTER timeout SECONDS OR THE GUEST
+        HAS FORGOTTEN IT
+        """
+        for vm, exitPid, exitCode, endTime in iterProcessExits([(self, pid)], timeout):
+            self.server.logMsg("PID " + str(pid) + " ON " + self.vmName + " EXITED WITH " + str(exitCode))
+            return exitCode
+        self.server.logMsg("[WARNING]: PID " + str(pid) + " ON " + self.vmName + " STILL RUNNING AFTER " + str(timeout) + " SECONDS")
+        return None
+
+    def runCmdOnGuestWithOutput(self, cmdAndArgList, timeout = 600):
+        """
+        RUNS cmdAndArgList THROUGH THE GUEST'S SHELL WITH ITS OUTPUT REDIRECTED TO TEMP FILES,
+        WAITS UP TO timeout SECONDS FOR IT TO EXIT, AND RETURNS (exitCode, stdout, stderr), OR
+        None IF IT NEVER STARTED.  exitCode IS None IF IT WAS STILL RUNNING AT THE TIMEOUT.
+        """
+        return self.runCmdsOnGuestWithOutput([cmdAndArgList], timeout)[0]
+
+    def runCmdsOnGuestWithOutput(self, cmdList, timeout = 600):
+        """
+        THE BATCH FORM OF runCmdOnGuestWithOutput: ALL THE COMMANDS IN cmdList ARE STARTED AT
+        ONCE (SO THEY RUN SIDE BY SIDE; DO NOT BATCH COMMANDS THAT DEPEND ON EACH OTHER), SHARE
+        ONE GUEST TEMP DIRECTORY, ARE WAITED ON TOGETHER, AND HAVE THEIR OUTPUT DOWNLOADED IN
+        PARALLEL.  RETURNS A LIST OF (exitCode, stdout, stderr) OR None, IN cmdList ORDER.
+        """
+        resultList = [None] * len(cmdList)
+        if len(cmdList) == 0:
+            return resultList
+        if self.checkTools() != 'TOOLS_READY':
+            self.server.logMsg("THERE IS A PROBLEM WITH THE VMWARE TOOLS ON " + self.vmName)
+            return resultList
+        creds = self.__getGuestCreds()
+        guestOperations = self.server.connection.RetrieveContent().guestOperationsManager
+        isWindows = self.isWindows()
+        try:
+            tempDir = guestOperations.fileManager.CreateTemporaryDirectoryInGuest(self.vmObject, creds, 'vmauto', '')
+        except Exception as e:
+            self.server.logMsg("[ERROR]: UNABLE TO CREATE A TEMP DIRECTORY ON " + self.vmName)
+            self.server.logMsg("SYSTEM ERROR:\n" + str(e))
+            return resultList
+        pathSep = '/'
+        if isWindows:
+            pathSep = '\\'
+        localDir = tempfile.mkdtemp()
+        try:
+            startedList = []
+            for cmdIndex, cmdAndArgList in enumerate(cmdList):
+                outFile = tempDir + pathSep + str(cmdIndex) + '.out'
+                errFile = tempDir + pathSep + str(cmdIndex) + '.err'
+                programPath, arguments = redirectCommand(cmdAndArgList, outFile, errFile, isWindows)
+                self.server.logMsg("RUNNING '" + ' '.join(cmdAndArgList) + "' ON " + self.vmName + " WITH OUTPUT")
+                try:
+                    cmdspec = vim.vm.guest.ProcessManager.ProgramSpec(programPath=programPath,
+                                                                      arguments=arguments)
+                    cmdPid = guestOperations.processManager.StartProgramInGuest(vm=self.vmObject,
+                                                                                auth=creds,
+                                                                                spec=cmdspec)
+                except Exception as e:
+                    self.server.logMsg("[ERROR]: FAILED TO RUN '" + ' '.join(cmdAndArgList) + "' ON " + self.vmName)
+                    self.server.logMsg("SYSTEM ERROR:\n" + str(e))
+                    continue
+                startedList.append((cmdIndex, cmdPid, outFile, errFile))
+            exitDict = waitForProcesses([(self, i[1]) for i in startedList], timeout)
+            fileMap = {}
+            for cmdIndex, cmdPid, outFile, errFile in startedList:
+                fileMap[outFile] = os.path.join(localDir, str(cmdIndex) + '.out')
+                fileMap[errFile] = os.path.join(localDir, str(cmdIndex) + '.err')
+            gotDict = self.getFilesFromGuest(fileMap)
+            for cmdIndex, cmdPid, outFile, errFile in startedList:
+                exitInfo = exitDict.get((self, cmdPid))
+                exitCode = None
+                if exitInfo != None:
+                    exitCode = exitInfo[0]
+                outputList = [exitCode]
+                for guestFile in [outFile, errFile]:
+                    if gotDict.get(guestFile):
+                        outputList.append(readOutputFile(fileMap[guestFile]))
+                    else:
+                        outputList.append(None)
+                resultList[cmdIndex] = tuple(outputList)
+        finally:
+            shutil.rmtree(localDir, True)
+            try:
+                guestOperations.fileManager.DeleteDirectoryInGuest(self.vmObject, creds, tempDir, True)
+            except Exception as e:
+                self.server.logMsg("[WARNING]: UNABLE TO REMOVE " + tempDir + " FROM " + self.vmName)
+                self.server.logMsg("SYSTEM ERROR:\n" + str(e))
+        return resultList
+
     def scheduleCmdOnGuest(self, cmdAndArgList, secDelay):
         # THE POINT HERE IS THAT WHEN VMWARE TOOLS RUNS EXEs, IT DOES SO WITH VERY LIMITED PRIVS
         # CAUSING SOME PRIV ESC ATTACKS TO FAIL.  SCHEDULING THE PAYLOAD FIXES THAT.  FYI, RUNAS 
@@ -908,7 +2267,12 @@ class esxiVm:
         snapshotName = "PAYLOAD_TESTING-" + str(time.time()).split('.')[0]
         return self.takeSnapshot(snapshotName, asyncFlag)
 
-    def updateProcList(self):
+    def updateProcList(self, pidList = None):
+        """
+        REFRESHES self.processTable (STRUCTURED RECORDS INDEXED BY PID AND NAME, PLUS WHAT
+        STARTED AND EXITED SINCE THE LAST UPDATE) AND THE OLD TAB-JOINED STRINGS IN
+        self.procList.  WITH pidList, THE GUEST IS ONLY ASKED ABOUT THOSE PIDS.
+        """
         content = self.server.connection.RetrieveContent()
         creds = vim.vm.guest.NamePasswordAuthentication(username=self.vmUsername,
                                                             password=self.vmPassword)
@@ -918,10 +2282,12 @@ class esxiVm:
         vim.fault.InvalidState. IF THAT HAPPENS, TRYING AGAIN ALMOST ALWAYS WORKS.
         THAT'S WHY THE CALL SITS IN A LOOP LIKE THIS....
         """
+        retVal = False
         for i in range(5):
             try:
                 processList = content.guestOperationsManager.processManager.ListProcessesInGuest(vm=self.vmObject,
-                                                                                             auth=creds)
+                                                                                             auth=creds,
+                                                                                             pids=pidList)
             except vim.fault.InvalidState as e:
                 self.server.logMsg("[WARNING]: VM IN A STRANGE STATE; RETRYING PROCLIST UPDATE")
                 self.server.logMsg("SYSTEM ERROR:\n" + str(e))
@@ -934,19 +2300,26 @@ class esxiVm:
                 retVal = False
                 break
             else:
-                self.procList[:]=[]
-                for runningProc in processList:
-                    self.procList.append(str(runningProc.pid) + "\t\t" + \
-                                         runningProc.name + "\t\t" + \
-                                         runningProc.cmdLine + "\t\t" + \
-                                         runningProc.owner)
+                self.processTable.update(processList, pidList)
+                self.procList[:] = self.processTable.stringList()
                 retVal = True
+                break
         return retVal
 
+    def findProcesses(self, processName, refresh = True, substring = False):
+        """
+        RETURNS THE guestProcessRecords FOR processName (SEE processTable.findName; substring
+        ALSO MATCHES NAMES AND COMMAND LINES THAT CONTAIN IT), REFRESHING THE PROCESS LIST FIRST
+        UNLESS refresh IS False
+        """
+        if refresh and not self.updateProcList():
+            return []
+        return self.processTable.findName(processName, substring)
+
     def uploadAndRun(self, srcFile, dstFile, remoteInterpreter = None, useCmdShell = False):
         """
         THIS JUST COMBINES THE UPLOAD AND EXECUTE FUNCTIONS, BUT IF THE VM IS 'NIX, IT ALSO
-        CHMODS THE FILE SO WE CAN EXECUTE IT
+        CHMODS THE FILE SO WE CAN EXECUTE IT.  LIKE runCmdOnGuest, RETURNS THE PID OR False
         """
         self.server.logMsg("SOURCE FILE = " + srcFile + "; DESTINATION FILE = " + dstFile)
         remoteCmd = []
@@ -960,13 +2333,17 @@ class esxiVm:
             return False
         if 'win' not in self.vmName.lower():
             chmodCmdList = "/bin/chmod 755".split() + [dstFile]
-            if not self.runCmdOnGuest(chmodCmdList):
-                self.server.logMsg("[FATAL ERROR]: FAILED TO RUN " + ' '.join(chmodCmdList) + " ON " + self.devVm)
+            chmodPid = self.runCmdOnGuest(chmodCmdList)
+            if not chmodPid:
+                self.server.logMsg("[FATAL ERROR]: FAILED TO RUN " + ' '.join(chmodCmdList) + " ON " + self.vmName)
                 return False
-        if not self.runCmdOnGuest(remoteCmd):
+            # THE FILE IS NOT EXECUTABLE UNTIL chmod IS DONE
+            self.waitForProcess(chmodPid, 60)
+        remotePid = self.runCmdOnGuest(remoteCmd)
+        if not remotePid:
             self.server.logMsg("[FATAL ERROR]: FAILED TO RUN '" + ' '.join(remoteCmd) + "' ON " + self.vmName)
             return False
-        return True
+        return remotePid
 
     def uploadAndSchedule(self, srcFile, dstFile, secDelay, remoteInterpreter = None):
         """
@@ -986,90 +2363,174 @@ class esxiVm:
         return True
 
          
-    def uploadFileToGuest(self, srcFile, dstFile):
+    def uploadFileToGuest(self, srcFile, dstFile, callback = None, chunkSize = TRANSFER_CHUNK_SIZE):
         """
         uploadFileToGuest UPLOADS A FILE TO A VM
+        THE FILE IS READ IN BINARY AND STREAMED chunkSize BYTES AT A TIME OVER THE SERVER'S
+        KEEP-ALIVE HTTP SESSION, SO MEMORY USE DOES NOT GROW WITH THE FILE.  IF GIVEN,
+        callback(bytesSent, totalBytes) IS CALLED AS THE UPLOAD PROGRESSES.
         """
         self.server.logMsg("ATTEMPTING TO UPLOAD " +srcFile + " TO " + dstFile + " ON " + self.vmName)
         self.server.logMsg("USING " + self.vmUsername + " PW " + self.vmPassword + " ON " + self.vmName)
-        retVal = False
-        if self.checkTools() == 'TOOLS_READY':
-            creds = vim.vm.guest.NamePasswordAuthentication(username=self.vmUsername, 
-                                                            password=self.vmPassword)
-            content = self.server.connection.RetrieveContent()
-            self.server.logMsg("TOOLS CHECKS OUT")
-            try:
-                srcFileObj = open(srcFile, 'r')
-                fileContent = srcFileObj.read()
-                srcFileObj.close()
-            except IOError:
-                self.server.logMsg("FAILED TO OPEN FILE " + srcFile)
-                return retVal
-            try:
-                file_attribute = vim.vm.guest.FileManager.FileAttributes()
-                vmFileManager = content.guestOperationsManager.fileManager
-                incompleteUrl = vmFileManager.InitiateFileTransferToGuest(self.vmObject, 
-                                                                creds, 
-                                                                dstFile,
-                                                                file_attribute,
-                                                                len(fileContent), 
-                                                                True)
-                self.server.logMsg(incompleteUrl)
-                # THIS IS STUPID, BUT THERE IS SOME ASSEMBLY REQUIRED
-                splitUrl = incompleteUrl.split('*')
-                realUrl = splitUrl[0] + self.server.hostname + splitUrl[1]
-                self.server.logMsg(realUrl)
-                resp = requests.put(realUrl, data=fileContent, verify=False)
-                if not resp.status_code == 200:
-                    self.server.logMsg("ERROR UPLOADING FILE TO " + self.vmName + " HTTP CODE " + str(resp.status_code))
-                    retVal = True
-                else:
-                    self.server.logMsg("UPLOADED FILE TO " + self.vmName + " HTTP CODE " + str(resp.status_code))
-                    retVal=True
-            except IOError as e:
-                self.server.logMsg("FILE NOT FOUND: " + srcFile)
-                self.server.logMsg("SYSTEM ERROR: " + str(e))
-            except vim.fault.InvalidGuestLogin as f:
-                self.server.logMsg("INCORRECT USERTNAME/PASSWORD PROVIDED FOR " + self.vmName)
-                self.server.logMsg("USERNAME: " + self.vmUsername + " PASSWORD: " + self.vmPassword)
-                self.server.logMsg("SYSTEM ERROR: " + str(f))
-            except vmodl.fault.InvalidArgument as f:
-                self.server.logMsg("INVALID ARGUMENT; OFTEN THIS IS BECAUSE THE SPECIFIED REMOTE PATH IS NOT VALID")
-                self.server.logMsg("SYSTEM ERROR: " + str(f))
-        else:
+        if self.checkTools() != 'TOOLS_READY':
+            self.server.logMsg("THERE IS A PROBLEM WITH THE VMWARE TOOLS ON " + self.vmName)
+            return False
+        self.server.logMsg("TOOLS CHECKS OUT")
+        return self.__uploadFile(self.__getFileManager(), self.__getGuestCreds(), srcFile, dstFile, callback, chunkSize)
+
+    def uploadFilesToGuest(self, fileMap, maxConcurrent = 8, callback = None, makeDirs = True):
+        """
+        UPLOADS MANY FILES AT ONCE; fileMap IS {LOCAL PATH: GUEST PATH}.  TOOLS ARE CHECKED ONCE,
+        EVERY GUEST DIRECTORY THE FILES GO INTO IS CREATED FIRST (UNLESS makeDirs IS False), THEN
+        UP TO maxConcurrent UPLOADS RUN AT A TIME OVER THE SERVER'S KEEP-ALIVE SESSION.
+        callback(LOCAL PATH, bytesSent, totalBytes) REPORTS PROGRESS.
+        RETURNS {LOCAL PATH: True/False}
+        """
+        resultDict = dict((i, False) for i in fileMap)
+        self.server.logMsg("ATTEMPTING TO UPLOAD " + str(len(fileMap)) + " FILES TO " + self.vmName)
+        if len(fileMap) == 0:
+            return resultDict
+        if self.checkTools() != 'TOOLS_READY':
+            self.server.logMsg("THERE IS A PROBLEM WITH THE VMWARE TOOLS ON " + self.vmName)
+            return resultDict
+        vmFileManager = self.__getFileManager()
+        creds = self.__getGuestCreds()
+        pendingList = list(fileMap.keys())
+        if makeDirs:
+            failedDirs = set()
+            for dirPath in sorted(set(guestDirName(i) for i in fileMap.values())):
+                if dirPath == '':
+                    continue
+                try:
+                    vmFileManager.MakeDirectoryInGuest(self.vmObject, creds, dirPath, True)
+                except vim.fault.FileAlreadyExists:
+                    pass
+                except Exception as e:
+                    self.server.logMsg("[ERROR]: UNABLE TO CREATE " + dirPath + " ON " + self.vmName)
+                    self.server.logMsg("SYSTEM ERROR: " + str(e))
+                    failedDirs.add(dirPath)
+            pendingList = [i for i in pendingList if guestDirName(fileMap[i]) not in failedDirs]
+
+        def uploadOneFile(srcFile):
+            fileCallback = None
+            if callback != None:
+                fileCallback = lambda doneBytes, totalBytes: callback(srcFile, doneBytes, totalBytes)
+            return self.__uploadFile(vmFileManager, creds, srcFile, fileMap[srcFile], fileCallback, TRANSFER_CHUNK_SIZE)
+        resultDict.update(runParallel(pendingList, uploadOneFile, maxConcurrent))
+        self.server.logMsg("UPLOADED " + str(sum(1 for i in resultDict.values() if i)) + " OF " + \
+                           str(len(fileMap)) + " FILES TO " + self.vmName)
+        return resultDict
+
+    def uploadBufferToGuest(self, dataBuffer, dstFile, callback = None, modificationTime = None,
+                            chunkSize = TRANSFER_CHUNK_SIZE):
+        """
+        LIKE uploadFileToGuest, BUT THE DATA IS ALREADY IN MEMORY (bytes OR AN mmap); IF GIVEN,
+        modificationTime (SECONDS SINCE THE EPOCH) IS STAMPED ON THE GUEST FILE
+        """
+        self.server.logMsg("ATTEMPTING TO UPLOAD " + str(len(dataBuffer)) + " BYTES TO " + dstFile + " ON " + self.vmName)
+        if self.checkTools() != 'TOOLS_READY':
+            self.server.logMsg("THERE IS A PROBLEM WITH THE VMWARE TOOLS ON " + self.vmName)
+            return False
+        file_attribute = vim.vm.guest.FileManager.FileAttributes()
+        if modificationTime != None:
+            file_attribute.modificationTime = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=modificationTime)
+        dataReader = chunkedBufferReader(dataBuffer, chunkSize, callback)
+        return self.__sendToGuest(self.__getFileManager(), self.__getGuestCreds(), dataReader, dstFile,
+                                  "BUFFER", file_attribute)
+
+    def getGuestFileInfo(self, guestPath):
+        """
+        RETURNS THE vim.vm.guest.FileManager.FileInfo (path, size, attributes) FOR guestPath, OR
+        None IF IT IS NOT THERE OR WE CANNOT LOOK
+        """
+        if self.checkTools() != 'TOOLS_READY':
             self.server.logMsg("THERE IS A PROBLEM WITH THE VMWARE TOOLS ON " + self.vmName)
+            return None
+        try:
+            fileList = self.__getFileManager().ListFilesInGuest(self.vmObject,
+                                                                 self.__getGuestCreds(),
+                                                                 guestPath)
+        except vim.fault.FileNotFound:
+            return None
+        except Exception as e:
+            self.server.logMsg("[WARNING]: UNABLE TO LIST " + guestPath + " ON " + self.vmName)
+            self.server.logMsg("SYSTEM ERROR: " + str(e))
+            return None
+        for fileInfo in fileList.files or []:
+            if fileInfo.type == 'file':
+                return fileInfo
+        return None
+
+    def __uploadFile(self, vmFileManager, creds, srcFile, dstFile, callback, chunkSize):
+        """
+        ONE UPLOAD, ONCE WE KNOW TOOLS ARE UP; SHARED BY uploadFileToGuest AND uploadFilesToGuest
+        """
+        try:
+            srcFileObj = open(srcFile, 'rb')
+            fileSize = os.fstat(srcFileObj.fileno()).st_size
+        except (IOError, OSError):
+            self.server.logMsg("FAILED TO OPEN FILE " + srcFile)
+            return False
+        try:
+            fileReader = chunkedFileReader(srcFileObj, fileSize, chunkSize, callback)
+            return self.__sendToGuest(vmFileManager, creds, fileReader, dstFile, srcFile,
+                                      vim.vm.guest.FileManager.FileAttributes())
+        finally:
+            srcFileObj.close()
+
+    def __sendToGuest(self, vmFileManager, creds, dataReader, dstFile, srcName, file_attribute):
+        """
+        InitiateFileTransferToGuest PLUS THE HTTP PUT OF dataReader (A chunkedFileReader OR
+        chunkedBufferReader); srcName IS ONLY FOR THE LOG
+        """
+        retVal = False
+        try:
+            incompleteUrl = vmFileManager.InitiateFileTransferToGuest(self.vmObject, 
+                                                            creds, 
+                                                            dstFile,
+                                                            file_attribute,
+                                                            len(dataReader), 
+                                                            True)
+            realUrl = fixTransferUrl(self.server.hostname, incompleteUrl)
+            self.server.logMsg(realUrl)
+            # requests SENDS A ZERO-LENGTH STREAM CHUNKED, WHICH THE SERVICE REJECTS
+            requestBody = dataReader if len(dataReader) > 0 else b''
+            resp = self.server.getHttpSession().put(realUrl, data=requestBody)
+            if not resp.status_code == 200:
+                self.server.logMsg("[ERROR]: ERROR UPLOADING FILE TO " + self.vmName + " HTTP CODE " + str(resp.status_code))
+            elif dataReader.bytesSent != len(dataReader):
+                self.server.logMsg("[ERROR]: " + srcName + " CHANGED SIZE DURING UPLOAD TO " + self.vmName)
+            else:
+                self.server.logMsg("UPLOADED FILE TO " + self.vmName + " HTTP CODE " + str(resp.status_code))
+                retVal=True
+        except requests.exceptions.RequestException as e:
+            self.server.logMsg("[ERROR]: UPLOAD TO " + self.vmName + " FAILED")
+            self.server.logMsg("SYSTEM ERROR: " + str(e))
+        except IOError as e:
+            self.server.logMsg("FILE NOT FOUND: " + srcName)
+            self.server.logMsg("SYSTEM ERROR: " + str(e))
+        except vim.fault.InvalidGuestLogin as f:
+            self.server.logMsg("INCORRECT USERTNAME/PASSWORD PROVIDED FOR " + self.vmName)
+            self.server.logMsg("USERNAME: " + self.vmUsername + " PASSWORD: " + self.vmPassword)
+            self.server.logMsg("SYSTEM ERROR: " + str(f))
+        except vmodl.fault.InvalidArgument as f:
+            self.server.logMsg("INVALID ARGUMENT; OFTEN THIS IS BECAUSE THE SPECIFIED REMOTE PATH IS NOT VALID")
+            self.server.logMsg("SYSTEM ERROR: " + str(f))
+        except Exception as f:
+            self.server.logMsg("[ERROR]: UNKNOWN EXCEPTION WHILE UPLOADING " + srcName + " TO " + self.vmName)
+            self.server.logMsg("SYSTEM ERROR: " + str(f))
         return retVal
 
-    def waitForTask(self, task):
-        """
-        YES, THIS IS A DISASTER...
-        EVEN IN VIM, NESTED LOOPS ARE REQUIRED AS TASKS CAN BE CHILDREN OF TASKS, JUST LIKE
-        SNAPSHOTS
-        """
-        pc = self.server.connection.content.propertyCollector
-        objSpec = vmodl.query.PropertyCollector.ObjectSpec(obj=task)
-        propSpec = vmodl.query.PropertyCollector.PropertySpec(type=vim.Task,
-                                                             pathSet=[], all=True)
-        filterSpec = vmodl.query.PropertyCollector.FilterSpec()
-        filterSpec.objectSet = [objSpec]
-        filterSpec.propSet = [propSpec]
-        filter = pc.CreateFilter(filterSpec, True)
-        for i in range(20):
-            update = pc.WaitForUpdates(None)
-            for filterSet in update.filterSet:
-                for filterObject in filterSet.objectSet:
-                    if filterObject.obj == task:
-                        for change in filterObject.changeSet:
-                            taskStatus = "UNKNOWN"
-                            if change.name == 'info':
-                                taskStatus = change.val.state
-                            elif change.name == 'info.state':
-                                taskStatus = change.val
-                            else:
-                                continue
-                            if taskStatus == 'success':
-                                self.server.logMsg("DONE")
-                                return True
-            time.sleep(5)
-        self.server.logMsg("TASK NOT COMPLETED IN ALLOTTED TIME")
-        return False
+    def __getFileManager(self):
+        return self.server.connection.RetrieveContent().guestOperationsManager.fileManager
+
+    def __getGuestCreds(self):
+        return vim.vm.guest.NamePasswordAuthentication(username=self.vmUsername,
+                                                       password=self.vmPassword)
+
+    def waitForTask(self, task, timeout = None):
+        """
+        THIS USED TO BE A DISASTER OF NESTED LOOPS AND SLEEPS; NOW THE SERVER'S TASK TRACKER
+        DOES THE WAITING (SEE esxiServer.waitForTask)
+        """
+        return self.server.waitForTask(task, timeout)
@@ -0,0 +1,269 @@
+from pyVmomi import vim, vmodl
+
+import threading
+import time
+
+# WHAT THE INVENTORY MIRROR KEEPS FOR EVERY VM UNLESS TOLD OTHERWISE
+MIRROR_PROPERTIES = ['name',
+                     'runtime.powerState',
+                     'guest.toolsStatus',
+                     'guest.toolsRunningStatus',
+                     'guest.guestOperationsReady',
+                     'guest.ipAddress',
+                     'snapshot']
+
+
+class propertyWatcher:
+    """
+    propertyWatcher WRAPS THE PropertyCollector DANCE FOR WATCHING A SET OF PROPERTIES ON MANY
+    OBJECTS AT ONCE.  IT USES ITS OWN PropertyCollector (FILTERS ON THE SESSION COLLECTOR WOULD
+    BE SEEN BY EVERYONE ELSE WAITING ON IT) AND ONE FILTER OVER A VIEW:
+        objList == None:    A CONTAINER VIEW OF EVERY objType IN THE INVENTORY
+        objList != None:    A LIST VIEW THAT CAN GROW AND SHRINK WITH addObjects/removeObjects
+    waitForUpdates APPLIES THE INCREMENTAL WaitForUpdatesEx RESULTS TO store, WHICH MAPS A
+    MANAGED OBJECT ID TO A {PROPERTY PATH: VALUE} DICTIONARY; IF OTHER THREADS READ store, PASS
+    IN THE lock THEY USE AND UPDATES WILL BE APPLIED WHILE HOLDING IT.
+    """
+    def __init__(self, serverObject, objType, pathSet, objList = None, lock = None):
+        if lock is None:
+            lock = threading.RLock()
+        self.server = serverObject
+        self.lock = lock
+        self.objType = objType
+        self.pathSet = list(pathSet)
+        self.version = ''
+        self.store = {}
+        self.objects = {}
+        content = self.server.connection.content
+        self.collector = content.propertyCollector.CreatePropertyCollector()
+        if objList is None:
+            self.view = content.viewManager.CreateContainerView(content.rootFolder, [objType], True)
+            viewType = vim.view.ContainerView
+        else:
+            self.view = content.viewManager.CreateListView(obj=list(objList))
+            viewType = vim.view.ListView
+        traversalSpec = vmodl.query.PropertyCollector.TraversalSpec(name='traverseView',
+                                                                    path='view',
+                                                                    skip=False,
+                                                                    type=viewType)
+        objSpec = vmodl.query.PropertyCollector.ObjectSpec(obj=self.view,
+                                                           skip=True,
+                                                           selectSet=[traversalSpec])
+        propSpec = vmodl.query.PropertyCollector.PropertySpec(type=objType,
+                                                              pathSet=self.pathSet,
+                                                              all=False)
+        filterSpec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[objSpec],
+                                                              propSet=[propSpec])
+        self.filter = self.collector.CreateFilter(filterSpec, True)
+
+    def addObjects(self, objList):
+        """
+        RETURNS THE OBJECTS THE SERVER COULD NOT FIND
+        """
+        if len(objList) == 0:
+            return []
+        return self.view.ModifyListView(add=list(objList))
+
+    def removeObjects(self, objList):
+        if len(objList) > 0:
+            self.view.ModifyListView(remove=list(objList))
+
+    def cancel(self):
+        """
+        WAKES UP A waitForUpdates THAT IS BLOCKED IN ANOTHER THREAD
+        """
+        try:
+            self.collector.CancelWaitForUpdates()
+        except Exception:
+            pass
+
+    def destroy(self):
+        try:
+            self.collector.DestroyPropertyCollector()
+        except Exception:
+            pass
+        try:
+            self.view.DestroyView()
+        except Exception:
+            pass
+
+    def getValue(self, vmodlObject, propertyPath, default = None):
+        return self.store.get(vmodlObject._moId, {}).get(propertyPath, default)
+
+    def hasObject(self, vmodlObject):
+        return vmodlObject._moId in self.store
+
+    def waitForUpdates(self, maxWaitSeconds = 30):
+        """
+        BLOCKS UNTIL SOMETHING WE WATCH CHANGES OR maxWaitSeconds GOES BY (0 MEANS JUST CHECK).
+        THE FIRST CALL RETURNS THE CURRENT STATE OF EVERYTHING.  RETURNS A LIST OF
+        (MANAGED OBJECT ID, KIND, [CHANGED PROPERTY PATHS]) WHERE KIND IS enter, modify OR leave.
+        """
+        waitOptions = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=maxWaitSeconds)
+        updateSet = self.collector.WaitForUpdatesEx(self.version, waitOptions)
+        if updateSet == None:
+            return []
+        with self.lock:
+            return self.__applyUpdates(updateSet)
+
+    def __applyUpdates(self, updateSet):
+        self.version = updateSet.version
+        changeList = []
+        for filterSet in updateSet.filterSet:
+            for objUpdate in filterSet.objectSet:
+                moId = objUpdate.obj._moId
+                if objUpdate.kind == 'leave':
+                    self.store.pop(moId, None)
+                    self.objects.pop(moId, None)
+                    changeList.append((moId, 'leave', []))
+                    continue
+                objProperties = self.store.setdefault(moId, {})
+                self.objects[moId] = objUpdate.obj
+                changedPaths = []
+                for change in objUpdate.changeSet:
+                    if change.op in ('remove', 'indirectRemove'):
+                        objProperties.pop(change.name, None)
+                    else:
+                        objProperties[change.name] = change.val
+                    changedPaths.append(change.name)
+                changeList.append((moId, objUpdate.kind, changedPaths))
+        return changeList
+
+
+class inventoryMirror:
+    """
+    inventoryMirror KEEPS A LOCAL COPY OF A HANDFUL OF PROPERTIES FOR EVERY VM ON THE SERVER.
+    A BACKGROUND THREAD SITS IN WaitForUpdatesEx AND APPLIES WHATEVER CHANGED, SO READS ARE
+    LOCAL AND ANYONE WHO WANTS TO WAIT FOR A CHANGE CAN BLOCK ON waitFor INSTEAD OF SLEEPING.
+    IF THE THREAD LOSES ITS CONNECTION, isSynced GOES False (AND CALLERS SHOULD FALL BACK TO
+    ASKING THE SERVER) UNTIL IT MANAGES TO RESYNC.
+    """
+    def __init__(self, serverObject, extraProperties = None, maxWaitSeconds = 30):
+        self.server = serverObject
+        self.pathSet = list(MIRROR_PROPERTIES)
+        if extraProperties != None:
+            for propertyPath in extraProperties:
+                if propertyPath not in self.pathSet:
+                    self.pathSet.append(propertyPath)
+        self.maxWaitSeconds = maxWaitSeconds
+        self.watcher = None
+        self.thread = None
+        self.running = False
+        self.synced = False
+        self.updateCount = 0
+        # BUMPED (UNDER updateCondition) EVERY TIME WAITERS ARE WOKEN, SO waitFor CAN RUN ITS
+        # PREDICATE WITHOUT THE LOCK AND STILL NOT MISS A CHANGE THAT LANDS IN THE MEANTIME
+        self.changeCount = 0
+        self.updateCondition = threading.Condition()
+
+    def start(self, timeout = 60):
+        """
+        STARTS THE MIRROR THREAD AND WAITS UP TO timeout SECONDS FOR THE FIRST FULL SYNC
+        """
+        if self.running:
+            return self.synced
+        self.running = True
+        self.thread = threading.Thread(target=self.__run, name="inventoryMirror-" + str(self.server.hostname))
+        self.thread.daemon = True
+        self.thread.start()
+        return self.waitFor(self.isSynced, timeout)
+
+    def stop(self):
+        self.running = False
+        if self.watcher != None:
+            self.watcher.cancel()
+        if self.thread != None:
+            self.thread.join(self.maxWaitSeconds + 5)
+        self.thread = None
+
+    def isSynced(self):
+        return self.running and self.synced
+
+    def hasVm(self, vmObject):
+        with self.updateCondition:
+            if not self.isSynced() or self.watcher == None:
+                return False
+            return self.watcher.hasObject(vmObject)
+
+    def getProperty(self, vmObject, propertyPath, default = None):
+        with self.updateCondition:
+            if self.watcher == None:
+                return default
+            return self.watcher.getValue(vmObject, propertyPath, default)
+
+    def waitForChange(self, timeout):
+        """
+        BLOCKS UNTIL THE MIRROR APPLIES AN UPDATE OR timeout SECONDS PASS
+        """
+        with self.updateCondition:
+            startCount = self.updateCount
+            self.updateCondition.wait(timeout)
+            return self.updateCount != startCount
+
+    def waitFor(self, predicate, timeout):
+        """
+        BLOCKS UNTIL predicate() IS TRUE OR timeout SECONDS PASS; predicate IS RE-EVALUATED
+        EVERY TIME THE MIRROR CHANGES.  RETURNS THE LAST VALUE OF predicate()
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self.updateCondition:
+                seenCount = self.changeCount
+            # THE PREDICATE RUNS WITHOUT THE LOCK, SO A SLOW ONE DOES NOT HOLD UP THE MIRROR THREAD
+            retVal = predicate()
+            remaining = deadline - time.time()
+            if retVal or remaining <= 0:
+                return retVal
+            with self.updateCondition:
+                if not self.synced:
+                    # NOBODY WILL NOTIFY US WHILE WE ARE OUT OF SYNC, SO FALL BACK TO POLLING
+                    remaining = min(remaining, 1)
+                if self.changeCount == seenCount:
+                    self.updateCondition.wait(remaining)
+
+    def __run(self):
+        retryDelay = 1
+        while self.running:
+            try:
+                if self.watcher == None:
+                    self.watcher = propertyWatcher(self.server,
+                                                   vim.VirtualMachine,
+                                                   self.pathSet,
+                                                   lock=self.updateCondition)
+                changeList = self.watcher.waitForUpdates(self.maxWaitSeconds)
+            except Exception as e:
+                if not self.running:
+                    break
+                self.server.logMsg("[WARNING]: INVENTORY MIRROR LOST SYNC; RETRYING IN " + str(retryDelay) + " SECONDS")
+                self.server.logMsg("SYSTEM ERROR:\n" + str(e))
+                with self.updateCondition:
+                    self.synced = False
+                    if self.watcher != None:
+                        self.watcher.destroy()
+                    self.watcher = None
+                    self.__notifyChange()
+                time.sleep(retryDelay)
+                retryDelay = min(retryDelay * 2, 60)
+                continue
+            retryDelay = 1
+            with self.updateCondition:
+                if self.synced:
+                    for moId, kind, changedPaths in changeList:
+                        if kind != 'modify':
+                            self.server.invalidate()
+                            break
+                self.synced = True
+                if len(changeList) > 0:
+                    self.updateCount += 1
+                self.__notifyChange()
+        with self.updateCondition:
+            self.synced = False
+            if self.watcher != None:
+                self.watcher.destroy()
+            self.watcher = None
+            self.__notifyChange()
+
+    def __notifyChange(self):
+        # CALLED WITH updateCondition HELD
+        self.changeCount += 1
+        self.updateCondition.notify_all()
@@ -0,0 +1,274 @@
+from .guestTransfer import runParallel
+from collections import namedtuple
+
+import time
+
+# HOW OFTEN iterProcessExits ASKS THE GUESTS; IT STARTS FAST AND SLOWS DOWN WHILE NOTHING EXITS
+PROCESS_POLL_MIN = 0.5
+PROCESS_POLL_MAX = 10
+
+# WHAT runCmdsOnGuestWithOutput WRAPS COMMANDS IN TO REDIRECT THEIR OUTPUT
+WINDOWS_SHELL = 'C:\\Windows\\System32\\cmd.exe'
+POSIX_SHELL = '/bin/sh'
+
+
+def iterProcessExits(procList, timeout = None, minInterval = PROCESS_POLL_MIN, maxInterval = PROCESS_POLL_MAX,
+                     maxConcurrent = 16):
+    """
+    procList IS A LIST OF (esxiVm, pid).  EVERY ROUND, EACH VM THAT STILL HAS RUNNING PIDS GETS
+    ONE ListProcessesInGuest CALL FOR ALL OF THEM (UP TO maxConcurrent VMS AT ONCE), AND WE
+    YIELD (esxiVm, pid, exitCode, endTime) FOR EVERY PROCESS THAT HAS EXITED SINCE THE LAST
+    ROUND.  THE WAIT BETWEEN ROUNDS STARTS AT minInterval, GROWS TOWARD maxInterval WHILE
+    NOTHING EXITS, AND DROPS BACK WHEN SOMETHING DOES.  A PID THE GUEST NO LONGER REPORTS AT ALL
+    (TOOLS ONLY REMEMBER EXITED PROCESSES FOR A FEW MINUTES) IS YIELDED WITH exitCode None.
+    IF timeout SECONDS PASS FIRST, WE STOP; WHATEVER WAS NOT YIELDED IS STILL RUNNING.
+    """
+    pendingDict = {}
+    for vm, pid in procList:
+        pendingDict.setdefault(vm, set()).add(pid)
+    deadline = None
+    if timeout != None:
+        deadline = time.time() + timeout
+    pollInterval = minInterval
+    while len(pendingDict) > 0:
+        pollDict = runParallel(list(pendingDict.keys()),
+                               lambda vm: vm.listGuestProcesses(sorted(pendingDict[vm])),
+                               maxConcurrent)
+        exitList = []
+        for vm, processList in pollDict.items():
+            if processList is None or processList is False:
+                # THE GUEST DID NOT ANSWER (REBOOTING, TOOLS RESTARTING); ASK AGAIN NEXT ROUND
+                continue
+            processDict = dict((i.pid, i) for i in processList)
+            for pid in list(pendingDict[vm]):
+                processInfo = processDict.get(pid)
+                if processInfo == None:
+                    exitList.append((vm, pid, None, None))
+                elif processInfo.endTime != None:
+                    exitList.append((vm, pid, processInfo.exitCode, processInfo.endTime))
+        for vm, pid, exitCode, endTime in exitList:
+            pendingDict[vm].discard(pid)
+            if len(pendingDict[vm]) == 0:
+                del pendingDict[vm]
+            yield vm, pid, exitCode, endTime
+        if len(pendingDict) == 0:
+            return
+        if len(exitList) > 0:
+            pollInterval = minInterval
+        else:
+            pollInterval = min(pollInterval * 1.5, maxInterval)
+        sleepTime = pollInterval
+        if deadline != None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            sleepTime = min(sleepTime, remaining)
+        time.sleep(sleepTime)
+
+
+def waitForProcesses(procList, timeout = None, maxConcurrent = 16):
+    """
+    RUNS iterProcessExits TO THE END AND RETURNS {(esxiVm, pid): (exitCode, endTime)}; A
+    PROCESS STILL RUNNING AT THE TIMEOUT MAPS TO None
+    """
+    resultDict = dict(((vm, pid), None) for vm, pid in procList)
+    for vm, pid, exitCode, endTime in iterProcessExits(procList, timeout, maxConcurrent=maxConcurrent):
+        resultDict[(vm, pid)] = (exitCode, endTime)
+    return resultDict
+
+
+class processCondition:
+    """
+    SOMETHING TO WAIT FOR ON ONE VM: kind 'appeared' IS MET WHEN A PROCESS MATCHING match IS
+    RUNNING, 'exited' WHEN NONE IS.  match IS A NAME (LOOKED UP WITH processTable.findName,
+    PASSING substring ALONG) OR A FUNCTION THAT TAKES A guestProcessRecord AND RETURNS
+    True/False.  timeout, IF SET, IS THIS CONDITION'S OWN DEADLINE; OTHERWISE THE WATCHER'S
+    APPLIES.  AFTER WATCHING, met IS True, False (GAVE UP) OR None (NOT DECIDED YET), AND
+    records HOLDS THE MATCHES FROM THE LAST LOOK.
+    """
+    def __init__(self, vm, match, kind = 'appeared', timeout = None, substring = False):
+        self.vm =           vm
+        self.match =        match
+        self.kind =         kind
+        self.timeout =      timeout
+        self.substring =    substring
+        self.met =          None
+        self.records =      []
+
+    def check(self, table):
+        if callable(self.match):
+            self.records = [i for i in table.byPid.values() if self.match(i)]
+        else:
+            self.records = table.findName(self.match, self.substring)
+        if self.kind == 'exited':
+            return len(self.records) == 0
+        return len(self.records) > 0
+
+
+def iterProcessConditions(conditionList, timeout = None, minInterval = PROCESS_POLL_MIN,
+                          maxInterval = PROCESS_POLL_MAX, maxConcurrent = 16):
+    """
+    WATCHES MANY processConditions ON MANY VMS ON ONE SCHEDULE: EACH ROUND REFRESHES THE PROCESS
+    LIST OF EVERY VM THAT STILL HAS AN UNDECIDED CONDITION (UP TO maxConcurrent AT ONCE), THEN
+    YIELDS EACH CONDITION AS SOON AS IT IS MET (met = True) OR ITS DEADLINE PASSES (met = False).
+    ROUNDS BACK OFF FROM minInterval TO maxInterval WHILE NOTHING HAPPENS, LIKE iterProcessExits.
+    """
+    startTime = time.time()
+    deadlineDict = {}
+    for condition in conditionList:
+        conditionTimeout = condition.timeout
+        if conditionTimeout == None:
+            conditionTimeout = timeout
+        if conditionTimeout == None:
+            deadlineDict[condition] = None
+        else:
+            deadlineDict[condition] = startTime + conditionTimeout
+    pendingList = list(conditionList)
+    pollInterval = minInterval
+    while len(pendingList) > 0:
+        vmList = []
+        for condition in pendingList:
+            if condition.vm not in vmList:
+                vmList.append(condition.vm)
+        updateDict = runParallel(vmList, lambda vm: vm.updateProcList(), maxConcurrent)
+        now = time.time()
+        doneList = []
+        for condition in pendingList:
+            if updateDict.get(condition.vm) and condition.check(condition.vm.processTable):
+                condition.met = True
+                doneList.append(condition)
+            elif deadlineDict[condition] != None and deadlineDict[condition] <= now:
+                condition.met = False
+                doneList.append(condition)
+        for condition in doneList:
+            pendingList.remove(condition)
+            yield condition
+        if len(pendingList) == 0:
+            return
+        if len([i for i in doneList if i.met]) > 0:
+            pollInterval = minInterval
+        else:
+            pollInterval = min(pollInterval * 1.5, maxInterval)
+        sleepTime = pollInterval
+        deadlineList = [deadlineDict[i] for i in pendingList if deadlineDict[i] != None]
+        if len(deadlineList) > 0:
+            sleepTime = max(0, min(sleepTime, min(deadlineList) - time.time()))
+        time.sleep(sleepTime)
+
+
+def redirectCommand(cmdAndArgList, outFile, errFile, isWindows):
+    """
+    RETURNS (programPath, arguments) THAT RUN cmdAndArgList (JOINED WITH SPACES, LIKE
+    runCmdOnGuest DOES) THROUGH THE GUEST'S SHELL WITH stdout IN outFile AND stderr IN errFile.
+    THE SHELL PASSES THE COMMAND'S EXIT CODE THROUGH AS ITS OWN.
+    """
+    cmdLine = ' '.join(cmdAndArgList)
+    if isWindows:
+        # cmd /c STRIPS THE OUTERMOST QUOTES AND RUNS WHAT IS LEFT, INNER QUOTES INTACT
+        return WINDOWS_SHELL, '/c "' + cmdLine + ' > "' + outFile + '" 2> "' + errFile + '""'
+    # THE BRACES MAKE THE REDIRECT COVER EVERY PART OF A COMPOUND COMMAND LIKE "a && b"
+    shellLine = '{ ' + cmdLine + '\n} > "' + outFile + '" 2> "' + errFile + '"'
+    return POSIX_SHELL, "-c '" + shellLine.replace("'", "'\\''") + "'"
+
+
+def readOutputFile(localFile):
+    """
+    GUEST OUTPUT COMES BACK AS BYTES IN WHATEVER ENCODING THE GUEST USED; utf-8 WITH
+    REPLACEMENT IS RIGHT OFTEN ENOUGH AND NEVER BLOWS UP
+    """
+    with open(localFile, 'rb') as outputFileObj:
+        return outputFileObj.read().decode('utf-8', 'replace')
+
+
+class guestProcessRecord(namedtuple('guestProcessRecord', ['pid', 'name', 'cmdLine', 'owner',
+                                                           'startTime', 'endTime', 'exitCode'])):
+    """
+    ONE GUEST PROCESS, AS LISTED BY ListProcessesInGuest, WITHOUT THE pyVmomi OBJECT OVERHEAD.
+    str() GIVES THE OLD "pid\t\tname\t\tcmdLine\t\towner" LINE.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def fromProcessInfo(processInfo):
+        return guestProcessRecord(processInfo.pid,
+                                  processInfo.name or '',
+                                  processInfo.cmdLine or '',
+                                  processInfo.owner or '',
+                                  processInfo.startTime,
+                                  processInfo.endTime,
+                                  processInfo.exitCode)
+
+    def __str__(self):
+        return str(self.pid) + "\t\t" + self.name + "\t\t" + self.cmdLine + "\t\t" + self.owner
+
+    def isRunning(self):
+        return self.endTime == None
+
+
+class processTable:
+    """
+    THE PROCESSES WE LAST SAW ON A GUEST, INDEXED BY PID AND BY (LOWER CASE) NAME.  EVERY
+    update() ALSO RECORDS WHAT CHANGED SINCE THE ONE BEFORE IT: started HOLDS THE RECORDS
+    FOR PIDS WE HAD NOT SEEN, exited THE RECORDS FOR PIDS THAT ENDED OR DISAPPEARED.
+    """
+    def __init__(self):
+        self.byPid =        {}
+        self.byName =       {}
+        self.started =      []
+        self.exited =       []
+        self.updateTime =   None
+
+    def update(self, processInfoList, pidList = None):
+        """
+        processInfoList IS WHAT ListProcessesInGuest RETURNED; IF IT WAS ASKED FOR pidList ONLY,
+        PASS THAT TOO SO WE DO NOT TAKE EVERY OTHER PROCESS FOR DEAD
+        """
+        newRecords = dict((i.pid, guestProcessRecord.fromProcessInfo(i)) for i in processInfoList)
+        if pidList == None:
+            checkedPids = set(self.byPid) | set(newRecords)
+        else:
+            checkedPids = set(pidList)
+        self.started = []
+        self.exited = []
+        for pid in checkedPids:
+            oldRecord = self.byPid.get(pid)
+            newRecord = newRecords.get(pid)
+            if newRecord == None or not newRecord.isRunning():
+                if oldRecord != None and oldRecord.isRunning():
+                    self.exited.append(newRecord or oldRecord)
+                elif oldRecord == None and newRecord != None and pidList != None:
+                    # ASKED ABOUT A PID WE NEVER SAW RUNNING AND IT IS ALREADY GONE
+                    self.exited.append(newRecord)
+                if oldRecord != None:
+                    self.__unindex(oldRecord)
+                continue
+            if oldRecord == None:
+                self.started.append(newRecord)
+            else:
+                self.__unindex(oldRecord)
+            self.byPid[pid] = newRecord
+            self.byName.setdefault(newRecord.name.lower(), {})[pid] = newRecord
+        self.updateTime = time.time()
+        return self.started, self.exited
+
+    def findName(self, processName, substring = False):
+        """
+        RECORDS WHOSE NAME IS processName (IGNORING CASE), STRAIGHT FROM THE NAME INDEX.  WITH
+        substring, RECORDS WHOSE NAME OR COMMAND LINE CONTAINS processName INSTEAD, WHICH IS WHAT
+        THE OLD SEARCH OF THE procList STRINGS MATCHED; THAT WALKS EVERY RECORD AND ALSO MATCHES
+        ANY PROCESS THAT MERELY MENTIONS THE NAME (LIKE A cmd.exe /c WRAPPER AROUND IT).
+        """
+        if substring:
+            return [i for i in self.byPid.values() if processName in i.name or processName in i.cmdLine]
+        return list(self.byName.get(processName.lower(), {}).values())
+
+    def stringList(self):
+        return [str(self.byPid[i]) for i in sorted(self.byPid)]
+
+    def __unindex(self, oldRecord):
+        self.byPid.pop(oldRecord.pid, None)
+        nameDict = self.byName.get(oldRecord.name.lower())
+        if nameDict != None:
+            nameDict.pop(oldRecord.pid, None)
+            if len(nameDict) == 0:
+                del self.byName[oldRecord.name.lower()]
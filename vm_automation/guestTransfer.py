@@ -0,0 +1,223 @@
+from requests.adapters import HTTPAdapter
+
+import mmap
+import os
+import requests
+import threading
+import uuid
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# HOW MUCH OF A FILE WE HOLD IN MEMORY AT ONCE WHILE MOVING IT TO OR FROM A GUEST
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+
+
+def fixTransferUrl(hostname, transferUrl):
+    """
+    THE FILE MANAGER HANDS BACK URLS WITH A '*' WHERE THE HOST NAME GOES; THIS IS STUPID, BUT
+    THERE IS SOME ASSEMBLY REQUIRED
+    """
+    splitUrl = transferUrl.split('*')
+    if len(splitUrl) < 2:
+        return transferUrl
+    return splitUrl[0] + hostname + splitUrl[1]
+
+
+def makeHttpSession(maxConnections = 32):
+    """
+    A requests.Session THAT KEEPS UP TO maxConnections TLS CONNECTIONS ALIVE PER HOST, SO
+    BACK-TO-BACK TRANSFERS TO THE SAME ESXi HOST DO NOT EACH PAY FOR A HANDSHAKE
+    """
+    httpSession = requests.Session()
+    httpSession.verify = False
+    httpAdapter = HTTPAdapter(pool_connections=4, pool_maxsize=maxConnections)
+    httpSession.mount('https://', httpAdapter)
+    httpSession.mount('http://', httpAdapter)
+    return httpSession
+
+
+class transferReader:
+    """
+    WHAT THE UPLOAD READERS SHARE.  BECAUSE A READER HAS A LENGTH, requests SENDS A
+    Content-Length INSTEAD OF CHUNKED ENCODING, WHICH THE GUEST FILE TRANSFER SERVICE INSISTS
+    ON.  httplib PULLS THE BODY THROUGH read() A FEW KB AT A TIME ON BOTH PYTHON 2 AND 3
+    (PYTHON 2 CANNOT SEND A BODY THAT IS ONLY ITERABLE).  callback(bytesSent, totalBytes) IS
+    CALLED EVERY chunkSize BYTES AND ONCE MORE AT THE END.  EACH READER SUPPLIES
+    readChunk(size), WHICH RETURNS THE NEXT size BYTES STARTING AT bytesSent.
+    """
+    def __init__(self, totalBytes, chunkSize, callback):
+        self.totalBytes =       totalBytes
+        self.chunkSize =        chunkSize
+        self.callback =         callback
+        self.bytesSent =        0
+        self.reportedBytes =    0
+
+    def __len__(self):
+        return self.totalBytes
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunkSize)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size = -1):
+        remaining = self.totalBytes - self.bytesSent
+        if size == None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b''
+        chunk = self.readChunk(size)
+        self.bytesSent += len(chunk)
+        if self.callback != None and len(chunk) > 0 and \
+           (self.bytesSent - self.reportedBytes >= self.chunkSize or self.bytesSent == self.totalBytes):
+            self.reportedBytes = self.bytesSent
+            self.callback(self.bytesSent, self.totalBytes)
+        return chunk
+
+
+class chunkedFileReader(transferReader):
+    """
+    STREAMS AN OPEN (BINARY) FILE OF fileSize BYTES
+    """
+    def __init__(self, fileObj, fileSize, chunkSize = TRANSFER_CHUNK_SIZE, callback = None):
+        transferReader.__init__(self, fileSize, chunkSize, callback)
+        self.fileObj =  fileObj
+
+    def readChunk(self, size):
+        # IF THE FILE SHRANK UNDER US THIS COMES BACK SHORT (OR EMPTY); THE SERVER WILL SEE A
+        # SHORT BODY AND FAIL THE PUT
+        return self.fileObj.read(size)
+
+
+class chunkedBufferReader(transferReader):
+    """
+    THE SAME THING FOR DATA ALREADY IN MEMORY (A bytes OR AN mmap), SO ONE COPY OF A FILE CAN
+    FEED ANY NUMBER OF CONCURRENT UPLOADS; EACH READER KEEPS ITS OWN OFFSET
+    """
+    def __init__(self, dataBuffer, chunkSize = TRANSFER_CHUNK_SIZE, callback = None):
+        transferReader.__init__(self, len(dataBuffer), chunkSize, callback)
+        self.dataBuffer =   dataBuffer
+
+    def readChunk(self, size):
+        return self.dataBuffer[self.bytesSent:self.bytesSent + size]
+
+
+def readShared(srcFile):
+    """
+    RETURNS THE CONTENTS OF srcFile AS SOMETHING chunkedBufferReader CAN SLICE: A READ-ONLY mmap
+    (SO THE OS, NOT US, DECIDES HOW MUCH IS IN MEMORY) OR b'' FOR AN EMPTY FILE, WHICH CANNOT
+    BE MAPPED.  close() WHAT YOU GET BACK IF IT HAS A close.
+    """
+    with open(srcFile, 'rb') as srcFileObj:
+        if os.fstat(srcFileObj.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(srcFileObj.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def replaceFile(srcFile, dstFile):
+    """
+    RENAMES srcFile OVER dstFile IN ONE STEP (PYTHON 2 ON WINDOWS HAS TO DELETE dstFile FIRST)
+    """
+    if hasattr(os, 'replace'):
+        os.replace(srcFile, dstFile)
+    else:
+        if os.name != 'posix' and os.path.exists(dstFile):
+            os.remove(dstFile)
+        os.rename(srcFile, dstFile)
+
+
+def openTempFile(dstFile):
+    """
+    OPENS A NEW, UNIQUELY NAMED .part FILE NEXT TO dstFile FOR BINARY WRITING AND RETURNS
+    (TEMP FILE NAME, FILE OBJECT); A DOWNLOAD GOES THERE UNTIL IT HAS BEEN CHECKED
+    """
+    dstDir = os.path.dirname(os.path.abspath(dstFile))
+    tempFile = os.path.join(dstDir, '.' + os.path.basename(dstFile) + '.' + uuid.uuid4().hex[:8] + '.part')
+    # os.open RATHER THAN mkstemp, SO THE FINISHED FILE GETS THE USUAL umask PERMISSIONS, NOT 0600
+    tempDesc = os.open(tempFile, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    return tempFile, os.fdopen(tempDesc, 'wb')
+
+
+def streamToFile(httpResponse, dstFile, chunkSize = TRANSFER_CHUNK_SIZE, callback = None, hashObj = None):
+    """
+    WRITES A STREAMED requests RESPONSE TO A TEMP FILE NEXT TO dstFile, FEEDING hashObj (IF
+    GIVEN) AS IT GOES, AND RETURNS (TEMP FILE NAME, BYTES WRITTEN).  THE CALLER DECIDES
+    WHETHER TO replaceFile() IT INTO PLACE OR THROW IT AWAY.  RAISES IOError/OSError OR A
+    requests EXCEPTION IF THE TRANSFER BREAKS, AFTER REMOVING THE TEMP FILE.
+    """
+    tempFile, tempFileObj = openTempFile(dstFile)
+    bytesWritten = 0
+    totalBytes = int(httpResponse.headers.get('Content-Length', 0))
+    try:
+        with tempFileObj:
+            for chunk in httpResponse.iter_content(chunkSize):
+                if not chunk:
+                    continue
+                tempFileObj.write(chunk)
+                if hashObj != None:
+                    hashObj.update(chunk)
+                bytesWritten += len(chunk)
+                if callback != None:
+                    callback(bytesWritten, totalBytes)
+    except Exception:
+        removeQuietly(tempFile)
+        raise
+    return tempFile, bytesWritten
+
+
+def removeQuietly(fileName):
+    try:
+        os.remove(fileName)
+    except OSError:
+        pass
+
+
+def guestDirName(guestPath):
+    """
+    os.path.dirname FOR A PATH ON THE GUEST, WHICH MAY USE EITHER KIND OF SLASH NO MATTER WHAT
+    WE ARE RUNNING ON
+    """
+    splitIndex = max(guestPath.rfind('/'), guestPath.rfind('\\'))
+    if splitIndex <= 0:
+        return ''
+    if splitIndex == 2 and guestPath[1] == ':':
+        # C:\ IS AS FAR UP AS WE GO
+        return ''
+    return guestPath[:splitIndex]
+
+
+def runParallel(jobList, workFn, maxConcurrent = 8):
+    """
+    RUNS workFn(job) FOR EVERY job IN jobList ON UP TO maxConcurrent THREADS AND RETURNS
+    {job: RESULT}; A workFn THAT RAISES COUNTS AS False
+    """
+    jobQueue = queue.Queue()
+    for job in jobList:
+        jobQueue.put(job)
+    resultDict = {}
+    resultLock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                job = jobQueue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                jobResult = workFn(job)
+            except Exception:
+                jobResult = False
+            with resultLock:
+                resultDict[job] = jobResult
+    threadList = [threading.Thread(target=worker) for i in range(min(maxConcurrent, len(jobList)))]
+    for workerThread in threadList:
+        workerThread.daemon = True
+        workerThread.start()
+    for workerThread in threadList:
+        workerThread.join()
+    return resultDict
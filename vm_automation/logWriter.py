@@ -0,0 +1,256 @@
+from atexit import register
+
+import datetime
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+LOG_LEVELS = {'DEBUG':      10,
+              'INFO':       20,
+              'WARNING':    30,
+              'ERROR':      40,
+              'FATAL ERROR': 50}
+
+
+def messageLevel(strMsg):
+    """
+    OUR MESSAGES CARRY THEIR SEVERITY AS A PREFIX LIKE "[WARNING]: ..."; ANYTHING WITHOUT ONE IS
+    INFO, EXCEPT THE "SYSTEM ERROR" LINES THAT FOLLOW AN [ERROR] AND BELONG WITH IT
+    """
+    if strMsg.startswith('['):
+        prefix = strMsg[1:strMsg.find(']')].upper()
+        if prefix in LOG_LEVELS:
+            return prefix
+    if strMsg.startswith('SYSTEM ERROR'):
+        return 'ERROR'
+    return 'INFO'
+
+
+class logWriter:
+    """
+    logWriter IS WHERE logMsg CALLS END UP.  INSTEAD OF OPENING THE LOG FILE FOR EVERY LINE, IT
+    BUFFERS LINES PER FILE AND A BACKGROUND THREAD APPENDS THEM EVERY flushInterval SECONDS
+    (RIGHT AWAY FOR ERRORS, AND AT EXIT).  ONLY THE MAIN PROCESS BUFFERS: multiprocessing WORKERS
+    LEAVE THROUGH os._exit, WHICH SKIPS atexit, SO getLogWriter GIVES ANY OTHER PROCESS A
+    WRITE-THROUGH WRITER (USE useLogQueue TO GET BATCHING THERE).  IT ALSO:
+        DROPS MESSAGES BELOW minLevel
+        COLLAPSES THE SAME MESSAGE REPEATED TO THE SAME FILE INTO ONE "REPEATED N TIMES" LINE
+        WRITES JSON LINES INSTEAD OF TEXT IF jsonLines IS SET
+        SENDS EVERYTHING TO A PARENT PROCESS INSTEAD OF THE FILE ONCE useQueue() IS CALLED
+    flushInterval = 0 MEANS WRITE EVERY LINE IMMEDIATELY, THE WAY logMsg USED TO.
+    """
+    def __init__(self, flushInterval = 2, maxBuffered = 1000, minLevel = 'DEBUG', jsonLines = False):
+        self.flushInterval =    flushInterval
+        self.maxBuffered =      maxBuffered
+        self.minLevel =         minLevel
+        self.jsonLines =        jsonLines
+        self.lock =             threading.Condition()
+        # HELD FROM TAKING THE BUFFER UNTIL IT IS ON DISK, SO TWO FLUSHES CANNOT WRITE OUT OF ORDER
+        self.writeLock =        threading.Lock()
+        self.buffers =          {}
+        self.bufferedCount =    0
+        self.lastMessages =     {}
+        self.logQueue =         None
+        self.flushThread =      None
+        self.flushNow =         False
+        self.ownerPid =         os.getpid()
+        register(self.flush)
+
+    def setLevel(self, minLevel):
+        if minLevel.upper() not in LOG_LEVELS:
+            return False
+        self.minLevel = minLevel.upper()
+        return True
+
+    def useQueue(self, logQueue):
+        """
+        FROM NOW ON, HAND RECORDS TO logQueue (SEE startLogQueue) INSTEAD OF WRITING THEM HERE
+        """
+        self.flush()
+        self.logQueue = logQueue
+
+    def write(self, logFile, source, strMsg, level = None):
+        """
+        RETURNS True IF THE MESSAGE WAS ACCEPTED (OR FILTERED OUT BY LEVEL); WRITE ERRORS ON A
+        BUFFERED FLUSH HAPPEN LATER AND CAN ONLY BE REPORTED BY flush()
+        """
+        if level == None:
+            level = messageLevel(strMsg)
+        if LOG_LEVELS.get(level, 20) < LOG_LEVELS.get(self.minLevel, 10):
+            return True
+        logRecord = (logFile, source, time.time(), level, strMsg)
+        if self.logQueue != None:
+            try:
+                self.logQueue.put(logRecord)
+                return True
+            except Exception:
+                pass
+        return self.addRecord(logRecord)
+
+    def addRecord(self, logRecord):
+        logFile, source, timeStamp, level, strMsg = logRecord
+        with self.lock:
+            lastMessage = self.lastMessages.get(logFile)
+            if lastMessage != None and lastMessage[0] == (source, strMsg):
+                lastMessage[1] += 1
+                return True
+            lineList = self.buffers.setdefault(logFile, [])
+            self.__addRepeatLine(logFile, timeStamp)
+            self.lastMessages[logFile] = [(source, strMsg), 0]
+            lineList.append(self.formatLine(source, timeStamp, level, strMsg))
+            self.bufferedCount += 1
+            if self.flushInterval <= 0:
+                writeNow = True
+            else:
+                writeNow = False
+                if LOG_LEVELS.get(level, 20) >= LOG_LEVELS['ERROR'] or self.bufferedCount >= self.maxBuffered:
+                    self.flushNow = True
+                self.__startFlushThread()
+                self.lock.notify_all()
+        if writeNow:
+            return self.flush()
+        return True
+
+    def formatLine(self, source, timeStamp, level, strMsg):
+        dateStr = str(datetime.datetime.fromtimestamp(timeStamp))
+        if self.jsonLines:
+            return json.dumps({'time': dateStr, 'source': source, 'level': level, 'msg': strMsg})
+        return source + ':[' + dateStr + '] ' + strMsg
+
+    def flush(self):
+        """
+        WRITES EVERYTHING BUFFERED; RETURNS False IF ANY FILE COULD NOT BE WRITTEN
+        """
+        if os.getpid() != self.ownerPid:
+            # A FORKED CHILD INHERITS THE PARENT'S BUFFER; THE PARENT WILL WRITE IT
+            return True
+        retVal = True
+        with self.writeLock:
+            with self.lock:
+                for logFile in self.lastMessages:
+                    self.__addRepeatLine(logFile, time.time())
+                bufferDict = self.buffers
+                self.buffers = {}
+                self.bufferedCount = 0
+                self.flushNow = False
+            for logFile, lineList in bufferDict.items():
+                if len(lineList) == 0:
+                    continue
+                try:
+                    logFileObj = open(logFile, 'a')
+                    logFileObj.write('\n'.join(lineList) + '\n')
+                    logFileObj.close()
+                except IOError:
+                    retVal = False
+        return retVal
+
+    def __addRepeatLine(self, logFile, timeStamp):
+        lastMessage = self.lastMessages.get(logFile)
+        if lastMessage != None and lastMessage[1] > 0:
+            self.buffers.setdefault(logFile, []).append(
+                self.formatLine(lastMessage[0][0], timeStamp, 'INFO',
+                                "[LAST MESSAGE REPEATED " + str(lastMessage[1]) + " MORE TIMES]"))
+            lastMessage[1] = 0
+
+    def __startFlushThread(self):
+        if self.flushThread == None:
+            self.flushThread = threading.Thread(target=self.__flushLoop, name="logWriter")
+            self.flushThread.daemon = True
+            self.flushThread.start()
+
+    def __flushLoop(self):
+        while True:
+            with self.lock:
+                deadline = time.time() + self.flushInterval
+                while not self.flushNow and time.time() < deadline:
+                    self.lock.wait(max(0.05, deadline - time.time()))
+            self.flush()
+
+
+# ONE WRITER PER PROCESS, LIKE THE SESSION POOL; A FORKED OR SPAWNED CHILD GETS ITS OWN,
+# WRITING THROUGH (SEE logWriter)
+defaultWriter = None
+defaultWriterPid = None
+defaultWriterLock = threading.Lock()
+logListener = None
+
+
+def getLogWriter():
+    global defaultWriter, defaultWriterPid
+    with defaultWriterLock:
+        if defaultWriter == None or defaultWriterPid != os.getpid():
+            parentWriter = defaultWriter
+            defaultWriter = logWriter()
+            if parentWriter != None:
+                defaultWriter.flushInterval = parentWriter.flushInterval
+                defaultWriter.minLevel = parentWriter.minLevel
+                defaultWriter.jsonLines = parentWriter.jsonLines
+                defaultWriter.logQueue = parentWriter.logQueue
+            if parentWriter != None or multiprocessing.current_process().name != 'MainProcess':
+                defaultWriter.flushInterval = 0
+            defaultWriterPid = os.getpid()
+        return defaultWriter
+
+
+def configureLogging(flushInterval = None, minLevel = None, jsonLines = None):
+    """
+    CHANGES THE SETTINGS OF THIS PROCESS'S WRITER; ANYTHING LEFT AS None IS UNCHANGED.  IN A
+    multiprocessing WORKER, A flushInterval ABOVE 0 LOSES WHATEVER IS STILL BUFFERED WHEN THE
+    WORKER EXITS; USE useLogQueue THERE INSTEAD.
+    """
+    writer = getLogWriter()
+    if flushInterval != None:
+        writer.flush()
+        writer.flushInterval = flushInterval
+    if minLevel != None and not writer.setLevel(minLevel):
+        return False
+    if jsonLines != None:
+        writer.jsonLines = jsonLines
+    return True
+
+
+def useLogQueue(logQueue):
+    """
+    POINTS THIS PROCESS'S WRITER AT A QUEUE MADE BY startLogQueue.  MEANT AS A
+    multiprocessing.Pool INITIALIZER: Pool(n, useLogQueue, (logQueue,))
+    """
+    getLogWriter().useQueue(logQueue)
+
+
+def startLogQueue():
+    """
+    STARTS A THREAD IN THIS PROCESS THAT WRITES WHATEVER WORKER PROCESSES PUT ON THE RETURNED
+    QUEUE, SO ONE WRITER OWNS THE FILES AND LINES FROM DIFFERENT WORKERS NEVER INTERLEAVE
+    """
+    global logListener
+    logQueue = multiprocessing.Queue()
+    writer = getLogWriter()
+
+    def drainQueue():
+        while True:
+            logRecord = logQueue.get()
+            if logRecord == None:
+                break
+            writer.addRecord(logRecord)
+        writer.flush()
+
+    logListener = (logQueue, threading.Thread(target=drainQueue, name="logQueueListener"))
+    logListener[1].daemon = True
+    logListener[1].start()
+    return logQueue
+
+
+def stopLogQueue():
+    """
+    WRITES WHAT IS LEFT ON THE QUEUE AND STOPS THE THREAD STARTED BY startLogQueue
+    """
+    global logListener
+    if logListener == None:
+        return True
+    logQueue, listenerThread = logListener
+    logQueue.put(None)
+    listenerThread.join(30)
+    logListener = None
+    return not listenerThread.is_alive()
@@ -0,0 +1,86 @@
+class snapshotIndex:
+    """
+    snapshotIndex IS WHAT WE KNOW ABOUT A VM'S SNAPSHOT TREE, BUILT ONCE FROM ITS 'snapshot'
+    PROPERTY (A vim.vm.SnapshotInfo, OR None IF THE VM HAS NO SNAPSHOTS) SO THAT FINDING A
+    SNAPSHOT IS A DICTIONARY LOOKUP RATHER THAN A WALK OF THE TREE:
+        snapshotList    [(vim.vm.SnapshotTree, PATH)] IN THE ORDER THE OLD RECURSIVE WALK
+                        PRODUCED THEM (PARENTS BEFORE CHILDREN, SIBLINGS IN ORDER)
+        byName          NAME (STRIPPED) -> LIST OF SnapshotTrees, SINCE NAMES NEED NOT BE UNIQUE
+        byPath          'PARENT/CHILD/...' PATH -> SnapshotTree
+        byMoref         SNAPSHOT MOREF ID (E.G. '9-snapshot-3') -> SnapshotTree
+        parentOf        SNAPSHOT MOREF ID -> PARENT SnapshotTree (None FOR A ROOT)
+        pathOf          SNAPSHOT MOREF ID -> PATH
+        currentSnapshot THE SnapshotTree THE VM IS RUNNING FROM, OR None
+    THE WALK USES ITS OWN STACK, SO A LONG CHAIN OF SNAPSHOTS CANNOT HIT THE RECURSION LIMIT.
+    """
+    def __init__(self, snapshotInfo):
+        self.snapshotInfo =     snapshotInfo
+        self.snapshotList =     []
+        self.byName =           {}
+        self.byPath =           {}
+        self.byMoref =          {}
+        self.parentOf =         {}
+        self.pathOf =           {}
+        self.currentSnapshot =  None
+        rootList = getattr(snapshotInfo, 'rootSnapshotList', None) or []
+        currentId = morefId(getattr(snapshotInfo, 'currentSnapshot', None))
+        # (SnapshotTree, PARENT PATH, PARENT SnapshotTree), PUSHED IN REVERSE SO THEY POP IN ORDER
+        walkStack = [(i, '', None) for i in reversed(rootList)]
+        while len(walkStack) > 0:
+            snapshotTree, parentPath, parentTree = walkStack.pop()
+            if parentPath:
+                snapshotPath = parentPath + '/' + snapshotTree.name
+            else:
+                snapshotPath = snapshotTree.name
+            snapshotId = morefId(snapshotTree.snapshot)
+            self.snapshotList.append((snapshotTree, snapshotPath))
+            self.byName.setdefault(snapshotTree.name.strip(), []).append(snapshotTree)
+            self.byPath.setdefault(snapshotPath, snapshotTree)
+            self.byMoref[snapshotId] = snapshotTree
+            self.parentOf[snapshotId] = parentTree
+            self.pathOf[snapshotId] = snapshotPath
+            if currentId != None and snapshotId == currentId:
+                self.currentSnapshot = snapshotTree
+            for childTree in reversed(snapshotTree.childSnapshotList or []):
+                walkStack.append((childTree, snapshotPath, snapshotTree))
+
+    def __len__(self):
+        return len(self.snapshotList)
+
+    def isFor(self, snapshotInfo):
+        """
+        True IF THIS INDEX WAS BUILT FROM snapshotInfo ITSELF.  THE INVENTORY MIRROR HANDS BACK
+        THE SAME OBJECT UNTIL THE SERVER REPORTS A CHANGE, SO THIS IS HOW WE KNOW WE ARE CURRENT.
+        """
+        return snapshotInfo is self.snapshotInfo
+
+    def findByName(self, snapshotName, exact = False):
+        """
+        RETURNS THE FIRST SnapshotTree (IN snapshotList ORDER) NAMED snapshotName, OR None.
+        LEADING AND TRAILING WHITESPACE IS IGNORED UNLESS exact IS SET.
+        """
+        for snapshotTree in self.byName.get(snapshotName.strip(), []):
+            if not exact or snapshotTree.name == snapshotName:
+                return snapshotTree
+        return None
+
+    def findFirst(self, namePredicate):
+        for snapshotTree, snapshotPath in self.snapshotList:
+            if namePredicate(snapshotTree.name):
+                return snapshotTree
+        return None
+
+    def getParent(self, snapshotTree):
+        return self.parentOf.get(morefId(snapshotTree.snapshot))
+
+    def getChildren(self, snapshotTree):
+        return list(snapshotTree.childSnapshotList or [])
+
+    def getPath(self, snapshotTree):
+        return self.pathOf.get(morefId(snapshotTree.snapshot))
+
+
+def morefId(vmodlObject):
+    if vmodlObject == None:
+        return None
+    return getattr(vmodlObject, '_moId', None)
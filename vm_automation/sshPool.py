@@ -0,0 +1,165 @@
+from atexit import register
+
+import codecs
+import os
+import paramiko
+import threading
+import time
+
+# OpenSSH (AND THE ESXi sshd) ALLOW 10 SESSIONS PER CONNECTION BY DEFAULT; STAY UNDER THAT
+MAX_CHANNELS_PER_HOST = 8
+
+
+class sshPool:
+    """
+    sshPool KEEPS ONE AUTHENTICATED paramiko Transport PER HOST/PORT/USER AND RUNS EVERY COMMAND
+    ON ITS OWN CHANNEL OVER IT, SO ANY NUMBER OF SHELL STEPS (AND ANY NUMBER OF THREADS) SHARE
+    ONE LOGIN.  AT MOST maxChannelsPerHost CHANNELS ARE OPEN ON A TRANSPORT AT ONCE; THE REST
+    WAIT THEIR TURN.  paramiko SENDS A KEEPALIVE EVERY keepaliveInterval SECONDS SO IDLE
+    TRANSPORTS ARE NOT DROPPED, AND A TRANSPORT THAT DIED ANYWAY IS REPLACED ON NEXT USE.
+    HOST KEYS ARE CHECKED AGAINST ~/.ssh/known_hosts: A HOST THAT IS NOT THERE IS ACCEPTED (LIKE
+    THE AutoAddPolicy WE USED BEFORE), ONE WHOSE KEY CHANGED IS REFUSED.
+    LOGIN AND HOST KEY FAILURES ARE RAISED AS THE USUAL paramiko EXCEPTIONS (OR socket.error).
+    """
+    def __init__(self, maxChannelsPerHost = MAX_CHANNELS_PER_HOST, keepaliveInterval = 30, connectTimeout = 30):
+        self.maxChannelsPerHost =   maxChannelsPerHost
+        self.keepaliveInterval =    keepaliveInterval
+        self.connectTimeout =       connectTimeout
+        self.lock =                 threading.Lock()
+        self.transports =           {}
+        self.connectLocks =         {}
+        self.channelSlots =         {}
+        self.ownerPid =             os.getpid()
+        register(self.closeAll)
+
+    def getTransport(self, hostname, username, password, port = 22):
+        """
+        RETURNS A CONNECTED, AUTHENTICATED paramiko.Transport FOR hostname, LOGGING IN ONLY IF
+        WE DO NOT ALREADY HAVE A LIVE ONE
+        """
+        poolKey = (hostname, int(port), username, password)
+        with self.lock:
+            connectLock = self.connectLocks.setdefault(poolKey, threading.Lock())
+            self.channelSlots.setdefault(poolKey, threading.BoundedSemaphore(self.maxChannelsPerHost))
+        with connectLock:
+            transport = self.transports.get(poolKey)
+            if transport != None and transport.is_active():
+                return transport
+            if transport != None:
+                transport.close()
+            transport = self.__login(hostname, username, password, int(port))
+            with self.lock:
+                self.transports[poolKey] = transport
+            return transport
+
+    def runCommand(self, hostname, username, password, command, port = 22, timeout = None, callback = None):
+        """
+        RUNS command ON ITS OWN CHANNEL AND WAITS FOR IT TO EXIT.  callback(streamName, text),
+        IF GIVEN, GETS 'stdout' AND 'stderr' OUTPUT AS IT ARRIVES.  RETURNS
+        (exitCode, stdout, stderr); exitCode IS None IF timeout SECONDS WENT BY FIRST (THE
+        CHANNEL IS CLOSED, WHICH IS AS CLOSE AS SSH GETS TO KILLING THE COMMAND).
+        """
+        transport = self.getTransport(hostname, username, password, port)
+        channelSlot = self.channelSlots[(hostname, int(port), username, password)]
+        with channelSlot:
+            channel = transport.open_session()
+            try:
+                channel.exec_command(command)
+                return readChannel(channel, timeout, callback)
+            finally:
+                channel.close()
+
+    def openSftp(self, hostname, username, password, port = 22):
+        """
+        RETURNS A paramiko.SFTPClient ON THE POOLED TRANSPORT; close() IT WHEN YOU ARE DONE (THAT
+        CLOSES ONLY ITS CHANNEL)
+        """
+        return paramiko.SFTPClient.from_transport(self.getTransport(hostname, username, password, port))
+
+    def closeAll(self):
+        if os.getpid() != self.ownerPid:
+            return
+        with self.lock:
+            transportList = list(self.transports.values())
+            self.transports = {}
+        for transport in transportList:
+            try:
+                transport.close()
+            except Exception:
+                pass
+
+    def __login(self, hostname, username, password, port):
+        transport = paramiko.Transport((hostname, port))
+        try:
+            transport.start_client(timeout=self.connectTimeout)
+            checkHostKey(hostname, port, transport.get_remote_server_key())
+            transport.auth_password(username, password)
+        except Exception:
+            transport.close()
+            raise
+        transport.set_keepalive(self.keepaliveInterval)
+        return transport
+
+
+def checkHostKey(hostname, port, serverKey):
+    """
+    RAISES paramiko.BadHostKeyException IF ~/.ssh/known_hosts HAS A DIFFERENT KEY FOR hostname
+    """
+    try:
+        hostKeys = paramiko.util.load_host_keys(os.path.expanduser('~/.ssh/known_hosts'))
+    except IOError:
+        return
+    if port == 22:
+        hostEntry = hostname
+    else:
+        hostEntry = '[' + hostname + ']:' + str(port)
+    knownKey = hostKeys.lookup(hostEntry)
+    if knownKey == None or serverKey.get_name() not in knownKey:
+        return
+    if knownKey[serverKey.get_name()] != serverKey:
+        raise paramiko.BadHostKeyException(hostname, serverKey, knownKey[serverKey.get_name()])
+
+
+def readChannel(channel, timeout = None, callback = None):
+    """
+    DRAINS stdout AND stderr OF AN exec_command CHANNEL TOGETHER (SO A CHATTY stderr CANNOT STALL
+    stdout) UNTIL THE COMMAND EXITS OR timeout SECONDS PASS.  RETURNS (exitCode, stdout, stderr).
+    """
+    outputDict = {'stdout': [], 'stderr': []}
+    # A MULTI-BYTE CHARACTER CAN BE SPLIT ACROSS TWO READS, SO DECODE EACH STREAM INCREMENTALLY
+    decoderDict = dict((i, codecs.getincrementaldecoder('utf-8')('replace')) for i in outputDict)
+    deadline = None
+    if timeout != None:
+        deadline = time.time() + timeout
+    while True:
+        gotData = False
+        for streamName, readyFn, recvFn in [('stdout', channel.recv_ready, channel.recv),
+                                            ('stderr', channel.recv_stderr_ready, channel.recv_stderr)]:
+            if readyFn():
+                textData = decoderDict[streamName].decode(recvFn(32768))
+                gotData = True
+                outputDict[streamName].append(textData)
+                if callback != None:
+                    callback(streamName, textData)
+        if not gotData:
+            if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+            if deadline != None and time.time() > deadline:
+                return None, ''.join(outputDict['stdout']), ''.join(outputDict['stderr'])
+            time.sleep(0.05)
+    return channel.recv_exit_status(), ''.join(outputDict['stdout']), ''.join(outputDict['stderr'])
+
+
+# ONE POOL PER PROCESS, LIKE THE vSphere SESSION POOL
+defaultPool = None
+defaultPoolPid = None
+defaultPoolLock = threading.Lock()
+
+
+def getSshPool():
+    global defaultPool, defaultPoolPid
+    with defaultPoolLock:
+        if defaultPool == None or defaultPoolPid != os.getpid():
+            defaultPool = sshPool()
+            defaultPoolPid = os.getpid()
+        return defaultPool
@@ -0,0 +1,310 @@
+import threading
+import time
+
+
+class poolTemplate:
+    """
+    ONE GROUP OF INTERCHANGEABLE VMS IN A vmPool: THE VMS, THE SNAPSHOT THEY GO BACK TO AND HOW
+    MANY OF THEM WE TRY TO KEEP READY, PLUS THE NUMBERS BEHIND vmPool.getStats
+    """
+    def __init__(self, templateName, vmList, snapshotName, targetReady):
+        self.templateName =     templateName
+        self.vmList =           list(vmList)
+        self.snapshotName =     snapshotName
+        self.targetReady =      targetReady
+        self.readyList =        []
+        self.dirtyList =        []
+        self.leaseCount =       0
+        self.timeoutCount =     0
+        self.totalWait =        0.0
+        self.maxWait =          0.0
+        self.warmCount =        0
+        self.totalWarm =        0.0
+        self.failedWarms =      0
+
+
+class vmPool:
+    """
+    vmPool KEEPS targetReady VMS OF EACH TEMPLATE REVERTED, POWERED ON AND READY FOR GUEST
+    OPERATIONS SO A TEST RUN CAN lease() ONE AND START WORKING RIGHT AWAY INSTEAD OF WAITING A
+    MINUTE OR THREE FOR revertToSnapshotByName/powerOn/waitForVmToBoot.  WHEN THE TEST IS DONE,
+    release() HANDS THE VM BACK AND IT IS REVERTED AND WARMED AGAIN IN THE BACKGROUND.
+    A TEMPLATE IS JUST A LIST OF esxiVms THAT ARE INTERCHANGEABLE FOR YOUR PURPOSES AND THE
+    SNAPSHOT THEY ALL HAVE (None MEANS THEIR TESTING_BASE SNAPSHOT, LIKE revertToTestingBase).
+    WARMING IS DONE IN BATCHES WITH THE SERVER'S FLEET CALLS (snapshotMany, powerOnMany,
+    iterVmsReady), WITH AT MOST maxWarming VMS BEING WARMED AT ONCE.  A VM THAT FAILS TO WARM
+    WAITS retryDelay SECONDS BEFORE THE NEXT TRY, TWICE THAT AFTER THE SECOND FAILURE AND SO ON,
+    SO A SHORT OUTAGE DOES NOT USE UP ITS TRIES; ONE THAT FAILS maxWarmFailures TIMES IN A ROW
+    IS LEFT OUT OF THE POOL AS 'broken'.  lease() CHECKS THAT A READY VM IS STILL POWERED ON
+    WITH TOOLS RUNNING BEFORE HANDING IT OUT, AND SENDS IT BACK TO BE WARMED IF NOT.
+    """
+    def __init__(self, serverObject, maxWarming = 16, bootTimeout = 600, requireIp = True, maxWarmFailures = 3,
+                 retryDelay = 30):
+        self.server =           serverObject
+        self.maxWarming =       maxWarming
+        self.bootTimeout =      bootTimeout
+        self.requireIp =        requireIp
+        self.maxWarmFailures =  maxWarmFailures
+        self.retryDelay =       retryDelay
+        self.lock =             threading.Condition()
+        self.templates =        {}
+        self.vmStates =         {}
+        self.vmTemplates =      {}
+        self.warmFailures =     {}
+        # VM -> time.time() BEFORE WHICH WE DO NOT TRY TO WARM IT AGAIN AFTER A FAILURE
+        self.notBefore =        {}
+        self.warmingCount =     0
+        self.running =          False
+        self.managerThread =    None
+
+    def addTemplate(self, templateName, vmList, snapshotName = None, targetReady = 1):
+        """
+        ADDS (OR REPLACES THE SETTINGS OF) A TEMPLATE.  THE VMS START OUT 'cold'; THE POOL WARMS
+        targetReady OF THEM AND LEAVES THE REST ALONE UNTIL THEY ARE NEEDED.
+        """
+        with self.lock:
+            for vm in vmList:
+                if self.vmTemplates.get(vm, templateName) != templateName:
+                    self.server.logMsg("[ERROR]: " + vm.vmName + " IS ALREADY IN POOL TEMPLATE " + self.vmTemplates[vm])
+                    return False
+            template = self.templates.get(templateName)
+            if template == None:
+                template = poolTemplate(templateName, vmList, snapshotName, targetReady)
+                self.templates[templateName] = template
+            else:
+                template.snapshotName = snapshotName
+                template.targetReady = targetReady
+                template.vmList.extend([i for i in vmList if i not in template.vmList])
+            for vm in vmList:
+                self.vmTemplates[vm] = templateName
+                self.vmStates.setdefault(vm, 'cold')
+            self.lock.notify_all()
+        return True
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return True
+            self.running = True
+            self.managerThread = threading.Thread(target=self.__manage, name="vmPool")
+            self.managerThread.daemon = True
+            self.managerThread.start()
+        return True
+
+    def stop(self, timeout = 30):
+        """
+        STOPS WARMING NEW VMS; WARMING ALREADY UNDER WAY FINISHES ON ITS OWN.  THE VMS ARE LEFT
+        AS THEY ARE.
+        """
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+            managerThread = self.managerThread
+            self.managerThread = None
+        if managerThread != None:
+            managerThread.join(timeout)
+        return True
+
+    def lease(self, templateName, timeout = None):
+        """
+        RETURNS A READY esxiVm FROM templateName, WAITING UP TO timeout SECONDS (FOREVER IF None)
+        FOR ONE; RETURNS None IF NONE SHOWED UP IN TIME OR THERE IS NO SUCH TEMPLATE.
+        """
+        startTime = time.time()
+        while True:
+            with self.lock:
+                template = self.templates.get(templateName)
+                if template == None:
+                    self.server.logMsg("[ERROR]: NO POOL TEMPLATE NAMED " + str(templateName))
+                    return None
+                # ASKING FOR ONE IS A HINT THAT WE MAY BE SHORT; WAKE THE MANAGER
+                self.lock.notify_all()
+                while len(template.readyList) == 0:
+                    if timeout == None:
+                        remaining = 60
+                    else:
+                        remaining = startTime + timeout - time.time()
+                        if remaining <= 0:
+                            template.timeoutCount += 1
+                            self.server.logMsg("[WARNING]: NO " + templateName + " VM WAS READY WITHIN " + str(timeout) + " SECONDS")
+                            return None
+                    self.lock.wait(remaining)
+                vm = template.readyList.pop(0)
+                self.vmStates[vm] = 'leased'
+            # IT MAY HAVE SAT IN readyList FOR A WHILE; MAKE SURE NOBODY TURNED IT OFF OR BROKE TOOLS
+            if self.__isStillReady(vm):
+                break
+            self.server.logMsg("[WARNING]: " + vm.vmName + " IN POOL " + templateName + " IS NO LONGER READY; WARMING IT AGAIN")
+            with self.lock:
+                self.vmStates[vm] = 'dirty'
+                template.dirtyList.append(vm)
+                self.lock.notify_all()
+        with self.lock:
+            waitTime = time.time() - startTime
+            template.leaseCount += 1
+            template.totalWait += waitTime
+            template.maxWait = max(template.maxWait, waitTime)
+            self.lock.notify_all()
+        self.server.logMsg("LEASED " + vm.vmName + " FROM POOL " + templateName + " AFTER " + str(round(waitTime, 1)) + " SECONDS")
+        return vm
+
+    def release(self, vm, reset = True):
+        """
+        HANDS A LEASED VM BACK.  WITH reset, IT IS REVERTED AND WARMED AGAIN; WITHOUT IT, IT GOES
+        STRAIGHT BACK INTO THE READY LIST (ONLY DO THAT IF YOU DID NOT CHANGE ANYTHING ON IT).
+        """
+        with self.lock:
+            templateName = self.vmTemplates.get(vm)
+            if templateName == None or self.vmStates.get(vm) != 'leased':
+                self.server.logMsg("[WARNING]: " + vm.vmName + " WAS NOT LEASED FROM THIS POOL")
+                return False
+            template = self.templates[templateName]
+            if reset:
+                self.vmStates[vm] = 'dirty'
+                template.dirtyList.append(vm)
+            else:
+                self.vmStates[vm] = 'ready'
+                template.readyList.append(vm)
+            self.lock.notify_all()
+        self.server.logMsg("RELEASED " + vm.vmName + " TO POOL " + templateName)
+        return True
+
+    def depth(self, templateName):
+        """
+        HOW MANY VMS OF templateName ARE READY TO LEASE RIGHT NOW
+        """
+        with self.lock:
+            template = self.templates.get(templateName)
+            if template == None:
+                return 0
+            return len(template.readyList)
+
+    def getStats(self):
+        """
+        RETURNS {templateName: {...}} WITH HOW MANY VMS ARE IN EACH STATE ('ready', 'warming',
+        'leased', 'dirty', 'cold', 'broken'), THE TARGET, AND LEASE AND WARM-UP NUMBERS: leases,
+        timeouts, avgWait/maxWait (SECONDS A lease() WAITED), warms, avgWarm (SECONDS FROM
+        REVERT TO READY) AND failedWarms
+        """
+        statsDict = {}
+        with self.lock:
+            for templateName, template in self.templates.items():
+                templateStats = dict((i, 0) for i in ['ready', 'warming', 'leased', 'dirty', 'cold', 'broken'])
+                for vm in template.vmList:
+                    templateStats[self.vmStates[vm]] += 1
+                templateStats['target'] = template.targetReady
+                templateStats['leases'] = template.leaseCount
+                templateStats['timeouts'] = template.timeoutCount
+                templateStats['avgWait'] = template.totalWait / max(1, template.leaseCount)
+                templateStats['maxWait'] = template.maxWait
+                templateStats['warms'] = template.warmCount
+                templateStats['avgWarm'] = template.totalWarm / max(1, template.warmCount)
+                templateStats['failedWarms'] = template.failedWarms
+                statsDict[templateName] = templateStats
+        return statsDict
+
+    def __isStillReady(self, vm):
+        try:
+            return vm.isPoweredOn() and vm.checkTools() == 'TOOLS_READY'
+        except Exception as e:
+            self.server.logMsg("[WARNING]: UNABLE TO CHECK " + vm.vmName + ": " + str(e))
+            return False
+
+    def __pickWarmBatches(self):
+        """
+        DECIDES WHAT TO WARM NEXT: EVERY DIRTY VM WHOSE RETRY DELAY IS UP, PLUS ENOUGH COLD ONES
+        TO BRING EACH TEMPLATE UP TO ITS TARGET, WITHIN maxWarming.  CALLED WITH THE LOCK HELD.
+        RETURNS [(poolTemplate, [esxiVm])].
+        """
+        batchList = []
+        timeNow = time.time()
+        for template in self.templates.values():
+            room = self.maxWarming - self.warmingCount
+            if room <= 0:
+                break
+            warming = len([i for i in template.vmList if self.vmStates[i] == 'warming'])
+            warmList = [i for i in template.dirtyList if self.notBefore.get(i, 0) <= timeNow][:room]
+            shortBy = template.targetReady - len(template.readyList) - warming - len(warmList)
+            if shortBy > 0 and len(warmList) < room:
+                coldList = [i for i in template.vmList if self.vmStates[i] == 'cold']
+                warmList = warmList + coldList[:min(shortBy, room - len(warmList))]
+            if len(warmList) == 0:
+                continue
+            for vm in warmList:
+                if vm in template.dirtyList:
+                    template.dirtyList.remove(vm)
+                self.vmStates[vm] = 'warming'
+            self.warmingCount += len(warmList)
+            batchList.append((template, warmList))
+        return batchList
+
+    def __idleWait(self):
+        """
+        HOW LONG THE MANAGER CAN SLEEP WITH NOTHING TO DO: 5 SECONDS, OR LESS IF A FAILED VM IS
+        DUE FOR ANOTHER TRY BEFORE THEN.  CALLED WITH THE LOCK HELD.
+        """
+        waitTime = 5
+        timeNow = time.time()
+        for retryTime in self.notBefore.values():
+            if retryTime > timeNow:
+                waitTime = min(waitTime, retryTime - timeNow)
+        return max(0.05, waitTime)
+
+    def __manage(self):
+        while True:
+            with self.lock:
+                if not self.running:
+                    return
+                batchList = self.__pickWarmBatches()
+                if len(batchList) == 0:
+                    self.lock.wait(self.__idleWait())
+                    continue
+            for template, warmList in batchList:
+                warmThread = threading.Thread(target=self.__warmBatch, args=(template, warmList), name="vmPoolWarm")
+                warmThread.daemon = True
+                warmThread.start()
+
+    def __warmBatch(self, template, warmList):
+        startTime = time.time()
+        if template.snapshotName == None:
+            snapshotMatch = lambda name: 'testing_base' in name.lower()
+        else:
+            snapshotMatch = template.snapshotName
+        readyList = []
+        try:
+            revertResults = self.server.snapshotMany('revert', warmList, snapshotMatch)
+            revertedList = [i for i in warmList if revertResults.get(i)]
+            self.server.powerOnMany(revertedList)
+            for vm in self.server.iterVmsReady(revertedList, self.bootTimeout, self.requireIp):
+                readyList.append(vm)
+                self.__warmFinished(template, vm, True, time.time() - startTime)
+        except Exception as e:
+            self.server.logMsg("[ERROR]: WARMING POOL " + template.templateName + " FAILED: " + str(e))
+        for vm in warmList:
+            if vm not in readyList:
+                self.__warmFinished(template, vm, False, time.time() - startTime)
+
+    def __warmFinished(self, template, vm, succeeded, warmTime):
+        with self.lock:
+            self.warmingCount -= 1
+            if succeeded:
+                self.warmFailures[vm] = 0
+                self.notBefore.pop(vm, None)
+                self.vmStates[vm] = 'ready'
+                template.readyList.append(vm)
+                template.warmCount += 1
+                template.totalWarm += warmTime
+            else:
+                template.failedWarms += 1
+                self.warmFailures[vm] = self.warmFailures.get(vm, 0) + 1
+                if self.warmFailures[vm] >= self.maxWarmFailures:
+                    self.server.logMsg("[ERROR]: " + vm.vmName + " FAILED TO WARM " + str(self.warmFailures[vm]) + " TIMES; DROPPING IT FROM POOL " + template.templateName)
+                    self.vmStates[vm] = 'broken'
+                    self.notBefore.pop(vm, None)
+                else:
+                    retryDelay = self.retryDelay * (2 ** (self.warmFailures[vm] - 1))
+                    self.server.logMsg("[WARNING]: " + vm.vmName + " DID NOT WARM UP; WILL TRY AGAIN IN " + str(retryDelay) + " SECONDS")
+                    self.notBefore[vm] = time.time() + retryDelay
+                    self.vmStates[vm] = 'dirty'
+                    template.dirtyList.append(vm)
+            self.lock.notify_all()